@@ -0,0 +1,291 @@
+"""
+バックテスト
+
+screened_history に記録された指標スナップショットに対して、候補の条件セットで
+全日付・全銘柄をまとめて再判定する（Yahooへのアクセスなし）。
+日付 × 銘柄 の2次元配列に展開し、条件ごとに1回の配列演算で判定する。
+記録のない日は直前の記録を引き継ぐ（BACKTEST_FFILL_MAX_DAYS日まで。
+それより古い記録しかない銘柄は上場廃止・監視対象外としてユニバースから外す）。
+
+判定は指標値のみに基づく（取得時の review_reasons は履歴に残らないため、
+欠損の有無・stale で REVIEW を判定する）。
+"""
+import json
+import pickle
+from pathlib import Path
+from typing import Any
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import SCREENING_CONDITIONS, HISTORY_CACHE_PATH, BACKTEST_FFILL_MAX_DAYS
+from db import get_history
+from screener import compile_conditions, evaluate_numeric
+
+# screened_historyから読み込むカラム
+HISTORY_COLUMNS = [
+    "company_code", "snapshot_date", "status", "data_status",
+    "market_cap", "stock_price", "listing_date",
+    "tk_deviation_revenue", "tk_deviation_op", "equity_ratio",
+    "revenue_growth_2y_1y", "revenue_growth_1y_cy", "revenue_growth_cy_ny",
+    "operating_margin", "op_growth_2y_1y", "op_growth_1y_cy", "op_growth_cy_ny",
+    "operating_cf", "free_cf", "roa", "per_forward", "pbr", "dividend_yield",
+]
+
+
+def load_conditions(path: str | None) -> dict:
+    """
+    候補の条件セットを読み込み
+
+    JSONファイルの内容を SCREENING_CONDITIONS に上書きする。
+    値が null の項目は条件から外す。
+
+    例: {"roa": {"op": ">", "value": 6.0, "name": "ROA(前期)(%)"}, "pbr": null}
+    """
+    conditions = {field: dict(cond) for field, cond in SCREENING_CONDITIONS.items()}
+    if not path:
+        return conditions
+
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    for field, cond in overrides.items():
+        if cond is None:
+            conditions.pop(field, None)
+        else:
+            conditions[field] = {**conditions.get(field, {"name": field}), **cond}
+    return conditions
+
+
+def load_history(since: str | None = None, until: str | None = None) -> pd.DataFrame:
+    """
+    スクリーニング履歴を読み込み
+
+    取得済みの履歴はローカルに保存し、次回は最終記録日以降のみ取得する。
+    """
+    cached = _read_local()
+    if cached is not None and not cached.empty:
+        last_date = str(cached["snapshot_date"].max())
+        # 最終日は同日中に上書きされている可能性があるため取り直す
+        fresh = pd.DataFrame(get_history(", ".join(HISTORY_COLUMNS), since=last_date))
+        df = pd.concat([cached[cached["snapshot_date"] < last_date], fresh], ignore_index=True)
+    else:
+        df = pd.DataFrame(get_history(", ".join(HISTORY_COLUMNS)))
+
+    if df.empty:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    df = df.drop_duplicates(["company_code", "snapshot_date"], keep="last")
+    _write_local(df)
+
+    if since:
+        df = df[df["snapshot_date"] >= since]
+    if until:
+        df = df[df["snapshot_date"] <= until]
+    return df.reset_index(drop=True)
+
+
+def build_panel(
+    df: pd.DataFrame,
+    fields: list[str],
+    max_days: int = BACKTEST_FFILL_MAX_DAYS,
+) -> dict[str, Any]:
+    """
+    履歴を 日付 × 銘柄 の2次元配列に展開（記録のない日はmax_days日まで直前の値を引き継ぐ）
+
+    Returns:
+        dates, codes, known（記録あり）, stale, values（フィールド -> 2次元配列）
+    """
+    date_idx, dates = pd.factorize(df["snapshot_date"], sort=True)
+    code_idx, codes = pd.factorize(df["company_code"], sort=True)
+    n_dates, n_codes = len(dates), len(codes)
+
+    present = np.zeros((n_dates, n_codes), dtype=bool)
+    present[date_idx, code_idx] = True
+    # 各セルについて直近で記録のある日付の位置（なければ-1）
+    last = np.where(present, np.arange(n_dates)[:, None], -1)
+    np.maximum.accumulate(last, axis=0, out=last)
+    # 直近の記録がmax_days日より古ければ引き継がない（上場廃止・監視対象外）
+    days = pd.to_datetime(dates).to_numpy(dtype="datetime64[D]").astype(np.int64)
+    known = (last >= 0) & (days[:, None] - days[np.maximum(last, 0)] <= max_days)
+    rows = np.where(known, last, 0)
+    cols = np.broadcast_to(np.arange(n_codes), (n_dates, n_codes))
+
+    def expand(values: np.ndarray, fill: Any) -> np.ndarray:
+        matrix = np.full((n_dates, n_codes), fill, dtype=values.dtype)
+        matrix[date_idx, code_idx] = values
+        return matrix[rows, cols]
+
+    panel_values = {}
+    for field in fields:
+        if field not in df.columns:
+            continue
+        if field == "listing_date":
+            column = pd.to_datetime(df[field], errors="coerce").to_numpy(dtype="datetime64[D]")
+            panel_values[field] = expand(column, np.datetime64("NaT", "D"))
+        else:
+            column = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=float)
+            panel_values[field] = expand(column, np.nan)
+
+    stale = expand((df["data_status"] == "stale").to_numpy(dtype=bool), False) & known
+
+    return {
+        "dates": [str(d) for d in dates],
+        "codes": list(codes),
+        "known": known,
+        "stale": stale,
+        "values": panel_values,
+    }
+
+
+def judge_panel(panel: dict[str, Any], conditions: dict) -> dict[str, Any]:
+    """
+    全日付・全銘柄を一括判定
+
+    Returns:
+        pass / fail / review（日付 × 銘柄のブール配列）と条件ごとの集計
+    """
+    known = panel["known"]
+    active = known & ~panel["stale"]
+    has_missing = np.zeros(known.shape, dtype=bool)
+    fail_count = np.zeros(known.shape, dtype=np.int16)
+    failed_by_field = {}
+
+    for cond in compile_conditions(conditions):
+        values = panel["values"].get(cond["field"])
+        if values is None:
+            logger.warning(f"履歴にない項目のため欠損扱い: {cond['field']}")
+            values = np.full(known.shape, np.datetime64("NaT", "D") if cond["is_date"] else np.nan)
+        missing, failed = evaluate_numeric(cond, values)
+        missing &= active
+        failed &= active
+        has_missing |= missing
+        fail_count += failed
+        failed_by_field[cond["field"]] = (cond, failed, active & ~missing)
+
+    # ステータス決定（優先順位: REVIEW > FAIL > PASS）
+    passed = active & ~has_missing & (fail_count == 0)
+    failed_status = active & ~has_missing & (fail_count > 0)
+    review = known & ~passed & ~failed_status
+
+    kill_rates = []
+    for field, (cond, failed, evaluated) in failed_by_field.items():
+        n_evaluated = int(evaluated.sum())
+        n_failed = int(failed.sum())
+        kill_rates.append({
+            "field": field,
+            "name": cond["name"],
+            "condition": cond["condition"],
+            "evaluated": n_evaluated,
+            "failed": n_failed,
+            "kill_rate": round(n_failed / n_evaluated, 4) if n_evaluated else None,
+            # この条件だけで落ちた件数（他の条件は全て満たす）
+            "sole_failed": int((failed & failed_status & (fail_count == 1)).sum()),
+        })
+
+    return {"pass": passed, "fail": failed_status, "review": review, "kill_rates": kill_rates}
+
+
+def run_backtest(
+    conditions: dict | None = None,
+    since: str | None = None,
+    until: str | None = None,
+) -> dict[str, Any]:
+    """
+    候補条件セットで履歴を再判定し、現行条件と比較
+
+    Args:
+        conditions: 候補条件（省略時はSCREENING_CONDITIONS）
+        since: 開始日（YYYY-MM-DD）
+        until: 終了日（YYYY-MM-DD）
+
+    Returns:
+        日付ごとのPASS/FAIL/REVIEW件数・入れ替わり、条件ごとの脱落率
+    """
+    conditions = conditions if conditions is not None else SCREENING_CONDITIONS
+    df = load_history(since, until)
+    if df.empty:
+        logger.warning("スクリーニング履歴がありません")
+        return {"dates": [], "kill_rates": []}
+
+    fields = sorted(set(conditions) | set(SCREENING_CONDITIONS))
+    panel = build_panel(df, fields)
+    result = judge_panel(panel, conditions)
+    baseline = judge_panel(panel, SCREENING_CONDITIONS)
+
+    passed = result["pass"]
+    pass_counts = passed.sum(axis=1)
+    entered = np.concatenate([[0], (passed[1:] & ~passed[:-1]).sum(axis=1)])
+    exited = np.concatenate([[0], (passed[:-1] & ~passed[1:]).sum(axis=1)])
+    previous = np.concatenate([[0], pass_counts[:-1]])
+
+    per_date = []
+    for i, snapshot_date in enumerate(panel["dates"]):
+        denominator = int(previous[i] + pass_counts[i])
+        per_date.append({
+            "date": snapshot_date,
+            "universe": int(panel["known"][i].sum()),
+            "PASS": int(pass_counts[i]),
+            "FAIL": int(result["fail"][i].sum()),
+            "REVIEW": int(result["review"][i].sum()),
+            "baseline_PASS": int(baseline["pass"][i].sum()),
+            "entered": int(entered[i]),
+            "exited": int(exited[i]),
+            # 入れ替わり率 = (新規 + 脱落) / (前回PASS + 今回PASS)
+            "turnover": round((entered[i] + exited[i]) / denominator, 4) if i and denominator else None,
+        })
+
+    turnovers = [d["turnover"] for d in per_date if d["turnover"] is not None]
+    return {
+        "dates": per_date,
+        "kill_rates": sorted(result["kill_rates"], key=lambda k: k["kill_rate"] or 0, reverse=True),
+        "companies": len(panel["codes"]),
+        "average_pass": round(float(pass_counts.mean()), 1),
+        "average_turnover": round(sum(turnovers) / len(turnovers), 4) if turnovers else None,
+    }
+
+
+def log_report(report: dict[str, Any]) -> None:
+    """バックテスト結果をログ出力"""
+    if not report["dates"]:
+        return
+
+    logger.info(f"対象: {len(report['dates'])}日 × {report['companies']}銘柄")
+    for d in report["dates"]:
+        turnover = f"{d['turnover'] * 100:.1f}%" if d["turnover"] is not None else "-"
+        logger.info(
+            f"{d['date']}: PASS={d['PASS']} (現行 {d['baseline_PASS']}), FAIL={d['FAIL']}, REVIEW={d['REVIEW']}, "
+            f"新規 {d['entered']}, 脱落 {d['exited']}, 入替率 {turnover}"
+        )
+
+    average_turnover = report["average_turnover"]
+    logger.info(
+        f"平均PASS: {report['average_pass']}, 平均入替率: "
+        + (f"{average_turnover * 100:.1f}%" if average_turnover is not None else "-")
+    )
+    logger.info("条件別の脱落率:")
+    for k in report["kill_rates"]:
+        rate = f"{k['kill_rate'] * 100:.1f}%" if k["kill_rate"] is not None else "-"
+        logger.info(f"  {k['name']} {k['condition']}: {rate} ({k['failed']}/{k['evaluated']}), 単独脱落 {k['sole_failed']}")
+
+
+def _read_local() -> pd.DataFrame | None:
+    """履歴のローカルキャッシュを読み込み"""
+    path = Path(HISTORY_CACHE_PATH)
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"履歴キャッシュ読み込み失敗: {e}")
+        return None
+
+
+def _write_local(df: pd.DataFrame) -> None:
+    """履歴のローカルキャッシュを保存"""
+    path = Path(HISTORY_CACHE_PATH)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logger.warning(f"履歴キャッシュ保存失敗: {e}")
@@ -0,0 +1 @@
+"""オフラインベンチマーク（記録済みフィクスチャ + ローカルのSupabase代替）"""
@@ -0,0 +1,123 @@
+"""
+オフラインベンチマーク
+
+使用方法（batch/ で実行）:
+    python -m benchmark                          # 100/1,000/4,000/40,000銘柄で全シナリオを計測
+    python -m benchmark --scales 100,1000 --scenarios fetch_parse,judge_all
+    python -m benchmark --update-baseline        # 計測結果をベースラインとして保存
+    python -m benchmark record --codes 7203,6758 # 実際のYahooレスポンスをフィクスチャに記録
+    python -m benchmark record --watched 300     # 登録銘柄の先頭300件を記録
+    python -m benchmark importtime               # py/stock.py の読み込み時間（-X importtime）
+
+ベースライン（BENCHMARK_BASELINE_PATH）がなければ計測結果をそのまま保存する。
+ベースラインより BENCHMARK_TOLERANCE の割合以上遅いシナリオがあれば終了コード1で終了する。
+"""
+import argparse
+import sys
+from loguru import logger
+from config import BENCHMARK_FIXTURES_PATH, BENCHMARK_BASELINE_PATH, BENCHMARK_TOLERANCE
+from cache import disable_cache
+from .fixtures import load_fixtures, record_fixtures
+from .importtime import measure_import_times
+from .runner import (
+    DEFAULT_SCALES,
+    SCENARIOS,
+    run_benchmarks,
+    compare_baseline,
+    read_baseline,
+    write_baseline,
+    write_results,
+)
+
+
+def run(args: argparse.Namespace) -> int:
+    """計測してベースラインと比較"""
+    _setup_logger()
+    disable_cache()
+
+    fixtures = load_fixtures(args.fixtures)
+    scales = [int(s) for s in args.scales.split(",")] if args.scales else DEFAULT_SCALES
+    scenarios = args.scenarios.split(",") if args.scenarios else None
+    results = run_benchmarks(fixtures, scales, scenarios, args.repeat)
+    return _check_baseline(args, results)
+
+
+def importtime(args: argparse.Namespace) -> int:
+    """py/stock.py の読み込み時間を計測してベースラインと比較"""
+    _setup_logger()
+    results = {"stock_api_import": measure_import_times(args.repeat)}
+    if not results["stock_api_import"]:
+        logger.error("読み込み時間を計測できませんでした（py/requirements.txt の依存を確認）")
+        return 1
+    return _check_baseline(args, results)
+
+
+def _setup_logger() -> None:
+    """計測中のバッチ本体のログは警告以上のみ"""
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING", filter=lambda record: not record["name"].startswith("benchmark"))
+    logger.add(sys.stderr, level="INFO", filter=lambda record: record["name"].startswith("benchmark"))
+
+
+def _check_baseline(args: argparse.Namespace, results: dict[str, dict[str, float]]) -> int:
+    """結果を保存し、ベースラインと比較（退行があれば1）"""
+    if args.output:
+        write_results(args.output, results)
+
+    baseline = read_baseline(args.baseline)
+    if baseline is None or args.update_baseline:
+        write_baseline(args.baseline, results)
+        logger.info(f"ベースライン保存: {args.baseline}")
+        return 0
+
+    regressions = compare_baseline(results, baseline, args.tolerance)
+    for r in regressions:
+        logger.error(
+            f"退行: {r['scenario']} [{r['size']}]: {r['baseline']:.3f}秒 -> {r['current']:.3f}秒 ({r['ratio']}倍)"
+        )
+    if regressions:
+        return 1
+    logger.info(f"退行なし（許容 +{args.tolerance * 100:.0f}%）")
+    return 0
+
+
+def record(args: argparse.Namespace) -> int:
+    """実際のYahooレスポンスを記録"""
+    if args.codes:
+        codes = [c.strip() for c in args.codes.split(",") if c.strip()]
+    else:
+        from db import get_watched_tickers
+        codes = get_watched_tickers()[:args.watched]
+    if not codes:
+        logger.error("記録対象の銘柄がありません")
+        return 1
+    return 0 if record_fixtures(codes, args.fixtures) else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="オフラインベンチマーク")
+    parser.add_argument("command", nargs="?", choices=["run", "record", "importtime"], default="run",
+                        help="run=計測（既定）, record=フィクスチャ記録, importtime=py/stock.pyの読み込み時間")
+    parser.add_argument("--fixtures", default=BENCHMARK_FIXTURES_PATH, metavar="PATH",
+                        help="フィクスチャ（なければ合成データで計測）")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_PATH, metavar="PATH", help="ベースラインJSON")
+    parser.add_argument("--scales", metavar="N,N,...", help="計測規模（銘柄数、カンマ区切り）")
+    parser.add_argument("--scenarios", metavar="NAME,...", help=f"計測するシナリオ: {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="各シナリオの実行回数（最小値を採用）")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE,
+                        help="退行とみなす割合（0.2 = 20%%遅い）")
+    parser.add_argument("--update-baseline", action="store_true", help="計測結果でベースラインを更新")
+    parser.add_argument("--output", metavar="PATH", help="計測結果をJSONで保存")
+    parser.add_argument("--codes", metavar="CODE,...", help="record の対象銘柄")
+    parser.add_argument("--watched", type=int, default=300, metavar="N", help="record で登録銘柄の先頭N件を記録")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        return record(args)
+    if args.command == "importtime":
+        return importtime(args)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
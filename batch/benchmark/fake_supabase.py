@@ -0,0 +1,296 @@
+"""
+Supabase REST API のローカル代替
+
+db.py が使う範囲（table().select/eq/in_/range/upsert/update/delete、rpc）を
+メモリ上のテーブルで再現する。リクエスト・レスポンスはJSONに往復変換し、
+送受信のシリアライズ負荷とバイト数を実運用に近づける。
+"""
+import json
+import time
+from datetime import date, datetime, timezone
+from typing import Any
+
+# テーブルごとの主キー（upsertの衝突判定）
+PRIMARY_KEYS = {
+    "screened_latest": ("company_code",),
+    "watched_tickers": ("company_code",),
+    "shikiho_estimates": ("company_code",),
+    "screened_history": ("company_code", "snapshot_date"),
+    "screening_condition_bits": ("bit",),
+    "batch_runs": ("run_id",),
+    "batch_run_items": ("run_id", "company_code"),
+}
+
+
+class FakeResponse:
+    """postgrestのAPIResponse相当"""
+
+    def __init__(self, data: Any, count: int | None = None):
+        self.data = data
+        self.count = count
+
+
+class FakeSupabase:
+    """
+    メモリ上のSupabaseクライアント
+
+    使用例:
+        fake = FakeSupabase()
+        db._client = fake  # get_client() がこれを返す
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.tables: dict[str, dict[tuple, dict]] = {}
+        self.latency = latency
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def table(self, name: str) -> "FakeQuery":
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict[str, Any]) -> "FakeRpc":
+        return FakeRpc(self, name, params)
+
+    def rows(self, table: str) -> dict[tuple, dict]:
+        return self.tables.setdefault(table, {})
+
+    def seed(self, table: str, rows: list[dict]) -> None:
+        """テーブルに行を直接投入（計測対象外の準備用）"""
+        store = self.rows(table)
+        for row in rows:
+            store[_key(table, row)] = dict(row)
+
+    def reset_stats(self) -> None:
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def _send(self, payload: Any) -> Any:
+        """リクエストをJSONに往復変換（1リクエストとして計上）"""
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(payload, default=str)
+        self.bytes_sent += len(body)
+        return json.loads(body)
+
+    def _receive(self, data: Any) -> Any:
+        """レスポンスをJSONに往復変換"""
+        body = json.dumps(data, default=str)
+        self.bytes_received += len(body)
+        return json.loads(body)
+
+
+class FakeQuery:
+    """table() 以降のクエリビルダー"""
+
+    def __init__(self, client: FakeSupabase, table: str):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.columns: list[str] | None = None
+        self.payload: Any = None
+        self.filters: list[tuple[str, str, Any]] = []
+        self.order_by: tuple[str, bool] | None = None
+        self.offset = 0
+        self.limit_count: int | None = None
+        self.single_row = False
+        self.count_mode: str | None = None
+
+    def select(self, columns: str = "*", count: str | None = None) -> "FakeQuery":
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count_mode = count
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str | None = None, **kwargs: Any) -> "FakeQuery":
+        self.action = "upsert"
+        self.payload = rows
+        return self
+
+    def insert(self, rows: Any, **kwargs: Any) -> "FakeQuery":
+        self.action = "insert"
+        self.payload = rows
+        return self
+
+    def update(self, values: dict) -> "FakeQuery":
+        self.action = "update"
+        self.payload = values
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self.action = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(("eq", column, value))
+        return self
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(("neq", column, value))
+        return self
+
+    def in_(self, column: str, values: list) -> "FakeQuery":
+        self.filters.append(("in", column, set(values)))
+        return self
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(("gte", column, value))
+        return self
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(("lte", column, value))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self.order_by = (column, desc)
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self.offset = start
+        self.limit_count = end - start + 1
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self.limit_count = count
+        return self
+
+    def single(self) -> "FakeQuery":
+        self.single_row = True
+        return self
+
+    def execute(self) -> FakeResponse:
+        client = self.client
+        store = client.rows(self.table)
+        payload = client._send(self.payload)
+
+        if self.action in ("upsert", "insert"):
+            rows = payload if isinstance(payload, list) else [payload]
+            written = []
+            for row in rows:
+                key = _key(self.table, row)
+                merged = {**store.get(key, {}), **row}
+                store[key] = merged
+                written.append(merged)
+            return FakeResponse(client._receive(written))
+
+        matched = [row for row in store.values() if self._matches(row)]
+
+        if self.action == "update":
+            for row in matched:
+                row.update(payload)
+            return FakeResponse(client._receive(matched))
+
+        if self.action == "delete":
+            for row in matched:
+                del store[_key(self.table, row)]
+            return FakeResponse(client._receive(matched))
+
+        if self.order_by:
+            column, desc = self.order_by
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        total = len(matched)
+        end = None if self.limit_count is None else self.offset + self.limit_count
+        matched = matched[self.offset:end]
+        if self.columns is not None:
+            matched = [{c: row.get(c) for c in self.columns} for row in matched]
+
+        if self.single_row:
+            if len(matched) != 1:
+                raise ValueError(f"single(): {len(matched)}行")
+            return FakeResponse(client._receive(matched[0]))
+        return FakeResponse(client._receive(matched), total if self.count_mode else None)
+
+    def _matches(self, row: dict) -> bool:
+        for op, column, value in self.filters:
+            current = row.get(column)
+            if op == "eq" and current != value:
+                return False
+            if op == "neq" and current == value:
+                return False
+            if op == "in" and current not in value:
+                return False
+            if op == "gte" and (current is None or str(current) < str(value)):
+                return False
+            if op == "lte" and (current is None or str(current) > str(value)):
+                return False
+        return True
+
+
+class FakeRpc:
+    """rpc() の呼び出し（schema.sqlの関数のうちバッチが使うもの）"""
+
+    def __init__(self, client: FakeSupabase, name: str, params: dict[str, Any]):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        client = self.client
+        params = client._send(self.params)
+        handler = getattr(self, f"_{self.name}", None)
+        if handler is None:
+            raise ValueError(f"未対応のRPC: {self.name}")
+        return FakeResponse(client._receive(handler(params)))
+
+    def _update_prices_bulk(self, params: dict) -> list[dict]:
+        store = self.client.rows("screened_latest")
+        updated = []
+        for row in params["p_rows"]:
+            current = store.get((row["company_code"],))
+            if current is None:
+                continue
+            current.update(row)
+            updated.append({"company_code": row["company_code"]})
+        return updated
+
+    def _mark_stale_bulk(self, params: dict) -> int:
+        store = self.client.rows("screened_latest")
+        all_bits = (1 << len(self.client.rows("screening_condition_bits"))) - 1 or None
+        changed = 0
+        for code in params["p_codes"]:
+            current = store.get((code,))
+            if current is None:
+                continue
+            reasons = current.get("review_reasons") or []
+            if not any(r.get("code") == params["p_reason"] for r in reasons):
+                reasons.append({"code": params["p_reason"], "message": params["p_reason"]})
+            current.update({
+                "data_status": "stale",
+                "status": "REVIEW",
+                "review_reasons": reasons,
+                "row_hash": None,
+                "fail_mask": 0,
+                "missing_mask": all_bits,
+            })
+            changed += 1
+        return changed
+
+    def _touch_verified_bulk(self, params: dict) -> int:
+        store = self.client.rows("screened_latest")
+        now = datetime.now(timezone.utc).isoformat()
+        touched = 0
+        for code in params["p_codes"]:
+            current = store.get((code,))
+            if current is None:
+                continue
+            current["verified_at"] = now
+            touched += 1
+        return touched
+
+    def _append_screened_history(self, params: dict) -> int:
+        latest = self.client.rows("screened_latest")
+        history = self.client.rows("screened_history")
+        snapshot_date = params.get("p_date") or date.today().isoformat()
+        appended = 0
+        for code in params["p_codes"]:
+            current = latest.get((code,))
+            if current is None:
+                continue
+            history[(code, snapshot_date)] = {**current, "snapshot_date": snapshot_date}
+            appended += 1
+        return appended
+
+
+def _key(table: str, row: dict) -> tuple:
+    return tuple(row.get(column) for column in PRIMARY_KEYS.get(table, ("id",)))
@@ -0,0 +1,181 @@
+"""
+ベンチマーク用フィクスチャ
+
+実際のYahooレスポンス（info・財務諸表・earnings_trend等、fetch_endpointの戻り値）を
+銘柄ごとに記録して gzip+pickle で保存する。記録がない場合は同じ形の合成データを生成する。
+計測規模（100〜40,000銘柄）に合わせて、記録済みの銘柄を繰り返して割り当てる。
+"""
+import gzip
+import pickle
+import random
+import sys
+from pathlib import Path
+from typing import Any
+import pandas as pd
+from loguru import logger
+sys.path.append("..")
+from fetcher.financial import ENDPOINTS, fetch_endpoint
+
+# 合成データのセクター
+SYNTHETIC_SECTORS = ["Technology", "Industrials", "Consumer Cyclical", "Healthcare", "Financial Services"]
+
+
+def record_fixtures(company_codes: list[str], path: str | Path) -> int:
+    """
+    実際のYahooレスポンスを記録（レスポンスキャッシュは使わない）
+
+    Returns:
+        記録できた銘柄数
+    """
+    import yfinance as yf
+    from yahooquery import Ticker
+    from db import get_shikiho_estimates
+
+    try:
+        shikiho = get_shikiho_estimates()
+    except Exception as e:
+        logger.warning(f"四季報予想の取得失敗、四季報なしで記録: {e}")
+        shikiho = {}
+
+    fixtures = {}
+    for i, code in enumerate(company_codes, 1):
+        symbol = f"{code}.T"
+        yf_ticker = yf.Ticker(symbol)
+        yq_ticker = Ticker(symbol)
+        try:
+            fixtures[code] = {
+                endpoint: fetch_endpoint(endpoint, yf_ticker, yq_ticker, symbol)
+                for endpoint in ENDPOINTS
+            }
+            if code in shikiho:
+                fixtures[code]["shikiho"] = shikiho[code]
+        except Exception as e:
+            logger.warning(f"フィクスチャ記録失敗 {code}: {e}")
+        if i % 50 == 0:
+            logger.info(f"フィクスチャ記録: {i}/{len(company_codes)}")
+
+    save_fixtures(fixtures, path)
+    logger.info(f"フィクスチャ保存: {len(fixtures)}銘柄 -> {path}")
+    return len(fixtures)
+
+
+def save_fixtures(fixtures: dict[str, dict[str, Any]], path: str | Path) -> None:
+    """フィクスチャを保存"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "wb") as f:
+        pickle.dump(fixtures, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_fixtures(path: str | Path, synthetic_count: int = 300) -> dict[str, dict[str, Any]]:
+    """
+    フィクスチャを読み込み（ファイルがなければ合成データ）
+
+    Returns:
+        証券コード -> エンドポイント名 -> 生データ（"shikiho" は四季報予想の行）
+    """
+    path = Path(path)
+    if path.exists():
+        with gzip.open(path, "rb") as f:
+            fixtures = pickle.load(f)
+        logger.info(f"フィクスチャ読み込み: {len(fixtures)}銘柄 ({path})")
+        return fixtures
+
+    logger.warning(f"フィクスチャがないため合成データを使用: {path}")
+    return synthetic_fixtures(synthetic_count)
+
+
+def synthetic_fixtures(count: int, seed: int = 0) -> dict[str, dict[str, Any]]:
+    """
+    fetch_endpointの戻り値と同じ形の合成データを生成
+
+    約7割の銘柄に四季報予想を付け、一部の銘柄は予想・キャッシュフローを欠けさせて
+    PASS/FAIL/REVIEWの各経路を通るようにする。
+    """
+    rng = random.Random(seed)
+    periods = pd.to_datetime(["2024-03-31", "2023-03-31", "2022-03-31", "2021-03-31"])
+    fixtures = {}
+
+    for i in range(count):
+        code = str(1300 + i)
+        revenue = rng.uniform(50, 5000) * 1e8
+        growth = [rng.uniform(-0.1, 0.3) for _ in range(5)]
+        revenues = [revenue]
+        for g in growth[:3]:
+            revenues.append(revenues[-1] / (1 + g))
+        margin = rng.uniform(-0.05, 0.25)
+        net_margin = margin * rng.uniform(0.4, 0.8)
+        total_assets = revenue * rng.uniform(0.6, 2.5)
+        price = rng.uniform(300, 15000)
+        shares = rng.uniform(1e7, 5e8)
+
+        info = {
+            "longName": f"Synthetic {code} Co., Ltd.",
+            "sector": rng.choice(SYNTHETIC_SECTORS),
+            "firstTradeDateEpochUtc": rng.randint(0, 1_700_000_000),
+            "marketCap": price * shares,
+            "currentPrice": price,
+            "sharesOutstanding": shares,
+            "forwardPE": rng.uniform(5, 80) if rng.random() > 0.05 else None,
+            "priceToBook": rng.uniform(0.3, 8),
+            "dividendYield": rng.uniform(0, 0.05) if rng.random() > 0.2 else None,
+            "earningsTimestamp": 1_700_000_000 + rng.randint(0, 30_000_000),
+        }
+        financials = pd.DataFrame(
+            [revenues, [r * margin for r in revenues], [r * net_margin for r in revenues]],
+            index=["Total Revenue", "Operating Income", "Net Income"],
+            columns=periods,
+        )
+        balance = pd.DataFrame(
+            [[total_assets * (1 - 0.05 * k) for k in range(4)],
+             [total_assets * rng.uniform(0.2, 0.7) * (1 - 0.05 * k) for k in range(4)]],
+            index=["Total Assets", "Stockholders Equity"],
+            columns=periods,
+        )
+        operating_cf = revenue * rng.uniform(-0.05, 0.2)
+        cashflow = pd.DataFrame(
+            [[operating_cf] * 4, [-operating_cf * rng.uniform(0.2, 1.5)] * 4],
+            index=["Operating Cash Flow", "Investing Cash Flow"],
+            columns=periods,
+        )
+        if rng.random() < 0.05:
+            cashflow = pd.DataFrame()
+
+        trend = []
+        if rng.random() > 0.1:
+            revenue_cy = revenue * (1 + growth[3])
+            trend = [
+                {"period": "0y", "revenueEstimate": {"avg": revenue_cy},
+                 "earningsEstimate": {"avg": revenue_cy * net_margin}},
+                {"period": "+1y", "revenueEstimate": {"avg": revenue_cy * (1 + growth[4])},
+                 "earningsEstimate": {"avg": revenue_cy * (1 + growth[4]) * net_margin}},
+            ]
+
+        fixtures[code] = {
+            "info": info,
+            "financials": financials,
+            "balance_sheet": balance,
+            "cashflow": cashflow,
+            "earnings_trend": {"trend": trend, "maxAge": 1},
+            "earning_history": {},
+        }
+        if trend and rng.random() < 0.7:
+            deviation = [1 + rng.uniform(-0.1, 0.1) for _ in range(2)]
+            fixtures[code]["shikiho"] = {
+                "company_code": code,
+                "shikiho_revenue": revenue_cy / 1e8 * deviation[0],
+                "shikiho_op": revenue_cy * margin / 1e8 * deviation[1],
+            }
+    return fixtures
+
+
+def scale_fixtures(fixtures: dict[str, dict[str, Any]], size: int) -> dict[str, dict[str, Any]]:
+    """
+    記録済みの銘柄を繰り返して size 銘柄分に割り当てる
+
+    生データのオブジェクトは共有する（読み取り専用として扱う）。
+    """
+    if not fixtures:
+        raise ValueError("フィクスチャが空です")
+    sources = list(fixtures.values())
+    return {f"B{i:05d}": sources[i % len(sources)] for i in range(size)}
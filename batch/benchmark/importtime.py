@@ -0,0 +1,101 @@
+"""
+株式データ取得API（py/stock.py）の読み込み時間
+
+python -X importtime の出力を集計し、コールドスタート時のモジュール読み込みコストを計測する。
+stock単体（検証・キャッシュ応答まで）と、取得時に遅延読み込みする yfinance を含めた場合を比べる。
+"""
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+from loguru import logger
+
+# py/stock.py のあるディレクトリ
+STOCK_API_DIR = Path(__file__).resolve().parents[2] / "py"
+
+# 計測する読み込み（名前 -> importするモジュール）
+IMPORT_TARGETS = {
+    "stock": ["stock"],
+    "stock+yfinance": ["stock", "yfinance"],
+}
+
+# ログに出す読み込みコストの大きいモジュール数
+TOP_MODULES = 15
+
+
+def measure_import_times(repeat: int = 5) -> dict[str, float]:
+    """
+    読み込み時間を計測（repeat回の最小値、秒）
+
+    Returns:
+        IMPORT_TARGETSの名前 -> 秒（依存が入っておらず読み込めないものは除く）
+    """
+    results = {}
+    for name, modules in IMPORT_TARGETS.items():
+        runs = [_import_once(modules) for _ in range(repeat)]
+        if any(run is None for run in runs):
+            logger.warning(f"読み込み失敗のため計測をスキップ: {name}")
+            continue
+        best = min(runs, key=lambda run: run[0])
+        results[name] = round(best[0], 4)
+        logger.info(f"import {name}: {best[0] * 1000:.1f}ms")
+        for entry in sorted(best[1], key=lambda e: e["self"], reverse=True)[:TOP_MODULES]:
+            logger.info(f"  {entry['self'] * 1000:8.1f}ms  {entry['module']}")
+    return results
+
+
+def _import_once(modules: list[str]) -> tuple[float, list[dict[str, Any]]] | None:
+    """
+    新しいプロセスで1回読み込み
+
+    Returns:
+        (対象モジュールの累積読み込み時間, 対象モジュール配下の各モジュール) / 失敗時None
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=STOCK_API_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        logger.debug(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+        return None
+
+    entries = _parse_importtime(proc.stderr)
+    # 対象モジュールの読み込み中（インタプリタ起動時のsite等を除く）のエントリ
+    # importtimeは子モジュールを先に出力するため、対象の行から直前の対象行までを集める
+    total = 0.0
+    children: list[dict[str, Any]] = []
+    pending: list[dict[str, Any]] = []
+    for entry in entries:
+        pending.append(entry)
+        if entry["depth"] == 0:
+            if entry["module"] in modules:
+                total += entry["cumulative"]
+                children.extend(pending)
+            pending = []
+    return total, children
+
+
+def _parse_importtime(stderr: str) -> list[dict[str, Any]]:
+    """
+    -X importtime の行を解析
+
+    例: "import time:       412 |       1290 |   pandas.core"
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 見出し行
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        entries.append({
+            "module": stripped,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+            "self": int(parts[0]) / 1e6,
+            "cumulative": int(parts[1]) / 1e6,
+        })
+    return entries
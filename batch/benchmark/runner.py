@@ -0,0 +1,296 @@
+"""
+ベンチマーク実行・ベースライン比較
+
+記録済みフィクスチャとローカルのSupabase代替を使い、ネットワークなしで
+パース・指標計算・判定・upsert・株価バッチ全体の所要時間を規模ごとに計測する。
+各シナリオは準備（計測対象外）と本体に分かれ、本体をrepeat回実行した最小値を結果とする。
+"""
+import json
+import platform
+import random
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable
+from unittest import mock
+import numpy as np
+import pandas as pd
+from loguru import logger
+sys.path.append("..")
+import db
+import main
+from config import PIPELINE_FLUSH_ROWS
+from fetcher import financial, price
+from metrics import get_registry
+from screener import judge_all, judge_all_vectorized
+from .fake_supabase import FakeSupabase
+from .fixtures import scale_fixtures
+
+# 計測規模（銘柄数）
+DEFAULT_SCALES = [100, 1_000, 4_000, 40_000]
+
+# 退行とみなす最小の差（秒）。これより小さい差は計測誤差として扱う
+MIN_REGRESSION_SECONDS = 0.01
+
+# 株価バッチで取得失敗とする銘柄の割合（mark_stale経路を通すため）
+PRICE_FAILURE_RATE = 0.02
+
+
+class BenchmarkContext:
+    """規模ごとの入力データ（シナリオ間で共有し、各シナリオは複製して使う）"""
+
+    def __init__(self, raw: dict[str, dict[str, Any]]):
+        self.raw = raw
+        self.codes = list(raw)
+        self.shikiho = {code: r["shikiho"] for code, r in raw.items() if r.get("shikiho")}
+        self._parsed: list[dict] | None = None
+        self._judged: list[dict] | None = None
+
+    @property
+    def parsed(self) -> list[dict]:
+        """パース・指標計算済みのレコード"""
+        if self._parsed is None:
+            with _offline(self.raw):
+                self._parsed = [financial.fetch_financial_data(code, self.shikiho) for code in self.codes]
+        return self._parsed
+
+    @property
+    def judged(self) -> list[dict]:
+        """判定済みのレコード（upsertの入力）"""
+        if self._judged is None:
+            self._judged = judge_all_vectorized(_copy_records(self.parsed), log_summary=False)
+        return self._judged
+
+
+def prepare_fetch_parse(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """fetch_financial_data（取得部分をフィクスチャに差し替え、パース・指標計算を計測）"""
+    def run():
+        with _offline(ctx.raw):
+            for code in ctx.codes:
+                financial.fetch_financial_data(code, ctx.shikiho)
+    return run
+
+
+def prepare_calculate_metrics(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """_calculate_metrics 単体"""
+    inputs = []
+    for code, record in zip(ctx.codes, ctx.parsed):
+        raw = ctx.raw[code]
+        data = {k: v for k, v in record.items() if k != "review_reasons"}
+        inputs.append((
+            data,
+            financial._extract_analyst_estimates(raw.get("earnings_trend", {})),
+            financial._extract_company_estimates(raw.get("earning_history", {})),
+            ctx.shikiho.get(code),
+        ))
+
+    def run():
+        for data, analyst, company, shikiho in inputs:
+            financial._calculate_metrics(data, analyst, company, shikiho)
+    return run
+
+
+def prepare_judge_all(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """judge_all（1社ずつ判定）"""
+    records = _copy_records(ctx.parsed)
+    return lambda: judge_all(records, log_summary=False)
+
+
+def prepare_judge_all_vectorized(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """judge_all_vectorized（列指向一括判定）"""
+    records = _copy_records(ctx.parsed)
+    return lambda: judge_all_vectorized(records, log_summary=False)
+
+
+def prepare_upsert_companies(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """upsert_companies（空のテーブルへPIPELINE_FLUSH_ROWS件ずつ書き込み）"""
+    fake = FakeSupabase()
+    records = _copy_records(ctx.judged)
+
+    def run():
+        with mock.patch.object(db, "_client", fake):
+            for i in range(0, len(records), PIPELINE_FLUSH_ROWS):
+                db.upsert_companies(records[i:i + PIPELINE_FLUSH_ROWS])
+    return run
+
+
+def prepare_upsert_unchanged(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """upsert_companies（全件が保存済みと同じ = row_hash比較のみで送信なし）"""
+    fake = FakeSupabase()
+    with mock.patch.object(db, "_client", fake):
+        db.upsert_companies(_copy_records(ctx.judged), skip_unchanged=False)
+    records = _copy_records(ctx.judged)
+
+    def run():
+        with mock.patch.object(db, "_client", fake):
+            for i in range(0, len(records), PIPELINE_FLUSH_ROWS):
+                db.upsert_companies(records[i:i + PIPELINE_FLUSH_ROWS])
+    return run
+
+
+def prepare_run_price_update(ctx: BenchmarkContext) -> Callable[[], Any]:
+    """run_price_update（登録銘柄取得 → 株価一括取得 → 一括更新 → stale設定 → 履歴記録）"""
+    fake = FakeSupabase()
+    fake.seed("watched_tickers", [{"company_code": code} for code in ctx.codes])
+    fake.seed("screened_latest", _copy_records(ctx.judged))
+
+    rng = random.Random(0)
+    frames = {}
+    # fetch_price_download と同じ200銘柄ずつの分割で事前に応答を作る
+    for i in range(0, len(ctx.codes), 200):
+        symbols = [f"{code}.T" for code in ctx.codes[i:i + 200]]
+        frames[tuple(symbols)] = _download_frame(symbols, rng)
+
+    def download(symbols, **kwargs):
+        frame = frames.get(tuple(symbols))
+        return frame if frame is not None else _download_frame(list(symbols), rng)
+
+    def run():
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(db, "_client", fake))
+            stack.enter_context(mock.patch.object(price.yf, "download", download))
+            stack.enter_context(mock.patch.object(main, "PRICE_FETCH_BACKEND", "download"))
+            main.run_price_update()
+    return run
+
+
+# シナリオ名 -> 準備関数
+SCENARIOS: dict[str, Callable[[BenchmarkContext], Callable[[], Any]]] = {
+    "fetch_parse": prepare_fetch_parse,
+    "calculate_metrics": prepare_calculate_metrics,
+    "judge_all": prepare_judge_all,
+    "judge_all_vectorized": prepare_judge_all_vectorized,
+    "upsert_companies": prepare_upsert_companies,
+    "upsert_unchanged": prepare_upsert_unchanged,
+    "run_price_update": prepare_run_price_update,
+}
+
+
+def run_benchmarks(
+    fixtures: dict[str, dict[str, Any]],
+    scales: list[int] | None = None,
+    scenarios: list[str] | None = None,
+    repeat: int = 3,
+) -> dict[str, dict[str, float]]:
+    """
+    全シナリオを規模ごとに計測
+
+    Returns:
+        シナリオ名 -> 銘柄数（文字列） -> 秒（repeat回の最小値）
+    """
+    scales = scales or DEFAULT_SCALES
+    names = scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"未知のシナリオ: {', '.join(unknown)}")
+
+    results: dict[str, dict[str, float]] = {name: {} for name in names}
+    for size in scales:
+        ctx = BenchmarkContext(scale_fixtures(fixtures, size))
+        for name in names:
+            timings = []
+            for _ in range(repeat):
+                run = SCENARIOS[name](ctx)
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+                get_registry().reset()
+            best = min(timings)
+            results[name][str(size)] = round(best, 4)
+            logger.info(f"{name} x{size}: {best:.3f}秒 ({best / size * 1e6:.1f}µs/銘柄)")
+    return results
+
+
+def compare_baseline(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[dict[str, Any]]:
+    """
+    ベースラインと比較して退行を抽出
+
+    ベースラインより tolerance の割合以上遅く、かつ差が MIN_REGRESSION_SECONDS 以上のものを退行とする。
+    """
+    regressions = []
+    for name, sizes in results.items():
+        for size, seconds in sizes.items():
+            base = baseline.get(name, {}).get(size)
+            if not base:
+                continue
+            if seconds > base * (1 + tolerance) and seconds - base >= MIN_REGRESSION_SECONDS:
+                regressions.append({
+                    "scenario": name,
+                    "size": size,
+                    "baseline": base,
+                    "current": seconds,
+                    "ratio": round(seconds / base, 2),
+                })
+    return regressions
+
+
+def read_baseline(path: str | Path) -> dict[str, dict[str, float]] | None:
+    """ベースラインを読み込み（なければNone）"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with path.open(encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def write_baseline(path: str | Path, results: dict[str, dict[str, float]]) -> None:
+    """ベースラインを保存（既存の計測済み規模・シナリオは上書きしてマージ）"""
+    merged = read_baseline(path) or {}
+    for name, sizes in results.items():
+        merged.setdefault(name, {}).update(sizes)
+    write_results(path, merged)
+
+
+def write_results(path: str | Path, results: dict[str, dict[str, float]]) -> None:
+    """計測結果を実行環境の情報とともにJSONで保存"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": results,
+    }
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def _offline(raw: dict[str, dict[str, Any]]) -> ExitStack:
+    """Yahoo呼び出しをフィクスチャに差し替え（Tickerの生成もしない）"""
+    def fetch_endpoint(endpoint, yf_ticker, yq_ticker, ticker_symbol):
+        return raw[ticker_symbol[:-2]].get(endpoint)
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(financial, "fetch_endpoint", fetch_endpoint))
+    stack.enter_context(mock.patch.object(financial, "yf", SimpleNamespace(Ticker=lambda symbol: None)))
+    stack.enter_context(mock.patch.object(financial, "Ticker", lambda symbol: None))
+    return stack
+
+
+def _copy_records(records: list[dict]) -> list[dict]:
+    """レコードを複製（review_reasonsは判定・指標計算で追記されるためリストも複製）"""
+    return [
+        {**r, "review_reasons": list(r["review_reasons"])} if "review_reasons" in r else dict(r)
+        for r in records
+    ]
+
+
+def _download_frame(symbols: list[str], rng: random.Random) -> pd.DataFrame:
+    """yf.download(group_by="ticker") と同じ形の5営業日分の株価"""
+    fields = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+    index = pd.bdate_range(end="2024-06-28", periods=5)
+    values = np.array([rng.uniform(300, 15000) for _ in symbols])
+    data = np.repeat(values, len(fields))[np.newaxis, :] * np.linspace(0.98, 1.0, len(index))[:, np.newaxis]
+    for j in range(len(symbols)):
+        if rng.random() < PRICE_FAILURE_RATE:
+            data[:, j * len(fields) + fields.index("Close")] = np.nan
+    return pd.DataFrame(data, index=index, columns=pd.MultiIndex.from_product([symbols, fields]))
@@ -0,0 +1,210 @@
+"""
+レスポンスキャッシュ
+
+yfinance/yahooqueryの取得結果を銘柄×エンドポイント単位でローカルのSQLiteに保存する。
+エンドポイントごとにTTLを持ち、合計サイズが上限を超えたら最終アクセスの古い順に削除（LRU）。
+"""
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable
+from loguru import logger
+from config import CACHE_ENABLED, CACHE_PATH, CACHE_MAX_BYTES, CACHE_TTLS
+from metrics import count
+
+# キャッシュなしを表す番兵（Noneや空dictもキャッシュ値になり得るため）
+MISS = object()
+
+_cache: "ResponseCache | None" = None
+_enabled = CACHE_ENABLED
+
+
+class ResponseCache:
+    """銘柄×エンドポイント単位のレスポンスキャッシュ"""
+
+    def __init__(self, path: str | Path = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, ttls: dict | None = None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttls = ttls if ttls is not None else CACHE_TTLS
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                ticker      TEXT NOT NULL,
+                endpoint    TEXT NOT NULL,
+                payload     BLOB NOT NULL,
+                size        INTEGER NOT NULL,
+                fetched_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (ticker, endpoint)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+
+    def get(self, ticker: str, endpoint: str, max_age: float | None = None) -> Any:
+        """
+        キャッシュを取得
+
+        Args:
+            ticker: シンボル（例: "7203.T"）
+            endpoint: エンドポイント名
+            max_age: 有効期間（秒）。省略時はエンドポイントのTTL
+
+        Returns:
+            キャッシュ値（期限切れ・未保存ならMISS）
+        """
+        ttl = max_age if max_age is not None else self.ttls.get(endpoint, 0)
+        if ttl <= 0:
+            return MISS
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, fetched_at FROM responses WHERE ticker = ? AND endpoint = ?",
+                (ticker, endpoint),
+            ).fetchone()
+            if row is None or now - row[1] > ttl:
+                count("cache", endpoint=endpoint, result="miss")
+                return MISS
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE ticker = ? AND endpoint = ?",
+                (now, ticker, endpoint),
+            )
+
+        count("cache", endpoint=endpoint, result="hit")
+        try:
+            return pickle.loads(zlib.decompress(row[0]))
+        except Exception as e:
+            logger.warning(f"キャッシュ破損のため無視: {ticker} {endpoint} - {e}")
+            return MISS
+
+    def set(self, ticker: str, endpoint: str, value: Any) -> None:
+        """キャッシュを保存（空の結果・エラー応答は保存しない）"""
+        if _is_empty(value) or is_error_payload(value):
+            return
+
+        payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (ticker, endpoint, payload, len(payload), now, now),
+            )
+
+    def fetched_at(self, ticker: str, endpoint: str) -> float | None:
+        """保存時刻（UNIX秒）を取得"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at FROM responses WHERE ticker = ? AND endpoint = ?",
+                (ticker, endpoint),
+            ).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, ticker: str, endpoints: list[str] | None = None) -> None:
+        """銘柄のキャッシュを削除（endpoints省略時は全エンドポイント）"""
+        with self._lock:
+            if endpoints is None:
+                self._conn.execute("DELETE FROM responses WHERE ticker = ?", (ticker,))
+            else:
+                self._conn.executemany(
+                    "DELETE FROM responses WHERE ticker = ? AND endpoint = ?",
+                    [(ticker, e) for e in endpoints],
+                )
+
+    def evict(self) -> int:
+        """サイズ上限を超えた分を最終アクセスの古い順に削除"""
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            rows = self._conn.execute(
+                "SELECT ticker, endpoint, size FROM responses ORDER BY accessed_at"
+            ).fetchall()
+            for ticker, endpoint, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute(
+                    "DELETE FROM responses WHERE ticker = ? AND endpoint = ?", (ticker, endpoint)
+                )
+                total -= size
+                removed += 1
+
+        logger.info(f"キャッシュ削除: {removed}件")
+        return removed
+
+    def close(self) -> None:
+        """接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+def _is_empty(value: Any) -> bool:
+    """空の取得結果か判定（DataFrame/dict/None）"""
+    if value is None:
+        return True
+    if hasattr(value, "empty"):
+        return bool(value.empty)
+    if isinstance(value, dict):
+        return len(value) == 0
+    return False
+
+
+def is_error_payload(value: Any) -> bool:
+    """
+    Yahooのエラー応答か判定
+
+    yahooqueryは取得できない銘柄でも例外を出さず、"No fundamentals data found ..." のような
+    文字列や {"error": ...} のdictを返す（一時的なエラーでも同じ形）
+    """
+    return isinstance(value, str) or (isinstance(value, dict) and "error" in value)
+
+
+def get_cache() -> ResponseCache | None:
+    """キャッシュを取得（シングルトン、無効時はNone）"""
+    global _cache
+    if not _enabled:
+        return None
+    if _cache is None:
+        try:
+            _cache = ResponseCache()
+        except Exception as e:
+            logger.warning(f"キャッシュ初期化失敗、キャッシュなしで続行: {e}")
+            return None
+    return _cache
+
+
+def disable_cache() -> None:
+    """キャッシュを無効化（--no-cache）"""
+    global _enabled
+    _enabled = False
+    logger.info("レスポンスキャッシュ無効")
+
+
+def cached_call(ticker: str, endpoint: str, fetch: Callable[[], Any]) -> Any:
+    """
+    キャッシュがあれば返し、なければ取得して保存
+
+    Args:
+        ticker: シンボル
+        endpoint: エンドポイント名
+        fetch: 取得関数
+    """
+    cache = get_cache()
+    if cache is None:
+        return fetch()
+
+    value = cache.get(ticker, endpoint)
+    if value is not MISS:
+        return value
+
+    value = fetch()
+    cache.set(ticker, endpoint, value)
+    return value
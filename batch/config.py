@@ -18,6 +18,72 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "5"))
 BATCH_RETRY_MAX = int(os.getenv("BATCH_RETRY_MAX", "3"))
 
+# 株価取得方式: download=チャートAPIで一括取得, info=銘柄ごとにinfoを取得
+PRICE_FETCH_BACKEND = os.getenv("PRICE_FETCH_BACKEND", "download")
+
+# 株価一括更新（update_prices_bulk）1リクエストあたりの件数
+PRICE_WRITE_CHUNK_SIZE = int(os.getenv("PRICE_WRITE_CHUNK_SIZE", "500"))
+
+# 財務取得エンジン: async=非同期一括取得, thread=ThreadPoolExecutor（BATCH_CONCURRENCY並列）
+FINANCIAL_FETCH_ENGINE = os.getenv("FINANCIAL_FETCH_ENGINE", "async")
+ASYNC_FETCH_RATE = float(os.getenv("ASYNC_FETCH_RATE", "12"))  # 全体の秒間リクエスト数
+ASYNC_FETCH_BURST = int(os.getenv("ASYNC_FETCH_BURST", "24"))  # バースト許容量
+ASYNC_FETCH_TICKERS = int(os.getenv("ASYNC_FETCH_TICKERS", "32"))  # 同時に処理する銘柄数
+ASYNC_FETCH_POOL_SIZE = int(os.getenv("ASYNC_FETCH_POOL_SIZE", "10"))  # ホストあたりの同時接続数
+
+# 財務バッチのストリーミング処理（取得→判定→書き込み）
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "200"))  # ステージ間キューの上限
+PIPELINE_FLUSH_ROWS = int(os.getenv("PIPELINE_FLUSH_ROWS", "200"))  # この件数ごとにupsert
+PIPELINE_FLUSH_SECONDS = float(os.getenv("PIPELINE_FLUSH_SECONDS", "30"))  # またはこの秒数ごとにupsert
+
+# レスポンスキャッシュ（yfinance/yahooquery取得結果のローカル保存）
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_PATH = os.getenv("CACHE_PATH", str(Path(__file__).parent / ".cache" / "responses.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# JPX銘柄リストのスナップショット（ETag/Last-Modifiedが変わるまで再利用）
+STOCK_LIST_CACHE_PATH = os.getenv("STOCK_LIST_CACHE_PATH", str(Path(__file__).parent / ".cache" / "stock_list.pkl"))
+
+# 四季報予想の一括読み込み結果（imported_atが変わるまで再利用）
+SHIKIHO_CACHE_PATH = os.getenv("SHIKIHO_CACHE_PATH", str(Path(__file__).parent / ".cache" / "shikiho.pkl"))
+
+# 実行メトリクス（実行レポートはlogs/に保存）
+METRICS_REPORT_DIR = os.getenv("METRICS_REPORT_DIR", "logs")
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH", "")  # 指定時のみ Prometheus textfile を出力
+
+# スクリーニング履歴（screened_history）への記録
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+HISTORY_CHUNK_SIZE = int(os.getenv("HISTORY_CHUNK_SIZE", "1000"))  # append_screened_history 1回あたりの銘柄数
+HISTORY_CACHE_PATH = os.getenv("HISTORY_CACHE_PATH", str(Path(__file__).parent / ".cache" / "history.pkl"))  # バックテスト用
+BACKTEST_FFILL_MAX_DAYS = int(os.getenv("BACKTEST_FFILL_MAX_DAYS", "7"))  # 記録のない日に直前の記録を引き継ぐ上限（日数）
+
+# 四季報CSVインポート（--mode import-shikiho）
+SHIKIHO_IMPORT_CHUNK_SIZE = int(os.getenv("SHIKIHO_IMPORT_CHUNK_SIZE", "1000"))
+SHIKIHO_DEFAULT_UNIT = os.getenv("SHIKIHO_DEFAULT_UNIT", "百万円")  # 見出しに単位がない場合
+
+# ベンチマーク（python -m benchmark）
+BENCHMARK_FIXTURES_PATH = os.getenv("BENCHMARK_FIXTURES_PATH", str(Path(__file__).parent / "benchmark" / "fixtures" / "yahoo.pkl.gz"))
+BENCHMARK_BASELINE_PATH = os.getenv("BENCHMARK_BASELINE_PATH", str(Path(__file__).parent / "benchmark" / "baseline.json"))
+BENCHMARK_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "0.2"))  # ベースラインからこの割合以上遅ければ退行
+
+# エンドポイント別の有効期間（秒）
+CACHE_TTLS = {
+    "info": 12 * 3600,
+    "financials": 7 * 86400,
+    "balance_sheet": 7 * 86400,
+    "cashflow": 7 * 86400,
+    "earnings_trend": 86400,
+    "earning_history": 7 * 86400,
+    "quote": 5 * 60,
+}
+
+# 増分更新（--mode financial-incremental）
+# 最終取得からこの日数を超えた銘柄は決算がなくても再取得
+INCREMENTAL_MAX_AGE_DAYS = int(os.getenv("INCREMENTAL_MAX_AGE_DAYS", "14"))
+
+# 判定エンジン: vectorized=列指向一括判定, row=1社ずつ判定（judge_company）
+JUDGE_ENGINE = os.getenv("JUDGE_ENGINE", "vectorized")
+
 # スクリーニング条件（閾値）
 # field: {"op": 演算子, "value": 閾値, "display_only": 表示のみか}
 SCREENING_CONDITIONS = {
@@ -2,13 +2,35 @@
 Supabase接続モジュール
 データベース操作を提供
 """
+import hashlib
+import json
+from datetime import datetime
 from typing import Any
 from supabase import create_client, Client
 from loguru import logger
-from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, PRICE_WRITE_CHUNK_SIZE, HISTORY_CHUNK_SIZE
+from screener import all_condition_bits
 
 _client: Client | None = None
 
+# mark_stale_bulk RPC 1回あたりの銘柄数
+MARK_STALE_CHUNK_SIZE = 500
+
+# update_prices_bulk 失敗時にチャンクを半分に分割する最大回数（超えたら1件ずつ更新）
+PRICE_BISECT_MAX_DEPTH = 3
+
+# RPC未定義を示すエラーコード（PostgRESTのスキーマキャッシュにない / PostgreSQLの関数なし）
+MISSING_RPC_CODES = {"PGRST202", "42883"}
+
+# 行フィンガープリント（row_hash）の対象外カラム
+# 株価バッチが日中に更新するもの・メタ情報は含めない
+HASH_EXCLUDED_FIELDS = {
+    "stock_price", "market_cap", "updated_at", "verified_at", "price_updated_at", "data_source", "row_hash",
+}
+
+# 全件取得時のページサイズ（PostgRESTのmax-rows以下）
+SELECT_PAGE_SIZE = 1000
+
 
 def get_client() -> Client:
     """Supabaseクライアントを取得（シングルトン）"""
@@ -21,6 +43,22 @@ def get_client() -> Client:
     return _client
 
 
+def _select_all(table: str, columns: str) -> list[dict]:
+    """テーブルを全件取得（ページング）"""
+    client = get_client()
+    rows = []
+    offset = 0
+    while True:
+        result = client.table(table).select(columns).range(
+            offset, offset + SELECT_PAGE_SIZE - 1
+        ).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < SELECT_PAGE_SIZE:
+            return rows
+        offset += SELECT_PAGE_SIZE
+
+
 def get_watched_tickers() -> list[str]:
     """登録銘柄コード一覧を取得"""
     client = get_client()
@@ -58,11 +96,38 @@ def remove_watched_ticker(company_code: str) -> bool:
         return False
 
 
-def upsert_companies(records: list[dict]) -> int:
-    """企業データをupsert"""
+def upsert_companies(records: list[dict], skip_unchanged: bool = True) -> int:
+    """
+    企業データをupsert
+
+    各レコードにrow_hash（業務カラムのハッシュ）を付与し、
+    skip_unchanged=Trueなら保存済みのハッシュと同じ行は送信しない。
+    送信する行だけupdated_atを更新する（= データが変化した時刻）。
+    取得できた銘柄（staleでないもの）は送信を省略した行も含めてverified_atを更新する。
+    """
     if not records:
         return 0
 
+    for record in records:
+        record["row_hash"] = row_fingerprint(record)
+    verified_codes = [r["company_code"] for r in records if r.get("data_status") != "stale"]
+
+    if skip_unchanged:
+        stored = get_screened_rows([r["company_code"] for r in records], "company_code, row_hash")
+        changed = [
+            r for r in records
+            if stored.get(r["company_code"], {}).get("row_hash") != r["row_hash"]
+        ]
+        logger.info(f"変更あり: {len(changed)}/{len(records)}件")
+        records = changed
+        if not records:
+            touch_verified(verified_codes)
+            return 0
+
+    now = datetime.now().isoformat()
+    for record in records:
+        record["updated_at"] = now
+
     client = get_client()
     result = client.table("screened_latest").upsert(
         records,
@@ -71,25 +136,140 @@ def upsert_companies(records: list[dict]) -> int:
 
     count = len(result.data) if result.data else 0
     logger.info(f"upsert完了: {count}件")
+    touch_verified(verified_codes)
     return count
 
 
+def touch_verified(company_codes: list[str]) -> int:
+    """
+    財務データの確認時刻（verified_at）を一括更新
+
+    touch_verified_bulk RPC（schema.sql）で1回に送信する。
+    失敗してもupsert済みのデータには影響しないため、警告のみで続行する。
+
+    Returns:
+        更新された行数
+    """
+    if not company_codes:
+        return 0
+
+    try:
+        client = get_client()
+        result = client.rpc("touch_verified_bulk", {"p_codes": company_codes}).execute()
+        return int(result.data or 0)
+    except Exception as e:
+        logger.warning(f"確認時刻の更新失敗（{len(company_codes)}件）: {e}")
+        return 0
+
+
+def row_fingerprint(record: dict) -> str:
+    """業務カラムを正規化してSHA-256ハッシュを計算"""
+    normalized = {
+        k: _normalize_value(v) for k, v in record.items() if k not in HASH_EXCLUDED_FIELDS
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize_value(value: Any) -> Any:
+    """ハッシュ用に正規化（浮動小数点の誤差を丸める）"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return None if value != value else round(float(value), 4)
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_value(v) for v in value]
+    return value
+
+
 def update_price(company_code: str, price_data: dict) -> bool:
-    """株価・時価総額を更新"""
+    """株価・時価総額を更新（該当行がなければFalse）"""
     try:
         client = get_client()
-        client.table("screened_latest").update({
+        result = client.table("screened_latest").update({
             "stock_price": price_data.get("stock_price"),
             "market_cap": price_data.get("market_cap"),
             "price_updated_at": "now()",
             "data_status": "fresh",
         }).eq("company_code", company_code).execute()
-        return True
+        # 該当行がなければ更新件数に含めない（update_prices_bulkと同じ数え方）
+        return bool(result.data)
     except Exception as e:
         logger.error(f"株価更新エラー: {company_code} - {e}")
         return False
 
 
+def update_prices(price_records: list[dict], chunk_size: int = PRICE_WRITE_CHUNK_SIZE) -> int:
+    """
+    株価・時価総額を一括更新
+
+    update_prices_bulk RPC（schema.sql）でチャンク単位に送信する。
+    失敗したチャンクは半分に分割して再送し（PRICE_BISECT_MAX_DEPTH回まで）、
+    それでも失敗する場合はupdate_priceで個別更新する。
+    RPCが未定義の場合は分割せず、残りを全てupdate_priceで個別更新する。
+
+    Returns:
+        更新できた銘柄数
+    """
+    if not price_records:
+        return 0
+
+    rows = [
+        {
+            "company_code": r["company_code"],
+            "stock_price": r.get("stock_price"),
+            "market_cap": r.get("market_cap"),
+            "price_updated_at": r.get("price_updated_at"),
+            "data_status": "fresh",
+        }
+        for r in price_records
+    ]
+
+    updated = 0
+    for i in range(0, len(rows), chunk_size):
+        try:
+            updated += _update_prices_chunk(rows[i:i + chunk_size])
+        except Exception as e:
+            logger.warning(f"update_prices_bulk未定義、1件ずつ更新: {e}")
+            updated += _update_price_rows(rows[i:])
+            break
+
+    logger.info(f"株価一括更新: {updated}/{len(rows)}件")
+    return updated
+
+
+def _update_prices_chunk(rows: list[dict], depth: int = 0) -> int:
+    """1チャンクを送信（失敗時は分割して再送、RPC未定義なら例外を送出）"""
+    if len(rows) == 1:
+        return _update_price_rows(rows)
+
+    try:
+        client = get_client()
+        result = client.rpc("update_prices_bulk", {"p_rows": rows}).execute()
+        return len(result.data) if result.data else 0
+    except Exception as e:
+        if _is_missing_rpc(e):
+            raise
+        if depth >= PRICE_BISECT_MAX_DEPTH:
+            logger.warning(f"株価一括更新失敗（{len(rows)}件）、1件ずつ更新: {e}")
+            return _update_price_rows(rows)
+        logger.warning(f"株価一括更新失敗（{len(rows)}件）、分割して再送: {e}")
+        mid = len(rows) // 2
+        return _update_prices_chunk(rows[:mid], depth + 1) + _update_prices_chunk(rows[mid:], depth + 1)
+
+
+def _update_price_rows(rows: list[dict]) -> int:
+    """1件ずつ更新（RPC未定義時・分割しても失敗するチャンクのフォールバック）"""
+    return sum(1 for r in rows if update_price(r["company_code"], r))
+
+
+def _is_missing_rpc(error: Exception) -> bool:
+    """RPCが未定義のエラーか（行データの問題ではなくスキーマ未適用）"""
+    return getattr(error, "code", None) in MISSING_RPC_CODES
+
+
 def get_all_codes() -> list[str]:
     """screened_latestの全銘柄コードを取得"""
     client = get_client()
@@ -97,6 +277,47 @@ def get_all_codes() -> list[str]:
     return [r["company_code"] for r in result.data] if result.data else []
 
 
+def get_shares_outstanding() -> dict[str, float]:
+    """
+    発行済株式数を一括取得（時価総額の再計算用）
+
+    財務バッチで保存したshares_outstandingを使用し、
+    未保存の銘柄は前回の時価総額（億円）と株価から逆算する。
+    """
+    shares = {}
+    rows = _select_all("screened_latest", "company_code, shares_outstanding, market_cap, stock_price")
+    for r in rows:
+        if r.get("shares_outstanding"):
+            shares[r["company_code"]] = float(r["shares_outstanding"])
+        elif r.get("market_cap") and r.get("stock_price"):
+            shares[r["company_code"]] = float(r["market_cap"]) * 100_000_000 / float(r["stock_price"])
+    return shares
+
+
+def get_screened_rows(company_codes: list[str], columns: str = "*") -> dict[str, dict]:
+    """
+    複数銘柄のスクリーニング結果を一括取得
+
+    Returns:
+        証券コード -> 行データ
+    """
+    client = get_client()
+    rows = {}
+    for i in range(0, len(company_codes), SELECT_PAGE_SIZE):
+        chunk = company_codes[i:i + SELECT_PAGE_SIZE]
+        result = client.table("screened_latest").select(columns).in_(
+            "company_code", chunk
+        ).execute()
+        for r in result.data or []:
+            rows[r["company_code"]] = r
+    return rows
+
+
+def get_all_screened(columns: str = "*") -> list[dict[str, Any]]:
+    """screened_latestを全件取得（ページング）"""
+    return _select_all("screened_latest", columns)
+
+
 def get_screened(company_code: str) -> dict[str, Any] | None:
     """スクリーニング結果を取得"""
     try:
@@ -110,34 +331,137 @@ def get_screened(company_code: str) -> dict[str, Any] | None:
 
 
 def mark_stale(company_codes: list[str], reason: str) -> int:
-    """指定銘柄をstale状態にする"""
+    """
+    指定銘柄をstale状態にする
+
+    mark_stale_bulk RPC（schema.sql）でチャンク単位に一括更新する。
+    RPCが使えない場合は1件ずつの更新にフォールバック。
+
+    Returns:
+        実際に変更された行数
+    """
     if not company_codes:
         return 0
 
     client = get_client()
+    codes = list(dict.fromkeys(company_codes))
+    changed = 0
+    for i in range(0, len(codes), MARK_STALE_CHUNK_SIZE):
+        chunk = codes[i:i + MARK_STALE_CHUNK_SIZE]
+        try:
+            result = client.rpc("mark_stale_bulk", {
+                "p_codes": chunk,
+                "p_reason": reason,
+            }).execute()
+            changed += int(result.data or 0)
+        except Exception as e:
+            logger.warning(f"mark_stale_bulk失敗、1件ずつ更新: {e}")
+            changed += _mark_stale_rows(chunk, reason)
+
+    logger.warning(f"stale設定: {len(codes)}件中 {changed}件変更 - {reason}")
+    return changed
+
+
+def _mark_stale_rows(company_codes: list[str], reason: str) -> int:
+    """1件ずつstale状態にする（RPC未定義時のフォールバック）"""
+    client = get_client()
+    # 全条件を欠損扱い（mark_stale_bulkと同じ）
+    missing_mask = all_condition_bits()
+    changed = 0
     for code in company_codes:
         try:
             # 既存のreview_reasonsを取得
             existing = get_screened(code)
-            review_reasons = []
-            if existing and existing.get("review_reasons"):
-                review_reasons = existing["review_reasons"]
+            if existing is None:
+                continue
+            review_reasons = existing.get("review_reasons") or []
 
             # 理由を追加（重複チェック）
             reason_obj = {"code": reason, "message": reason}
-            if not any(r.get("code") == reason for r in review_reasons):
+            has_reason = any(r.get("code") == reason for r in review_reasons)
+            already_stale = (
+                existing.get("data_status") == "stale"
+                and existing.get("status") == "REVIEW"
+                and not existing.get("fail_mask")
+                and existing.get("missing_mask") == missing_mask
+            )
+            if has_reason and already_stale:
+                continue
+            if not has_reason:
                 review_reasons.append(reason_obj)
 
             client.table("screened_latest").update({
                 "data_status": "stale",
                 "status": "REVIEW",
                 "review_reasons": review_reasons,
+                "row_hash": None,
+                "fail_mask": 0,
+                "missing_mask": missing_mask,
             }).eq("company_code", code).execute()
+            changed += 1
         except Exception as e:
             logger.error(f"stale設定エラー: {code} - {e}")
 
-    logger.warning(f"stale設定: {len(company_codes)}件 - {reason}")
-    return len(company_codes)
+    return changed
+
+
+def create_batch_run(run_id: str, mode: str, company_codes: list[str]) -> None:
+    """バッチ実行を登録し、全銘柄をpendingで記録"""
+    client = get_client()
+    client.table("batch_runs").insert({
+        "run_id": run_id,
+        "mode": mode,
+        "total_codes": len(company_codes),
+    }).execute()
+    upsert_batch_run_items(run_id, company_codes, "pending")
+
+
+def upsert_batch_run_items(run_id: str, company_codes: list[str], stage: str) -> None:
+    """銘柄の進捗を一括更新"""
+    client = get_client()
+    for i in range(0, len(company_codes), SELECT_PAGE_SIZE):
+        chunk = company_codes[i:i + SELECT_PAGE_SIZE]
+        client.table("batch_run_items").upsert(
+            [{"run_id": run_id, "company_code": code, "stage": stage, "updated_at": "now()"} for code in chunk],
+            on_conflict="run_id,company_code",
+        ).execute()
+
+
+def get_batch_run(run_id: str) -> dict[str, Any] | None:
+    """バッチ実行を取得"""
+    try:
+        client = get_client()
+        result = client.table("batch_runs").select("*").eq("run_id", run_id).single().execute()
+        return result.data
+    except Exception:
+        return None
+
+
+def get_unfinished_codes(run_id: str) -> list[str]:
+    """書き込みまで完了していない銘柄コードを取得（取得・書き込みに失敗したfailedを含む）"""
+    client = get_client()
+    codes = []
+    offset = 0
+    while True:
+        result = client.table("batch_run_items").select("company_code").eq(
+            "run_id", run_id
+        ).neq("stage", "written").order("company_code").range(
+            offset, offset + SELECT_PAGE_SIZE - 1
+        ).execute()
+        page = result.data or []
+        codes.extend(r["company_code"] for r in page)
+        if len(page) < SELECT_PAGE_SIZE:
+            return codes
+        offset += SELECT_PAGE_SIZE
+
+
+def finish_batch_run(run_id: str, status: str) -> None:
+    """バッチ実行の終了を記録"""
+    client = get_client()
+    client.table("batch_runs").update({
+        "status": status,
+        "finished_at": "now()",
+    }).eq("run_id", run_id).execute()
 
 
 def get_shikiho_estimate(company_code: str) -> dict[str, Any] | None:
@@ -150,3 +474,119 @@ def get_shikiho_estimate(company_code: str) -> dict[str, Any] | None:
         return result.data
     except Exception:
         return None
+
+
+def get_shikiho_estimates() -> dict[str, dict[str, Any]]:
+    """四季報予想データを全件取得（証券コード -> 行）"""
+    rows = _select_all("shikiho_estimates", "*")
+    return {r["company_code"]: r for r in rows}
+
+
+def get_shikiho_imported_at() -> str | None:
+    """四季報予想データの最新インポート日時を取得"""
+    client = get_client()
+    result = client.table("shikiho_estimates").select("imported_at").order(
+        "imported_at", desc=True
+    ).limit(1).execute()
+    return result.data[0]["imported_at"] if result.data else None
+
+
+def upsert_shikiho_estimates(rows: list[dict]) -> int:
+    """四季報予想データを一括upsert"""
+    if not rows:
+        return 0
+    client = get_client()
+    result = client.table("shikiho_estimates").upsert(
+        rows,
+        on_conflict="company_code"
+    ).execute()
+    return len(result.data) if result.data else 0
+
+
+def append_history(company_codes: list[str], snapshot_date: str | None = None) -> int:
+    """
+    screened_latestの現在値をscreened_historyに記録
+
+    append_screened_history RPC（schema.sql）でDB内コピーするため送るのは銘柄コードのみ。
+
+    Args:
+        company_codes: 銘柄コード
+        snapshot_date: 記録日（YYYY-MM-DD、省略時はDBの当日）
+
+    Returns:
+        記録した行数
+    """
+    client = get_client()
+    codes = list(dict.fromkeys(company_codes))
+    written = 0
+    for i in range(0, len(codes), HISTORY_CHUNK_SIZE):
+        params = {"p_codes": codes[i:i + HISTORY_CHUNK_SIZE]}
+        if snapshot_date:
+            params["p_date"] = snapshot_date
+        result = client.rpc("append_screened_history", params).execute()
+        written += int(result.data or 0)
+    return written
+
+
+def get_status_transitions(since: str, to_status: str | None = None) -> list[dict[str, Any]]:
+    """
+    指定日以降の判定変化を取得
+
+    Args:
+        since: 開始日（YYYY-MM-DD）
+        to_status: 変化後の判定で絞り込み（PASS/FAIL/REVIEW）
+
+    Returns:
+        [{company_code, changed_on, from_status, to_status}, ...]（日付順）
+    """
+    client = get_client()
+    rows = []
+    offset = 0
+    while True:
+        result = client.rpc("status_transitions", {
+            "p_since": since,
+            "p_to_status": to_status,
+        }).range(offset, offset + SELECT_PAGE_SIZE - 1).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < SELECT_PAGE_SIZE:
+            return rows
+        offset += SELECT_PAGE_SIZE
+
+
+def get_history(columns: str = "*", since: str | None = None, until: str | None = None) -> list[dict[str, Any]]:
+    """
+    スクリーニング履歴を期間指定で取得（ページング）
+
+    Args:
+        columns: 取得カラム
+        since: 開始日（YYYY-MM-DD、含む）
+        until: 終了日（YYYY-MM-DD、含む）
+    """
+    client = get_client()
+    rows = []
+    offset = 0
+    while True:
+        query = client.table("screened_history").select(columns)
+        if since:
+            query = query.gte("snapshot_date", since)
+        if until:
+            query = query.lte("snapshot_date", until)
+        result = query.order("snapshot_date").order("company_code").range(
+            offset, offset + SELECT_PAGE_SIZE - 1
+        ).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < SELECT_PAGE_SIZE:
+            return rows
+        offset += SELECT_PAGE_SIZE
+
+
+def sync_condition_bits(bits: list[dict]) -> None:
+    """条件ビット割り当てを更新（条件が減った場合は余分な行を削除）"""
+    client = get_client()
+    client.table("screening_condition_bits").upsert(
+        [{**b, "updated_at": "now()"} for b in bits],
+        on_conflict="bit",
+    ).execute()
+    client.table("screening_condition_bits").delete().gte("bit", len(bits)).execute()
@@ -1,6 +1,6 @@
 """データ取得モジュール"""
-from .stock_list import fetch_stock_list
+from .stock_list import fetch_stock_list, load_stock_list
 from .financial import fetch_financial_data
 from .price import fetch_price_data
 
-__all__ = ["fetch_stock_list", "fetch_financial_data", "fetch_price_data"]
+__all__ = ["fetch_stock_list", "load_stock_list", "fetch_financial_data", "fetch_price_data"]
@@ -0,0 +1,190 @@
+"""
+財務データ非同期取得
+
+asyncioで多数銘柄の財務データを並行取得する。
+1銘柄あたりのエンドポイント（info, 財務諸表, アナリスト予想等）も同時に発行し、
+全体のリクエスト数は共通のトークンバケットで制限してYahooのスロットリングを避ける。
+yfinance/yahooqueryは同期APIのため、実際の通信はホスト別に上限を設けたスレッドプールで行う。
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+import yfinance as yf
+from yahooquery import Ticker
+from loguru import logger
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
+import sys
+sys.path.append("..")
+from config import (
+    BATCH_RETRY_MAX,
+    ASYNC_FETCH_RATE,
+    ASYNC_FETCH_BURST,
+    ASYNC_FETCH_TICKERS,
+    ASYNC_FETCH_POOL_SIZE,
+)
+from cache import get_cache, MISS
+from metrics import count, observe, retry_counter
+from .financial import ENDPOINTS, fetch_endpoint, build_financial_record, _failed_record
+
+# エンドポイント -> 接続先ホスト（ホスト単位で同時接続数を制限）
+ENDPOINT_HOSTS = {
+    "info": "query2.finance.yahoo.com",
+    "financials": "query2.finance.yahoo.com",
+    "balance_sheet": "query2.finance.yahoo.com",
+    "cashflow": "query2.finance.yahoo.com",
+    "earnings_trend": "query1.finance.yahoo.com",
+    "earning_history": "query1.finance.yahoo.com",
+}
+
+# スロットリング検知時にバケットを停止する秒数
+THROTTLE_PAUSE_SECONDS = 30
+
+
+class TokenBucket:
+    """
+    非同期トークンバケット
+
+    全銘柄・全エンドポイントで共有し、秒間リクエスト数を rate 以下に保つ。
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """トークンを1つ取得（不足時は補充まで待機）"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """スロットリング検知時に全体のリクエストを一時停止"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class FinancialFetcher:
+    """
+    財務データ非同期取得エンジン
+
+    open()後にfetch_safe()を銘柄ごとに呼び、最後にclose()する（pipeline.FinancialPipelineから使用）。
+    """
+
+    def __init__(
+        self,
+        rate: float = ASYNC_FETCH_RATE,
+        burst: int = ASYNC_FETCH_BURST,
+        max_tickers: int = ASYNC_FETCH_TICKERS,
+        pool_size: int = ASYNC_FETCH_POOL_SIZE,
+        shikiho_estimates: dict[str, dict] | None = None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_tickers = max_tickers
+        self.pool_size = pool_size
+        self.shikiho_estimates = shikiho_estimates
+
+    def open(self) -> None:
+        """レート制限・接続プールを初期化（イベントループ内で呼ぶ）"""
+        self._limiter = TokenBucket(self.rate, self.burst)
+        self._ticker_slots = asyncio.Semaphore(self.max_tickers)
+        hosts = sorted(set(ENDPOINT_HOSTS.values()))
+        self._host_slots = {host: asyncio.Semaphore(self.pool_size) for host in hosts}
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size * len(hosts))
+
+    def close(self) -> None:
+        """スレッドプールを終了"""
+        self._executor.shutdown(wait=True)
+
+    async def fetch_safe(self, company_code: str) -> dict[str, Any] | None:
+        """fetch_oneを実行し、例外時はNoneを返す"""
+        try:
+            return await self.fetch_one(company_code)
+        except Exception as e:
+            logger.error(f"財務取得例外 {company_code}: {e}")
+            return None
+
+    async def fetch_one(self, company_code: str) -> dict[str, Any]:
+        """1銘柄の全エンドポイントを同時に取得してレコードを組み立てる"""
+        async with self._ticker_slots:
+            ticker_symbol = f"{company_code}.T"
+            payloads = await asyncio.gather(
+                *[self._fetch_endpoint(e, ticker_symbol) for e in ENDPOINTS],
+                return_exceptions=True,
+            )
+
+            for payload in payloads:
+                if isinstance(payload, Exception):
+                    return _failed_record(company_code, payload)
+
+            raw = dict(zip(ENDPOINTS, payloads))
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, build_financial_record, company_code, raw, self.shikiho_estimates
+            )
+
+    async def _fetch_endpoint(self, endpoint: str, ticker_symbol: str) -> Any:
+        """レート制限・ホスト別接続数制限・リトライ付きで1エンドポイントを取得"""
+        # キャッシュヒット時はレート制限を消費しない
+        cache = get_cache()
+        if cache is not None:
+            cached = cache.get(ticker_symbol, endpoint)
+            if cached is not MISS:
+                return cached
+
+        loop = asyncio.get_running_loop()
+        host_slots = self._host_slots[ENDPOINT_HOSTS[endpoint]]
+
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(BATCH_RETRY_MAX),
+            wait=wait_exponential(multiplier=1, min=2, max=10),
+            before_sleep=retry_counter(endpoint),
+            reraise=True,
+        ):
+            with attempt:
+                waited = time.perf_counter()
+                await self._limiter.acquire()
+                async with host_slots:
+                    # レート制限・接続数制限での待ち時間
+                    observe("throttle_wait", time.perf_counter() - waited, endpoint=endpoint)
+                    try:
+                        value = await loop.run_in_executor(
+                            self._executor, _fetch_endpoint_in_thread, endpoint, ticker_symbol
+                        )
+                    except Exception as e:
+                        if _is_throttled(e):
+                            count("throttled", endpoint=endpoint)
+                            logger.warning(f"スロットリング検知、{THROTTLE_PAUSE_SECONDS}秒停止: {ticker_symbol} {endpoint}")
+                            self._limiter.pause(THROTTLE_PAUSE_SECONDS)
+                        raise
+
+        if cache is not None:
+            cache.set(ticker_symbol, endpoint, value)
+        return value
+
+
+def _fetch_endpoint_in_thread(endpoint: str, ticker_symbol: str) -> Any:
+    """ワーカースレッドで1エンドポイントを取得（Ticker/fast_infoはスレッドセーフでないため呼び出しごとに生成）"""
+    return fetch_endpoint(endpoint, yf.Ticker(ticker_symbol), Ticker(ticker_symbol), ticker_symbol)
+
+
+def _is_throttled(error: Exception) -> bool:
+    """Yahooのレート制限エラーか判定"""
+    message = str(error)
+    return "429" in message or "Too Many Requests" in message or "Rate limited" in message
+
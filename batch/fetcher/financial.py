@@ -6,24 +6,33 @@ yfinance/yahooqueryから財務データを取得する。
 import yfinance as yf
 from yahooquery import Ticker
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential
-from datetime import datetime
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+from datetime import datetime, timezone
 from typing import Any
 import sys
 sys.path.append("..")
+from config import BATCH_RETRY_MAX
 from db import get_shikiho_estimate
+from cache import cached_call, is_error_payload
+from metrics import timer, timed, record_serialized_size, retry_counter
 
 # 億円換算用（日本円）
 HUNDRED_MILLION = 100_000_000
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def fetch_financial_data(company_code: str) -> dict[str, Any]:
+# 1銘柄あたりに呼び出すエンドポイント（取得順）
+ENDPOINTS = ["info", "financials", "balance_sheet", "cashflow", "earnings_trend", "earning_history"]
+
+
+def fetch_financial_data(company_code: str, shikiho_estimates: dict[str, dict] | None = None) -> dict[str, Any]:
     """
     1銘柄の財務データを取得
 
+    エンドポイントごとにリトライし、それでも取得できなければ取得失敗のレコードを返す
+
     Args:
         company_code: 証券コード（例: "7203"）
+        shikiho_estimates: 一括読み込み済みの四季報予想（省略時は1件ずつ取得）
 
     Returns:
         財務データのdict（screened_latestのカラムに対応）
@@ -35,20 +44,100 @@ def fetch_financial_data(company_code: str) -> dict[str, Any]:
         yf_ticker = yf.Ticker(ticker_symbol)
         yq_ticker = Ticker(ticker_symbol)
 
-        # 基本情報
-        info = yf_ticker.info or {}
+        raw = {
+            endpoint: cached_call(
+                ticker_symbol, endpoint,
+                lambda endpoint=endpoint: _fetch_endpoint_retrying(endpoint, yf_ticker, yq_ticker, ticker_symbol),
+            )
+            for endpoint in ENDPOINTS
+        }
+    except Exception as e:
+        return _failed_record(company_code, e)
+
+    return build_financial_record(company_code, raw, shikiho_estimates)
+
+
+def _fetch_endpoint_retrying(endpoint: str, yf_ticker: yf.Ticker, yq_ticker: Ticker, ticker_symbol: str) -> Any:
+    """リトライ付きで1エンドポイントを取得（async_financialと同じ回数・間隔、最後の例外を送出）"""
+    for attempt in Retrying(
+        stop=stop_after_attempt(BATCH_RETRY_MAX),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=retry_counter(endpoint),
+        reraise=True,
+    ):
+        with attempt:
+            return fetch_endpoint(endpoint, yf_ticker, yq_ticker, ticker_symbol)
 
-        # 財務諸表（年次）
-        financials = yf_ticker.financials  # 損益計算書
-        balance = yf_ticker.balance_sheet  # 貸借対照表
-        cashflow = yf_ticker.cashflow  # キャッシュフロー
 
-        # yahooquery からアナリスト予想
-        earnings_trend = yq_ticker.earnings_trend.get(ticker_symbol, {})
-        analyst_estimates = _extract_analyst_estimates(earnings_trend)
+def fetch_endpoint(endpoint: str, yf_ticker: yf.Ticker, yq_ticker: Ticker, ticker_symbol: str) -> Any:
+    """
+    1エンドポイント分の生データを取得（所要時間・データ量をメトリクスに記録）
+
+    Args:
+        endpoint: ENDPOINTSのいずれか
+        yf_ticker: yfinanceのTicker
+        yq_ticker: yahooqueryのTicker
+        ticker_symbol: シンボル（例: "7203.T"）
+    """
+    with timer("endpoint", endpoint=endpoint):
+        value = _request_endpoint(endpoint, yf_ticker, yq_ticker, ticker_symbol)
+    record_serialized_size(endpoint, value)
+    return value
+
+
+def _request_endpoint(endpoint: str, yf_ticker: yf.Ticker, yq_ticker: Ticker, ticker_symbol: str) -> Any:
+    """1エンドポイント分の生データを取得"""
+    # 基本情報
+    if endpoint == "info":
+        return yf_ticker.info or {}
+
+    # 財務諸表（年次）
+    if endpoint == "financials":
+        return yf_ticker.financials  # 損益計算書
+    if endpoint == "balance_sheet":
+        return yf_ticker.balance_sheet  # 貸借対照表
+    if endpoint == "cashflow":
+        return yf_ticker.cashflow  # キャッシュフロー
+
+    # yahooquery からアナリスト予想
+    if endpoint == "earnings_trend":
+        return yq_ticker.earnings_trend.get(ticker_symbol, {})
+
+    # 会社予想（可能なら取得）
+    if endpoint == "earning_history":
+        try:
+            return yq_ticker.earning_history.get(ticker_symbol, {})
+        except Exception:
+            return {}
+
+    raise ValueError(f"未知のエンドポイント: {endpoint}")
+
+
+@timed("stage", stage="parse")
+def build_financial_record(
+    company_code: str,
+    raw: dict[str, Any],
+    shikiho_estimates: dict[str, dict] | None = None,
+) -> dict[str, Any]:
+    """
+    取得済みの生データから財務レコードを組み立てる
+
+    Args:
+        company_code: 証券コード
+        raw: エンドポイント名 -> 生データ（fetch_endpointの戻り値）
+        shikiho_estimates: 一括読み込み済みの四季報予想（省略時は1件ずつ取得）
+
+    Returns:
+        財務データのdict（screened_latestのカラムに対応）
+    """
+    try:
+        info = raw.get("info") or {}
+        financials = raw.get("financials")
+        balance = raw.get("balance_sheet")
+        cashflow = raw.get("cashflow")
 
-        # 会社予想（可能なら取得）
-        company_estimates = _extract_company_estimates(yq_ticker, ticker_symbol)
+        analyst_estimates = _extract_analyst_estimates(raw.get("earnings_trend", {}))
+        company_estimates = _extract_company_estimates(raw.get("earning_history", {}))
 
         # データ抽出・計算
         result = {
@@ -61,6 +150,7 @@ def fetch_financial_data(company_code: str) -> dict[str, Any]:
             # 時価総額・株価
             "market_cap": _to_oku(info.get("marketCap")),
             "stock_price": info.get("currentPrice") or info.get("regularMarketPrice"),
+            "shares_outstanding": info.get("sharesOutstanding"),
 
             # 売上高（過去2期 + 予想2期）
             "revenue_2y": _get_financial_value(financials, "Total Revenue", 1),
@@ -86,33 +176,50 @@ def fetch_financial_data(company_code: str) -> dict[str, Any]:
             "pbr": info.get("priceToBook"),
             "dividend_yield": _to_percent(info.get("dividendYield")),
 
-            # メタ情報
+            # 決算日（直近または次回）
+            "earnings_date": _parse_epoch_utc(
+                info.get("earningsTimestampStart") or info.get("earningsTimestamp")
+            ),
+
+            # メタ情報（updated_atはupsert時に変化があった行のみ付与）
             "data_source": "yfinance",
-            "updated_at": datetime.now().isoformat(),
         }
 
+        # 四季報予想（一括読み込み済みならdictから引く）
+        if shikiho_estimates is not None:
+            shikiho = shikiho_estimates.get(company_code)
+        else:
+            with timer("stage", stage="shikiho_lookup"):
+                shikiho = get_shikiho_estimate(company_code)
+
         # 計算値を追加
-        result = _calculate_metrics(result, analyst_estimates, company_estimates, company_code)
+        with timer("stage", stage="metrics"):
+            result = _calculate_metrics(result, analyst_estimates, company_estimates, shikiho)
 
         logger.debug(f"財務データ取得完了: {company_code}")
         return result
 
     except Exception as e:
-        logger.error(f"財務データ取得失敗 {company_code}: {e}")
-        return {
-            "company_code": company_code,
-            "company_name": "",
-            "data_status": "stale",
-            "status": "REVIEW",
-            "review_reasons": [{"code": "FETCH_FAILED", "message": f"データ取得失敗: {str(e)}"}],
-        }
+        return _failed_record(company_code, e)
+
+
+def _failed_record(company_code: str, error: Exception) -> dict[str, Any]:
+    """取得失敗時のレコード"""
+    logger.error(f"財務データ取得失敗 {company_code}: {error}")
+    return {
+        "company_code": company_code,
+        "company_name": "",
+        "data_status": "stale",
+        "status": "REVIEW",
+        "review_reasons": [{"code": "FETCH_FAILED", "message": f"データ取得失敗: {str(error)}"}],
+    }
 
 
 def _extract_analyst_estimates(earnings_trend: Any) -> dict:
     """yahooquery earnings_trendからアナリスト予想を抽出"""
     estimates = {}
 
-    if not isinstance(earnings_trend, dict) or "trend" not in earnings_trend:
+    if is_error_payload(earnings_trend) or not isinstance(earnings_trend, dict) or "trend" not in earnings_trend:
         return estimates
 
     trends = earnings_trend.get("trend", [])
@@ -133,24 +240,19 @@ def _extract_analyst_estimates(earnings_trend: Any) -> dict:
     return estimates
 
 
-def _extract_company_estimates(yq_ticker: Ticker, ticker_symbol: str) -> dict:
-    """会社予想を抽出"""
+def _extract_company_estimates(earnings: Any) -> dict:
+    """会社予想を抽出（yahooquery earning_history）"""
     estimates = {}
 
-    try:
-        # yahooquery から会社ガイダンスを取得
-        earnings = yq_ticker.earning_history.get(ticker_symbol, {})
-        if isinstance(earnings, dict):
-            # 会社予想がある場合
-            estimates["company_revenue_cy"] = None  # 直接取得困難
-            estimates["company_op_cy"] = None
-    except Exception:
-        pass
+    if isinstance(earnings, dict) and not is_error_payload(earnings):
+        # 会社予想がある場合
+        estimates["company_revenue_cy"] = None  # 直接取得困難
+        estimates["company_op_cy"] = None
 
     return estimates
 
 
-def _calculate_metrics(data: dict, analyst_estimates: dict, company_estimates: dict, company_code: str) -> dict:
+def _calculate_metrics(data: dict, analyst_estimates: dict, company_estimates: dict, shikiho: dict | None) -> dict:
     """計算指標を算出"""
     review_reasons = data.get("review_reasons", []) or []
 
@@ -193,8 +295,6 @@ def _calculate_metrics(data: dict, analyst_estimates: dict, company_estimates: d
         review_reasons.append({"code": "CALC_FAILED", "field": "free_cf", "message": "フリーCF計算不可"})
 
     # TK会社乖離（四季報優先、なければアナリスト予想乖離で代替）
-    shikiho = get_shikiho_estimate(company_code)
-
     if shikiho and shikiho.get("shikiho_revenue"):
         # 四季報データがある場合
         company_rev = data.get("revenue_cy")
@@ -283,6 +383,16 @@ def _parse_listing_date(epoch: int | None) -> str | None:
         return None
 
 
+def _parse_epoch_utc(epoch: int | None) -> str | None:
+    """UNIX秒をUTCのISO8601文字列に変換"""
+    if epoch is None:
+        return None
+    try:
+        return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+    except Exception:
+        return None
+
+
 if __name__ == "__main__":
     # テスト実行
     import json
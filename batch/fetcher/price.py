@@ -2,22 +2,32 @@
 
 yfinanceから株価・時価総額を取得する。
 """
+import pandas as pd
 import yfinance as yf
 from loguru import logger
 from tenacity import retry, stop_after_attempt, wait_exponential
 from datetime import datetime
 from typing import Any
+import sys
+sys.path.append("..")
+from cache import get_cache, MISS
+from metrics import timer, count, retry_counter
 
 HUNDRED_MILLION = 100_000_000
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def fetch_price_data(company_code: str) -> dict[str, Any]:
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    before_sleep=retry_counter("fetch_price_data"),
+)
+def fetch_price_data(company_code: str, shares_outstanding: float | None = None) -> dict[str, Any]:
     """
     1銘柄の株価データを取得
 
     Args:
         company_code: 証券コード（例: "7203"）
+        shares_outstanding: 発行済株式数（指定時はinfoを呼ばずに時価総額を算出）
 
     Returns:
         株価データのdict
@@ -26,12 +36,12 @@ def fetch_price_data(company_code: str) -> dict[str, Any]:
 
     try:
         ticker = yf.Ticker(ticker_symbol)
-        info = ticker.info or {}
+        stock_price, market_cap = _get_price(ticker, shares_outstanding)
 
         result = {
             "company_code": company_code,
-            "stock_price": info.get("currentPrice") or info.get("regularMarketPrice"),
-            "market_cap": _to_oku(info.get("marketCap")),
+            "stock_price": stock_price,
+            "market_cap": market_cap,
             "price_updated_at": datetime.now().isoformat(),
             "data_status": "fresh",
         }
@@ -47,15 +57,20 @@ def fetch_price_data(company_code: str) -> dict[str, Any]:
         }
 
 
-def fetch_price_batch(company_codes: list[str]) -> list[dict]:
+def fetch_price_batch(
+    company_codes: list[str],
+    shares_outstanding: dict[str, float] | None = None,
+) -> list[dict]:
     """
     複数銘柄の株価を一括取得
 
     yfinanceのバッチ取得機能を使用して効率化
+    発行済株式数が分かる銘柄はinfoを呼ばずに時価総額を算出する
     """
     if not company_codes:
         return []
 
+    shares_outstanding = shares_outstanding or {}
     ticker_symbols = [f"{code}.T" for code in company_codes]
 
     try:
@@ -66,11 +81,11 @@ def fetch_price_batch(company_codes: list[str]) -> list[dict]:
         for code in company_codes:
             symbol = f"{code}.T"
             try:
-                info = tickers.tickers[symbol].info
+                stock_price, market_cap = _get_price(tickers.tickers[symbol], shares_outstanding.get(code))
                 results.append({
                     "company_code": code,
-                    "stock_price": info.get("currentPrice") or info.get("regularMarketPrice"),
-                    "market_cap": _to_oku(info.get("marketCap")),
+                    "stock_price": stock_price,
+                    "market_cap": market_cap,
                     "price_updated_at": datetime.now().isoformat(),
                     "data_status": "fresh",
                 })
@@ -89,6 +104,146 @@ def fetch_price_batch(company_codes: list[str]) -> list[dict]:
         return [{"company_code": code, "data_status": "stale"} for code in company_codes]
 
 
+def _get_price(ticker: yf.Ticker, shares_outstanding: float | None) -> tuple[float | None, float | None]:
+    """
+    株価・時価総額（億円）を取得
+
+    発行済株式数があればfast_infoの株価から時価総額を算出し、
+    なければ従来どおりinfoから取得する
+    """
+    if shares_outstanding:
+        with timer("endpoint", endpoint="fast_info"):
+            price = ticker.fast_info["lastPrice"]
+        if price is not None and price == price:
+            return float(price), _to_oku(float(price) * shares_outstanding)
+
+    with timer("endpoint", endpoint="price_info"):
+        info = ticker.info or {}
+    return (
+        info.get("currentPrice") or info.get("regularMarketPrice"),
+        _to_oku(info.get("marketCap")),
+    )
+
+
+def fetch_price_download(
+    company_codes: list[str],
+    shares_outstanding: dict[str, float] | None = None,
+    chunk_size: int = 200,
+) -> list[dict]:
+    """
+    複数銘柄の株価をチャートAPI（yf.download）で一括取得
+
+    銘柄ごとのinfo（quoteSummary）を呼ばず、複数銘柄を1リクエストで取得する。
+    時価総額は株価 × 発行済株式数（キャッシュ）から算出し、
+    株式数が不明な銘柄はNone（DB側の既存値を維持）とする。
+
+    Args:
+        company_codes: 証券コードのリスト
+        shares_outstanding: 証券コード -> 発行済株式数
+        chunk_size: 1リクエストあたりの銘柄数
+    """
+    if not company_codes:
+        return []
+
+    shares_outstanding = shares_outstanding or {}
+    cache = get_cache()
+    results = []
+
+    for i in range(0, len(company_codes), chunk_size):
+        chunk = company_codes[i:i + chunk_size]
+        symbols = [f"{code}.T" for code in chunk]
+
+        # 数分以内に取得済みの株価はキャッシュを使用
+        cached_prices = {}
+        if cache is not None:
+            for symbol in symbols:
+                price = cache.get(symbol, "quote")
+                if price is not MISS:
+                    cached_prices[symbol] = price
+        missing = [s for s in symbols if s not in cached_prices]
+
+        df = None
+        if missing:
+            try:
+                with timer("endpoint", endpoint="download"):
+                    df = yf.download(
+                        missing,
+                        period="5d",
+                        interval="1d",
+                        group_by="ticker",
+                        auto_adjust=False,
+                        threads=True,
+                        progress=False,
+                    )
+                # 通信量ではなく、デコード後のDataFrameのメモリ使用量
+                count("frame_memory_bytes", int(df.memory_usage(deep=True).sum()), endpoint="download")
+            except Exception as e:
+                logger.error(f"株価一括ダウンロード失敗: {e}")
+
+        now = datetime.now().isoformat()
+        session = _latest_session(df)
+        for code, symbol in zip(chunk, symbols):
+            price = cached_prices.get(symbol)
+            if price is None:
+                price = _last_close(df, symbol, session)
+                if price is not None and cache is not None:
+                    cache.set(symbol, "quote", price)
+            if price is None:
+                results.append({"company_code": code, "data_status": "stale"})
+                continue
+
+            shares = shares_outstanding.get(code)
+            results.append({
+                "company_code": code,
+                "stock_price": price,
+                "market_cap": _to_oku(price * shares) if shares else None,
+                "price_updated_at": now,
+                "data_status": "fresh",
+            })
+
+    logger.info(f"株価一括ダウンロード完了: {len(results)}件")
+    return results
+
+
+def _last_close(df: pd.DataFrame | None, symbol: str, session: pd.Timestamp | None) -> float | None:
+    """
+    yf.downloadの結果から直近の終値を取得
+
+    終値が最新の取引日（session）のものでなければNone（売買停止・上場廃止の銘柄に
+    古い株価を新しい時刻で書き込まず、stale扱いにする）
+    """
+    if df is None or df.empty or session is None:
+        return None
+    try:
+        if isinstance(df.columns, pd.MultiIndex):
+            if symbol not in df.columns.get_level_values(0):
+                return None
+            close = df[symbol]["Close"]
+        else:
+            close = df["Close"]
+        close = close.dropna()
+        if close.empty or close.index[-1] != session:
+            return None
+        return float(close.iloc[-1])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _latest_session(df: pd.DataFrame | None) -> pd.Timestamp | None:
+    """yf.downloadの結果のうち、いずれかの銘柄に終値がある最新の取引日"""
+    if df is None or df.empty:
+        return None
+    try:
+        if isinstance(df.columns, pd.MultiIndex):
+            closes = df.xs("Close", axis=1, level=1)
+        else:
+            closes = df[["Close"]]
+    except KeyError:
+        return None
+    traded = closes.notna().any(axis=1)
+    return traded[traded].index[-1] if traded.any() else None
+
+
 def _to_oku(value: Any) -> float | None:
     """億円に換算"""
     if value is None or (isinstance(value, float) and value != value):
@@ -2,14 +2,27 @@
 
 東証上場の普通株全銘柄を取得する。
 ETF/ETN/REIT/優先株は除外。
+
+パース済みのリストはローカルに保存し、JPX側のETag/Last-Modifiedが
+変わったときだけExcelを再取得する（load_stock_list）。
 """
+import io
+import pickle
+import urllib.request
+from pathlib import Path
 import pandas as pd
 from loguru import logger
+import sys
+sys.path.append("..")
+from config import STOCK_LIST_CACHE_PATH
 
 # JPX（日本取引所グループ）の銘柄一覧CSV URL
 # 実際のURLは変更される可能性があるため、取得元を切り替え可能に設計
 JPX_LIST_URL = "https://www.jpx.co.jp/markets/statistics-equities/misc/tvdivq0000001vg2-att/data_j.xls"
 
+# 更新確認（HEAD）・ダウンロードのタイムアウト（秒）
+JPX_REQUEST_TIMEOUT = 30
+
 
 def fetch_stock_list() -> pd.DataFrame:
     """
@@ -20,38 +33,132 @@ def fetch_stock_list() -> pd.DataFrame:
     """
     try:
         # JPXの銘柄一覧を取得
-        df = pd.read_excel(JPX_LIST_URL)
+        df = _parse_stock_list(JPX_LIST_URL)
+        logger.info(f"銘柄リスト取得完了: {len(df)}件")
+        return df
 
-        # カラム名を正規化（実際のカラム名に合わせて調整が必要）
-        # 想定カラム: コード, 銘柄名, 市場・商品区分, 33業種区分
-        df = df.rename(columns={
-            "コード": "company_code",
-            "銘柄名": "company_name",
-            "市場・商品区分": "market",
-            "33業種区分": "sector",
-        })
+    except Exception as e:
+        logger.error(f"銘柄リスト取得失敗: {e}")
+        raise
 
-        # 必要なカラムのみ抽出
-        required_cols = ["company_code", "company_name", "market", "sector"]
-        df = df[required_cols].copy()
 
-        # company_codeを文字列に
-        df["company_code"] = df["company_code"].astype(str)
+def load_stock_list() -> pd.DataFrame:
+    """
+    東証銘柄リストを取得（ローカルスナップショット優先）
 
-        # 普通株のみフィルタ（ETF/REIT等を除外）
-        # 市場区分が「プライム」「スタンダード」「グロース」のみ
-        valid_markets = ["プライム（内国株式）", "スタンダード（内国株式）", "グロース（内国株式）"]
-        df = df[df["market"].isin(valid_markets)]
+    JPXのファイルのETag/Last-Modifiedがスナップショット保存時と同じなら
+    Excelをダウンロード・パースせずにスナップショットを返す。
+    JPXに接続できない場合はスナップショット、それもなければ fetch_stock_list_fallback を使う。
 
-        # 市場名を簡略化
-        df["market"] = df["market"].str.replace("（内国株式）", "", regex=False)
+    Returns:
+        DataFrame: company_code, company_name, sector, market を含む
+    """
+    snapshot = _read_snapshot()
 
+    try:
+        validators = _remote_validators()
+        if snapshot is not None and validators and _same_version(snapshot, validators):
+            logger.info(f"銘柄リスト: スナップショット使用 {len(snapshot['df'])}件")
+            return snapshot["df"]
+
+        content, validators = _download()
+        df = _parse_stock_list(io.BytesIO(content))
+        _write_snapshot({**validators, "df": df})
         logger.info(f"銘柄リスト取得完了: {len(df)}件")
         return df
 
     except Exception as e:
-        logger.error(f"銘柄リスト取得失敗: {e}")
-        raise
+        if snapshot is not None:
+            logger.warning(f"銘柄リスト取得失敗、スナップショットを使用: {e}")
+            return snapshot["df"]
+        logger.warning(f"銘柄リスト取得失敗: {e}")
+        return fetch_stock_list_fallback()
+
+
+def _parse_stock_list(source) -> pd.DataFrame:
+    """JPXのExcel（URL/ファイル）を読み込んで普通株のリストに整形"""
+    df = pd.read_excel(source)
+
+    # カラム名を正規化（実際のカラム名に合わせて調整が必要）
+    # 想定カラム: コード, 銘柄名, 市場・商品区分, 33業種区分
+    df = df.rename(columns={
+        "コード": "company_code",
+        "銘柄名": "company_name",
+        "市場・商品区分": "market",
+        "33業種区分": "sector",
+    })
+
+    # 必要なカラムのみ抽出
+    required_cols = ["company_code", "company_name", "market", "sector"]
+    df = df[required_cols].copy()
+
+    # company_codeを文字列に
+    df["company_code"] = df["company_code"].astype(str)
+
+    # 普通株のみフィルタ（ETF/REIT等を除外）
+    # 市場区分が「プライム」「スタンダード」「グロース」のみ
+    valid_markets = ["プライム（内国株式）", "スタンダード（内国株式）", "グロース（内国株式）"]
+    df = df[df["market"].isin(valid_markets)]
+
+    # 市場名を簡略化
+    df["market"] = df["market"].str.replace("（内国株式）", "", regex=False)
+
+    return df.reset_index(drop=True)
+
+
+def _remote_validators() -> dict[str, str]:
+    """JPXファイルのETag/Last-Modifiedを取得（HEAD）"""
+    request = urllib.request.Request(JPX_LIST_URL, method="HEAD")
+    with urllib.request.urlopen(request, timeout=JPX_REQUEST_TIMEOUT) as response:
+        return _validators(response.headers)
+
+
+def _download() -> tuple[bytes, dict[str, str]]:
+    """JPXファイルをダウンロード"""
+    with urllib.request.urlopen(JPX_LIST_URL, timeout=JPX_REQUEST_TIMEOUT) as response:
+        return response.read(), _validators(response.headers)
+
+
+def _validators(headers) -> dict[str, str]:
+    """レスポンスヘッダから更新判定用の値を取り出す"""
+    return {
+        key: headers.get(header)
+        for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+        if headers.get(header)
+    }
+
+
+def _same_version(snapshot: dict, validators: dict[str, str]) -> bool:
+    """スナップショットとリモートが同じ版か（ETag優先、なければLast-Modified）"""
+    if "etag" in validators and snapshot.get("etag"):
+        return snapshot["etag"] == validators["etag"]
+    if "last_modified" in validators and snapshot.get("last_modified"):
+        return snapshot["last_modified"] == validators["last_modified"]
+    return False
+
+
+def _read_snapshot() -> dict | None:
+    """ローカルスナップショットを読み込み"""
+    path = Path(STOCK_LIST_CACHE_PATH)
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"銘柄リストスナップショット読み込み失敗: {e}")
+        return None
+
+
+def _write_snapshot(snapshot: dict) -> None:
+    """ローカルスナップショットを保存"""
+    path = Path(STOCK_LIST_CACHE_PATH)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logger.warning(f"銘柄リストスナップショット保存失敗: {e}")
 
 
 def fetch_stock_list_fallback() -> pd.DataFrame:
@@ -0,0 +1,46 @@
+"""
+スクリーニング履歴
+
+バッチ実行後の screened_latest を screened_history に日次で記録し、
+判定の変化（FAIL → PASS 等）を期間指定で参照できるようにする。
+記録はDB内コピー（append_screened_history）で行い、本体のupsertとは分けて最後にまとめて実行する。
+"""
+from datetime import date
+from loguru import logger
+from config import HISTORY_ENABLED
+from db import append_history, get_status_transitions
+
+
+def record_history(company_codes: list[str], snapshot_date: date | None = None) -> int:
+    """
+    対象銘柄の現在値を履歴に記録（失敗してもバッチは止めない）
+
+    Returns:
+        記録した行数
+    """
+    if not HISTORY_ENABLED or not company_codes:
+        return 0
+
+    try:
+        written = append_history(company_codes, snapshot_date.isoformat() if snapshot_date else None)
+    except Exception as e:
+        logger.warning(f"履歴記録失敗: {e}")
+        return 0
+
+    logger.info(f"履歴記録: {written}件")
+    return written
+
+
+def status_transitions(since: date | str, to_status: str | None = None) -> list[dict]:
+    """
+    指定日以降の判定変化を取得
+
+    Args:
+        since: 開始日
+        to_status: 変化後の判定で絞り込み（PASS/FAIL/REVIEW）
+
+    Returns:
+        [{company_code, changed_on, from_status, to_status}, ...]（日付順）
+    """
+    since = since.isoformat() if isinstance(since, date) else since
+    return get_status_transitions(since, to_status)
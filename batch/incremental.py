@@ -0,0 +1,96 @@
+"""
+増分更新
+
+決算日と最終取得時刻から再取得が必要な銘柄だけを選ぶ。
+変化のない行の書き込み省略はupsert_companies（row_hash比較）で行う。
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from loguru import logger
+from config import INCREMENTAL_MAX_AGE_DAYS
+from cache import get_cache
+from db import get_screened_rows
+from fetcher.financial import ENDPOINTS
+
+
+def select_incremental_codes(codes: list[str], now: datetime | None = None) -> list[str]:
+    """
+    再取得が必要な銘柄を選択
+
+    以下のいずれかに該当する銘柄を対象とする:
+    - screened_latestに未登録、またはstale
+    - 前回取得後に決算日を迎えた（該当銘柄はキャッシュも破棄）
+    - 最終取得から INCREMENTAL_MAX_AGE_DAYS 日を超えた
+
+    Args:
+        codes: 登録銘柄コード
+        now: 基準時刻（省略時は現在時刻）
+
+    Returns:
+        再取得対象の銘柄コード
+    """
+    now = now or datetime.now(timezone.utc)
+    max_age = timedelta(days=INCREMENTAL_MAX_AGE_DAYS)
+    existing = get_screened_rows(codes, "company_code, updated_at, verified_at, earnings_date, data_status")
+    cache = get_cache()
+
+    selected = []
+    reasons = {"new": 0, "stale": 0, "earnings": 0, "age": 0}
+    for code in codes:
+        row = existing.get(code)
+        if row is None:
+            reasons["new"] += 1
+            selected.append(code)
+            continue
+        if row.get("data_status") == "stale":
+            reasons["stale"] += 1
+            selected.append(code)
+            continue
+
+        last_fetched = _last_fetched(row, cache, f"{code}.T")
+        earnings_date = _parse_timestamp(row.get("earnings_date"))
+
+        if earnings_date and last_fetched and last_fetched < earnings_date <= now:
+            # 決算後は財務諸表・予想が変わるためキャッシュを破棄して取り直す
+            if cache is not None:
+                cache.invalidate(f"{code}.T")
+            reasons["earnings"] += 1
+            selected.append(code)
+        elif last_fetched is None or now - last_fetched > max_age:
+            reasons["age"] += 1
+            selected.append(code)
+
+    logger.info(
+        f"増分更新対象: {len(selected)}/{len(codes)}件 "
+        f"(新規={reasons['new']}, stale={reasons['stale']}, 決算={reasons['earnings']}, 期限切れ={reasons['age']})"
+    )
+    return selected
+
+
+def _last_fetched(row: dict, cache: Any, ticker: str) -> datetime | None:
+    """
+    最終取得時刻（verified_at・updated_at・キャッシュ保存時刻の最も新しいもの）
+
+    updated_atはデータ変化時のみ更新されるため、変化がなくても取得のたびに更新される
+    verified_atを参照する（レスポンスキャッシュが無効・破棄済みでも再選択しない）
+    """
+    candidates = [_parse_timestamp(row.get("verified_at")), _parse_timestamp(row.get("updated_at"))]
+    if cache is not None:
+        fetched_at = cache.fetched_at(ticker, ENDPOINTS[0])
+        if fetched_at is not None:
+            candidates.append(datetime.fromtimestamp(fetched_at, tz=timezone.utc))
+    candidates = [c for c in candidates if c is not None]
+    return max(candidates) if candidates else None
+
+
+def _parse_timestamp(value: Any) -> datetime | None:
+    """ISO8601文字列をtimezone付きdatetimeに変換（タイムゾーンなしはUTC扱い）"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
@@ -0,0 +1,94 @@
+"""
+バッチ実行ジャーナル
+
+財務バッチの銘柄ごとの進捗（取得・判定・書き込み）を batch_runs / batch_run_items に記録し、
+タイムアウトや異常終了後に --resume <run_id> で未完了の銘柄だけを再実行できるようにする。
+進捗はメモリに溜めて、書き込みバッチのタイミングでまとめて送信する。
+"""
+import threading
+from datetime import datetime
+from loguru import logger
+from db import (
+    create_batch_run,
+    upsert_batch_run_items,
+    get_batch_run,
+    get_unfinished_codes,
+    finish_batch_run,
+)
+
+
+class RunJournal:
+    """
+    1回のバッチ実行の進捗記録
+
+    使用例:
+        journal = RunJournal.start("financial", codes)
+        journal.mark(["7203"], "fetched")
+        journal.flush()
+        journal.finish()
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self._pending: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, mode: str, company_codes: list[str]) -> "RunJournal":
+        """新しい実行を登録"""
+        run_id = datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{mode}"
+        create_batch_run(run_id, mode, company_codes)
+        logger.info(f"実行ID: {run_id}（中断時は --resume {run_id} で再開）")
+        return cls(run_id)
+
+    @classmethod
+    def resume(cls, run_id: str) -> tuple["RunJournal", list[str]]:
+        """
+        既存の実行を再開
+
+        書き込みまで完了していない銘柄（pending・処理途中・failed）を再実行の対象とする。
+
+        Returns:
+            (ジャーナル, 未完了の銘柄コード)
+        """
+        run = get_batch_run(run_id)
+        if run is None:
+            raise ValueError(f"実行IDが見つかりません: {run_id}")
+
+        codes = get_unfinished_codes(run_id)
+        logger.info(f"実行再開: {run_id} 未完了 {len(codes)}/{run.get('total_codes', 0)}件")
+        return cls(run_id), codes
+
+    def mark(self, company_codes: list[str], stage: str) -> None:
+        """銘柄の進捗を記録（送信はflush時）"""
+        with self._lock:
+            for code in company_codes:
+                self._pending[code] = stage
+
+    def flush(self) -> None:
+        """溜まっている進捗を送信（失敗してもバッチは止めない）"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        by_stage: dict[str, list[str]] = {}
+        for code, stage in pending.items():
+            by_stage.setdefault(stage, []).append(code)
+
+        try:
+            for stage, codes in by_stage.items():
+                upsert_batch_run_items(self.run_id, codes, stage)
+        except Exception as e:
+            logger.warning(f"ジャーナル記録失敗: {e}")
+            # 次回のflushで再送する（新しい進捗を優先）
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+
+    def finish(self, status: str = "completed") -> None:
+        """実行の終了を記録"""
+        self.flush()
+        try:
+            finish_batch_run(self.run_id, status)
+        except Exception as e:
+            logger.warning(f"ジャーナル終了記録失敗: {e}")
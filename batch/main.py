@@ -3,27 +3,65 @@
 
 使用方法:
     python main.py --mode financial   # 財務・指標・判定更新（月木06:10）
+    python main.py --mode financial-incremental  # 決算・期限切れ銘柄のみ財務更新
     python main.py --mode price       # 株価・時価総額更新（平日12:10/16:10）
     python main.py --mode full        # フル更新（初回実行時）
     python main.py --mode test        # テスト（少数銘柄で動作確認）
+    python main.py --mode import-shikiho --file shikiho.csv  # 四季報予想CSV/Excelを取り込み
+    python main.py --mode backtest --conditions candidate.json  # 履歴に対して条件セットを再判定
+    python main.py --mode sweep --grid roa=3:8:0.5 --grid per_forward=20,30,40  # 閾値ごとのPASS件数
+
+オプション:
+    --no-cache          レスポンスキャッシュを使わずに全件取得
+    --resume <run_id>   中断した財務バッチの未完了銘柄のみ再実行
+    --file <path>       import-shikiho の取り込みファイル（複数指定可）
+    --unit <単位>       import-shikiho の金額単位（億円/百万円/千円/円、省略時は見出しから判定）
+    --conditions <path> backtest の候補条件（JSON、SCREENING_CONDITIONSへの上書き）
+    --since / --until   backtest の対象期間（YYYY-MM-DD）
+    --grid <項目=値>    sweep の閾値（開始:終了:刻み またはカンマ区切り、複数指定可）
+    --output <path>     backtest / sweep の結果をJSONで保存
+    --prometheus <path> 実行メトリクスを Prometheus textfile 形式でも保存
+    --profile [cprofile|pyinstrument]  プロファイル結果を logs/ に保存
+
+実行ごとにステージ・エンドポイント別の所要時間（p50/p95/p99）、リトライ回数、
+取得データ量を logs/run_<mode>_<日時>.json に保存する。
 """
 import argparse
+import cProfile
+import json
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from loguru import logger
 import sys
 
-from config import BATCH_CONCURRENCY
+from config import (
+    FINANCIAL_FETCH_ENGINE,
+    JUDGE_ENGINE,
+    PRICE_FETCH_BACKEND,
+    SCREENING_CONDITIONS,
+    METRICS_REPORT_DIR,
+    METRICS_PROMETHEUS_PATH,
+)
 from db import (
     get_watched_tickers,
-    upsert_companies,
     get_all_codes,
-    update_price,
+    update_prices,
     mark_stale,
+    get_shares_outstanding,
+    get_all_screened,
+    sync_condition_bits,
 )
-from fetcher import fetch_stock_list, fetch_financial_data, fetch_price_data
-from fetcher.price import fetch_price_batch
-from screener import judge_company, judge_all
+from fetcher import load_stock_list, fetch_financial_data, fetch_price_data
+from fetcher.price import fetch_price_batch, fetch_price_download
+from cache import get_cache, disable_cache
+from incremental import select_incremental_codes
+from screener import judge_company, sweep_thresholds, condition_bits
+from pipeline import FinancialPipeline
+from journal import RunJournal
+from history import record_history
+from backtest import load_conditions, run_backtest, log_report
+from metrics import timer, write_report, write_prometheus
+from shikiho import load_shikiho_estimates, import_shikiho_files, UNIT_TO_OKU
 
 
 def setup_logger():
@@ -42,7 +80,7 @@ def setup_logger():
     )
 
 
-def run_financial_update():
+def run_financial_update(incremental: bool = False, resume_run_id: str | None = None):
     """
     財務・指標・判定更新（メインバッチ）
 
@@ -50,23 +88,50 @@ def run_financial_update():
     2. 各銘柄の財務データ取得（並列）
     3. スクリーニング判定
     4. DB更新
+    2-4はパイプラインで逐次流し、N件/T秒ごとに書き込む
+
+    Args:
+        incremental: Trueなら決算・期限切れ銘柄のみ取得する
+        resume_run_id: 指定時はその実行の未完了銘柄のみ処理する
     """
-    logger.info("=== 財務更新バッチ開始 ===")
+    logger.info("=== 財務更新バッチ開始 (増分) ===" if incremental else "=== 財務更新バッチ開始 ===")
     start_time = datetime.now()
 
-    # 1. 登録銘柄リスト取得
-    logger.info("登録銘柄リスト取得中...")
-    codes = get_watched_tickers()
-
-    if not codes:
-        logger.warning("登録銘柄がありません。銘柄を登録してください。")
-        return
+    if resume_run_id:
+        # 1'. 中断した実行の未完了銘柄を取得
+        journal, codes = RunJournal.resume(resume_run_id)
+        if not codes:
+            logger.info("未完了の銘柄はありません")
+            journal.finish()
+            return
+    else:
+        # 1. 登録銘柄リスト取得
+        logger.info("登録銘柄リスト取得中...")
+        codes = get_watched_tickers()
+
+        if not codes:
+            logger.warning("登録銘柄がありません。銘柄を登録してください。")
+            return
+
+        if incremental:
+            with timer("stage", stage="incremental_select"):
+                codes = select_incremental_codes(codes)
+            if not codes:
+                logger.info("更新が必要な銘柄はありません")
+                return
+
+        try:
+            journal = RunJournal.start("financial-incremental" if incremental else "financial", codes)
+        except Exception as e:
+            logger.warning(f"ジャーナル作成失敗、再開なしで続行: {e}")
+            journal = None
 
     logger.info(f"対象銘柄数: {len(codes)}")
 
-    # 市場・セクター情報取得（JPXリストから）
+    # 市場・セクター情報取得（JPXリストから、変更がなければローカルスナップショット）
     try:
-        stock_df = fetch_stock_list()
+        with timer("stage", stage="stock_list"):
+            stock_df = load_stock_list()
         market_map = dict(zip(stock_df["company_code"].astype(str), stock_df["market"]))
         sector_map = dict(zip(stock_df["company_code"].astype(str), stock_df["sector"]))
     except Exception as e:
@@ -74,49 +139,44 @@ def run_financial_update():
         market_map = {}
         sector_map = {}
 
-    # 2. 財務データ取得（並列実行）
-    logger.info(f"財務データ取得中... (並列数: {BATCH_CONCURRENCY})")
-    financial_data = []
-    failed_codes = []
+    # 四季報予想（1回のクエリで全件読み込み）
+    with timer("stage", stage="shikiho_load"):
+        shikiho_estimates = load_shikiho_estimates()
 
-    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
-        future_to_code = {executor.submit(fetch_financial_data, code): code for code in codes}
+    # fail_mask / missing_mask のビット割り当てを現在の条件に合わせる
+    try:
+        sync_condition_bits(condition_bits())
+    except Exception as e:
+        logger.warning(f"条件ビット割り当ての更新失敗: {e}")
 
-        for future in as_completed(future_to_code):
-            code = future_to_code[future]
-            try:
-                data = future.result()
-                # 市場・セクター情報を追加
-                data["market"] = market_map.get(code, data.get("market", ""))
-                data["sector"] = sector_map.get(code, data.get("sector", ""))
-                financial_data.append(data)
-            except Exception as e:
-                logger.error(f"財務取得例外 {code}: {e}")
-                failed_codes.append(code)
+    # 2-4. 財務データ取得 → スクリーニング判定 → DB更新（ストリーミング）
+    logger.info(f"財務データ取得・判定・DB更新中... (取得: {FINANCIAL_FETCH_ENGINE}, 判定: {JUDGE_ENGINE})")
+    with timer("stage", stage="pipeline"):
+        stats = FinancialPipeline(market_map, sector_map, journal, shikiho_estimates).run(codes)
+    failed_codes = stats["failed_codes"]
 
-    logger.info(f"財務データ取得完了: {len(financial_data)}件, 失敗: {len(failed_codes)}件")
+    logger.info(f"財務データ取得完了: {stats['fetched']}件, 失敗: {len(failed_codes)}件")
+    logger.info(f"DB更新: 送信 {stats['flushed']}件, 変更 {stats['written']}件, 書き込み失敗 {stats['lost']}件")
 
     # 失敗した銘柄をstaleにマーク
     if failed_codes:
-        mark_stale(failed_codes, "FETCH_FAILED")
+        with timer("stage", stage="mark_stale"):
+            mark_stale(failed_codes, "FETCH_FAILED")
 
-    # 3. スクリーニング判定
-    logger.info("スクリーニング判定中...")
-    judged_data = judge_all(financial_data)
+    # 履歴に記録（判定の推移・バックテスト用）
+    with timer("stage", stage="history"):
+        record_history(codes)
 
-    # 4. DB更新
-    logger.info("DB更新中...")
-    upsert_count = upsert_companies(judged_data)
+    if journal is not None:
+        # 失敗した銘柄があれば partial（--resume でfailedの銘柄も再実行される）
+        journal.finish("completed" if not failed_codes and not stats["lost"] else "partial")
 
     # 完了
     elapsed = (datetime.now() - start_time).total_seconds()
     logger.info(f"=== 財務更新バッチ完了 === (所要時間: {elapsed:.1f}秒)")
 
     # サマリー
-    pass_count = sum(1 for d in judged_data if d.get("status") == "PASS")
-    fail_count = sum(1 for d in judged_data if d.get("status") == "FAIL")
-    review_count = sum(1 for d in judged_data if d.get("status") == "REVIEW")
-    logger.info(f"結果: PASS={pass_count}, FAIL={fail_count}, REVIEW={review_count}")
+    logger.info(f"結果: PASS={stats['PASS']}, FAIL={stats['FAIL']}, REVIEW={stats['REVIEW']}")
 
 
 def run_price_update():
@@ -136,30 +196,131 @@ def run_price_update():
 
     logger.info(f"対象銘柄数: {len(codes)}")
 
-    # バッチ取得（100件ずつ）
-    batch_size = 100
+    # バッチ取得（download: 1000件ずつチャートAPI, info: 100件ずつ）
+    logger.info(f"株価取得方式: {PRICE_FETCH_BACKEND}")
+    batch_size = 1000 if PRICE_FETCH_BACKEND == "download" else 100
+    # 発行済株式数（時価総額 = 株価 × 株式数 で算出）
+    with timer("stage", stage="shares_load"):
+        shares_map = get_shares_outstanding()
     updated_count = 0
     failed_codes = []
 
     for i in range(0, len(codes), batch_size):
         batch_codes = codes[i:i + batch_size]
-        price_data = fetch_price_batch(batch_codes)
+        with timer("stage", stage="price_fetch"):
+            if PRICE_FETCH_BACKEND == "download":
+                price_data = fetch_price_download(batch_codes, shares_map)
+            else:
+                price_data = fetch_price_batch(batch_codes, shares_map)
 
+        fetched = []
         for data in price_data:
             if data.get("stock_price") is not None:
-                if update_price(data["company_code"], data):
-                    updated_count += 1
+                fetched.append(data)
             else:
                 failed_codes.append(data["company_code"])
 
+        with timer("stage", stage="price_write"):
+            updated_count += update_prices(fetched)
+
     # 失敗した銘柄をstaleにマーク
     if failed_codes:
-        mark_stale(failed_codes, "PRICE_FETCH_FAILED")
+        with timer("stage", stage="mark_stale"):
+            mark_stale(failed_codes, "PRICE_FETCH_FAILED")
+
+    # 履歴に記録（株価・時価総額の推移）
+    with timer("stage", stage="history"):
+        record_history(codes)
 
     elapsed = (datetime.now() - start_time).total_seconds()
     logger.info(f"=== 株価更新バッチ完了 === 更新: {updated_count}件, 失敗: {len(failed_codes)}件 (所要時間: {elapsed:.1f}秒)")
 
 
+def run_shikiho_import(paths: list[str], unit: str | None = None):
+    """
+    四季報予想インポート
+
+    CSV/Excelをチャンク単位で読み込み、shikiho_estimatesへ一括upsertする
+    """
+    logger.info("=== 四季報インポート開始 ===")
+    start_time = datetime.now()
+
+    stats = import_shikiho_files(paths, unit)
+
+    written = sum(s["written"] for s in stats)
+    invalid = sum(s["invalid"] for s in stats)
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.info(f"=== 四季報インポート完了 === {len(stats)}ファイル, 書き込み: {written}件, 無効: {invalid}件 (所要時間: {elapsed:.1f}秒)")
+
+
+def run_backtest_mode(conditions_path: str | None, since: str | None, until: str | None, output: str | None):
+    """
+    バックテスト（履歴に対して候補条件を再判定、Yahooへのアクセスなし）
+    """
+    logger.info("=== バックテスト開始 ===")
+    start_time = datetime.now()
+
+    conditions = load_conditions(conditions_path)
+    report = run_backtest(conditions, since, until)
+    log_report(report)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"結果を保存: {output}")
+
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.info(f"=== バックテスト完了 === (所要時間: {elapsed:.1f}秒)")
+
+
+def run_sweep(grid_specs: list[str], output: str | None):
+    """
+    閾値スイープ（screened_latestの現在値で閾値ごとのPASS件数を算出）
+    """
+    logger.info("=== 閾値スイープ開始 ===")
+    start_time = datetime.now()
+
+    grid = dict(_parse_grid(spec) for spec in grid_specs)
+    companies = get_all_screened(", ".join(["company_code", "data_status", *SCREENING_CONDITIONS]))
+    result = sweep_thresholds(companies, grid)
+
+    logger.info(f"対象: {result['universe']}銘柄 (欠損・staleなし {result['eligible']}件), 現行条件のPASS: {result['current_pass']}件")
+    for point in result["points"]:
+        thresholds = ", ".join(f"{field}={point[field]}" for field in grid)
+        logger.info(f"  {thresholds}: PASS={point['pass']}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"結果を保存: {output}")
+
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.info(f"=== 閾値スイープ完了 === (所要時間: {elapsed:.1f}秒)")
+
+
+def _parse_grid(spec: str) -> tuple[str, list]:
+    """
+    --grid の指定を解釈
+
+    例: "roa=3:8:0.5" -> ("roa", [3.0, 3.5, ..., 8.0])
+        "per_forward=20,30,40" -> ("per_forward", [20.0, 30.0, 40.0])
+        "listing_date=2010-01-01,2015-01-01" -> 日付はそのまま
+    """
+    field, _, values = spec.partition("=")
+    if not values:
+        raise ValueError(f"--grid の形式が不正です: {spec}")
+
+    if ":" in values:
+        start, stop, step = (float(v) for v in values.split(":"))
+        count = int(round((stop - start) / step)) + 1
+        return field, [round(start + step * i, 6) for i in range(count)]
+
+    items = [v.strip() for v in values.split(",") if v.strip()]
+    if field == "listing_date":
+        return field, items
+    return field, [float(v) for v in items]
+
+
 def run_test():
     """
     テスト実行（少数銘柄で動作確認）
@@ -170,8 +331,9 @@ def run_test():
     test_codes = ["7203", "6758", "7974"]
 
     logger.info("財務データ取得テスト...")
+    shikiho_estimates = load_shikiho_estimates()
     for code in test_codes:
-        data = fetch_financial_data(code)
+        data = fetch_financial_data(code, shikiho_estimates)
         judged = judge_company(data)
         logger.info(f"{code} {judged.get('company_name', 'N/A')}: {judged.get('status')}")
 
@@ -193,28 +355,160 @@ def run_test():
     logger.info("=== テスト完了 ===")
 
 
+def run_mode(args: argparse.Namespace):
+    """指定モードを実行"""
+    if args.resume:
+        run_financial_update(resume_run_id=args.resume)
+    elif args.mode == "financial":
+        run_financial_update()
+    elif args.mode == "financial-incremental":
+        run_financial_update(incremental=True)
+    elif args.mode == "price":
+        run_price_update()
+    elif args.mode == "full":
+        run_financial_update()
+        run_price_update()
+    elif args.mode == "test":
+        run_test()
+    elif args.mode == "import-shikiho":
+        run_shikiho_import(args.file, args.unit)
+    elif args.mode == "backtest":
+        run_backtest_mode(args.conditions, args.since, args.until, args.output)
+    elif args.mode == "sweep":
+        run_sweep(args.grid, args.output)
+
+
+def _start_profiler(kind: str | None):
+    """プロファイラを開始（pyinstrument未インストール時はcProfile）"""
+    if kind is None:
+        return None
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        except ImportError:
+            logger.warning("pyinstrument が見つからないため cProfile を使用")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, kind: str, path_prefix: str):
+    """プロファイル結果を保存（cProfile: .prof, pyinstrument: .html）"""
+    try:
+        Path(path_prefix).parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path = f"{path_prefix}.prof"
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path = f"{path_prefix}.html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        logger.info(f"プロファイル結果を保存: {path}")
+    except Exception as e:
+        logger.warning(f"プロファイル結果の保存失敗: {e}")
+
+
+def _write_metrics(args: argparse.Namespace, report_path: str):
+    """実行メトリクスを保存（失敗してもバッチの結果には影響させない）"""
+    try:
+        path = write_report(report_path, extra={"mode": args.mode, "resume": args.resume})
+        logger.info(f"実行レポートを保存: {path}")
+        if args.prometheus:
+            write_prometheus(args.prometheus)
+    except Exception as e:
+        logger.warning(f"実行レポートの保存失敗: {e}")
+
+
 def main():
     """メイン関数"""
     parser = argparse.ArgumentParser(description="株式スクリーニングバッチ")
     parser.add_argument(
         "--mode",
-        choices=["financial", "price", "full", "test"],
+        choices=["financial", "financial-incremental", "price", "full", "test", "import-shikiho", "backtest", "sweep"],
         default="test",
-        help="実行モード: financial=財務更新, price=株価更新, full=フル更新, test=テスト"
+        help="実行モード: financial=財務更新, financial-incremental=増分財務更新, price=株価更新, full=フル更新, test=テスト, import-shikiho=四季報予想取り込み, backtest=条件のバックテスト, sweep=閾値スイープ"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="レスポンスキャッシュを使わない"
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="中断した財務バッチの実行IDを指定して未完了銘柄のみ再実行"
+    )
+    parser.add_argument(
+        "--file",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="import-shikiho の取り込みファイル（CSV/Excel、複数指定可）"
+    )
+    parser.add_argument(
+        "--unit",
+        choices=list(UNIT_TO_OKU),
+        help="import-shikiho の金額単位（省略時は見出しから判定）"
+    )
+    parser.add_argument(
+        "--conditions",
+        metavar="PATH",
+        help="backtest の候補条件（JSON、SCREENING_CONDITIONSへの上書き、nullで条件除外）"
+    )
+    parser.add_argument("--since", metavar="YYYY-MM-DD", help="backtest の開始日")
+    parser.add_argument("--until", metavar="YYYY-MM-DD", help="backtest の終了日")
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="FIELD=VALUES",
+        help="sweep の閾値（例: roa=3:8:0.5, per_forward=20,30,40）"
+    )
+    parser.add_argument("--output", metavar="PATH", help="backtest / sweep の結果JSONの保存先")
+    parser.add_argument(
+        "--prometheus",
+        metavar="PATH",
+        default=METRICS_PROMETHEUS_PATH or None,
+        help="実行メトリクスを Prometheus textfile 形式で保存"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        choices=["cprofile", "pyinstrument"],
+        help="プロファイル結果を logs/ に保存（既定: cprofile）"
     )
     args = parser.parse_args()
 
+    if args.mode == "sweep" and not args.grid:
+        parser.error("--mode sweep には --grid が必要です")
+
+    if args.mode == "import-shikiho" and not args.file:
+        parser.error("--mode import-shikiho には --file が必要です")
+
     setup_logger()
 
-    if args.mode == "financial":
-        run_financial_update()
-    elif args.mode == "price":
-        run_price_update()
-    elif args.mode == "full":
-        run_financial_update()
-        run_price_update()
-    elif args.mode == "test":
-        run_test()
+    if args.no_cache:
+        disable_cache()
+
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    profiler = _start_profiler(args.profile)
+    try:
+        run_mode(args)
+    finally:
+        if profiler is not None:
+            _stop_profiler(profiler, args.profile, f"{METRICS_REPORT_DIR}/profile_{args.mode}_{run_id}")
+        _write_metrics(args, f"{METRICS_REPORT_DIR}/run_{args.mode}_{run_id}.json")
+
+    # キャッシュのサイズ上限を維持
+    cache = get_cache()
+    if cache is not None:
+        cache.evict()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""
+実行メトリクス
+
+ステージ・エンドポイントごとの所要時間（p50/p95/p99）、リトライ回数、
+取得データのシリアライズサイズ（データ量の推定）、キャッシュヒット数を集計し、実行レポート（JSON）と
+Prometheus textfile 形式で出力する。
+
+使用例:
+    with timer("endpoint", endpoint="info"):
+        ...
+
+    @timed("stage", stage="write")
+    def upsert_companies(...): ...
+
+    count("cache", result="hit")
+    write_report("logs/run_financial_20240101-061000.json")
+"""
+import functools
+import json
+import math
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+# Prometheusヒストグラムのバケット境界（秒）
+HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+# メトリクス名の接頭辞（Prometheus出力用）
+METRIC_PREFIX = "newstock_batch"
+
+
+class Histogram:
+    """所要時間の分布（全サンプルを保持し、出力時にパーセンタイルを計算）"""
+
+    def __init__(self):
+        self.samples: list[float] = []
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total += seconds
+
+    def percentile(self, p: float) -> float:
+        """最近傍順位法のパーセンタイル"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": len(self.samples),
+            "total": round(self.total, 4),
+            "p50": round(self.percentile(50), 4),
+            "p95": round(self.percentile(95), 4),
+            "p99": round(self.percentile(99), 4),
+            "max": round(max(self.samples), 4) if self.samples else 0.0,
+        }
+
+
+class MetricsRegistry:
+    """スレッドセーフなメトリクス集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple, Histogram] = {}
+        self._counters: dict[tuple, float] = {}
+        self.started_at = time.time()
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def report(self) -> dict[str, Any]:
+        """集計結果をdictで返す"""
+        with self._lock:
+            histograms = {key: Histogram() for key in self._histograms}
+            for key, histogram in self._histograms.items():
+                histograms[key].samples = list(histogram.samples)
+                histograms[key].total = histogram.total
+            counters = dict(self._counters)
+
+        return {
+            "started_at": self.started_at,
+            "elapsed": round(time.time() - self.started_at, 2),
+            "timings": [
+                {"name": name, "labels": dict(labels), **histogram.summary()}
+                for (name, labels), histogram in sorted(histograms.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus textfile形式で出力"""
+        with self._lock:
+            histograms = {key: (list(h.samples), h.total) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name in sorted({name for name, _ in histograms}):
+            metric = f"{METRIC_PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (hist_name, labels), (samples, total) in sorted(histograms.items()):
+                if hist_name != name:
+                    continue
+                ordered = sorted(samples)
+                cumulative = 0
+                for bound in HISTOGRAM_BUCKETS:
+                    while cumulative < len(ordered) and ordered[cumulative] <= bound:
+                        cumulative += 1
+                    lines.append(f"{metric}_bucket{_format_labels(labels, le=str(bound))} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(labels, le='+Inf')} {len(ordered)}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {len(ordered)}")
+
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """プロセス共通のメトリクスを取得"""
+    return _registry
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    """所要時間を記録"""
+    _registry.observe(name, seconds, **labels)
+
+
+def count(name: str, amount: float = 1, **labels: str) -> None:
+    """カウンタを加算"""
+    _registry.count(name, amount, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels: str) -> Iterator[None]:
+    """ブロックの所要時間を記録（例外時も記録し、outcome=errorを付ける）"""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, **labels, outcome=outcome)
+
+
+def timed(name: str, **labels: str):
+    """関数の所要時間を記録するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_serialized_size(endpoint: str, value: Any) -> None:
+    """取得データ量の推定を記録（通信量ではなく、デコード後データをpickleしたサイズ）"""
+    try:
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return
+    count("serialized_bytes", size, endpoint=endpoint)
+
+
+def retry_counter(name: str):
+    """tenacityのbefore_sleepに渡すリトライ回数カウンタ"""
+    def before_sleep(retry_state: Any) -> None:
+        count("retries", target=name)
+    return before_sleep
+
+
+def write_report(path: str | Path, extra: dict[str, Any] | None = None) -> Path:
+    """実行レポートをJSONで保存"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    report = {**(extra or {}), **_registry.report()}
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def write_prometheus(path: str | Path) -> Path:
+    """Prometheus textfile を保存（node_exporterが途中の内容を読まないよう一時ファイル経由）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(_registry.prometheus(), encoding="utf-8")
+    tmp.replace(path)
+    return path
+
+
+def _label_key(labels: dict[str, str]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: tuple, **extra: str) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _escape(value: Any) -> str:
+    """Prometheusのラベル値をエスケープ"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,229 @@
+"""
+財務バッチのストリーミングパイプライン
+
+取得 → 判定 → 書き込み の3段を上限付きキューでつなぎ、
+全件をメモリに溜めずに流す。書き込みはN件またはT秒ごとにまとめて行い、
+書き込み失敗時に失われるのは該当バッチのみとする。
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable
+from loguru import logger
+from config import (
+    BATCH_CONCURRENCY,
+    FINANCIAL_FETCH_ENGINE,
+    JUDGE_ENGINE,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_FLUSH_ROWS,
+    PIPELINE_FLUSH_SECONDS,
+)
+from db import upsert_companies
+from fetcher import fetch_financial_data
+from fetcher.async_financial import FinancialFetcher
+from screener import judge_all, judge_all_vectorized
+from journal import RunJournal
+from metrics import observe, timer
+
+# キュー終端の番兵
+_DONE = object()
+
+# 判定ステージで一度にまとめる最大件数
+JUDGE_BATCH_SIZE = 50
+
+
+class FinancialPipeline:
+    """
+    取得 → 判定 → 書き込み のストリーミング処理
+
+    使用例:
+        stats = FinancialPipeline(market_map, sector_map, journal, shikiho_estimates).run(codes)
+
+    journalを渡すと銘柄ごとの進捗（fetched/judged/written/failed）を記録する。
+    """
+
+    def __init__(
+        self,
+        market_map: dict[str, str] | None = None,
+        sector_map: dict[str, str] | None = None,
+        journal: RunJournal | None = None,
+        shikiho_estimates: dict[str, dict] | None = None,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        flush_rows: int = PIPELINE_FLUSH_ROWS,
+        flush_seconds: float = PIPELINE_FLUSH_SECONDS,
+    ):
+        self.market_map = market_map or {}
+        self.sector_map = sector_map or {}
+        self.journal = journal
+        self.shikiho_estimates = shikiho_estimates
+        self.queue_size = queue_size
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+
+    def run(self, codes: list[str]) -> dict[str, Any]:
+        """
+        パイプラインを実行
+
+        Returns:
+            集計（fetched, failed_codes, flushed, written, lost, PASS/FAIL/REVIEW件数）
+            written は変化があり実際にupsertされた件数
+        """
+        return asyncio.run(self._run(codes))
+
+    async def _run(self, codes: list[str]) -> dict[str, Any]:
+        self.stats = {
+            "fetched": 0,
+            "failed_codes": [],
+            "flushed": 0,
+            "written": 0,
+            "lost": 0,
+            "PASS": 0,
+            "FAIL": 0,
+            "REVIEW": 0,
+        }
+        fetched_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        judged_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        fetch, concurrency, close = self._open_fetcher()
+        self._write_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            await asyncio.gather(
+                self._fetch_stage(codes, fetch, concurrency, fetched_queue),
+                self._judge_stage(fetched_queue, judged_queue),
+                self._write_stage(judged_queue),
+            )
+        finally:
+            close()
+            self._write_executor.shutdown(wait=True)
+
+        return self.stats
+
+    def _open_fetcher(self) -> tuple[Callable[[str], Awaitable[dict | None]], int, Callable[[], None]]:
+        """取得エンジンに応じた (取得関数, 並列数, 終了処理) を返す"""
+        if FINANCIAL_FETCH_ENGINE == "async":
+            fetcher = FinancialFetcher(shikiho_estimates=self.shikiho_estimates)
+            fetcher.open()
+            return fetcher.fetch_safe, fetcher.max_tickers, fetcher.close
+
+        executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+
+        async def fetch(code: str) -> dict | None:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, fetch_financial_data, code, self.shikiho_estimates)
+            except Exception as e:
+                logger.error(f"財務取得例外 {code}: {e}")
+                return None
+
+        return fetch, BATCH_CONCURRENCY, lambda: executor.shutdown(wait=True)
+
+    async def _fetch_stage(
+        self,
+        codes: list[str],
+        fetch: Callable[[str], Awaitable[dict | None]],
+        concurrency: int,
+        out: asyncio.Queue,
+    ) -> None:
+        """取得ステージ（並列数分のワーカーが銘柄コードを順に処理）"""
+        pending = iter(codes)
+
+        async def worker() -> None:
+            for code in pending:
+                started = time.perf_counter()
+                data = await fetch(code)
+                observe("stage", time.perf_counter() - started, stage="fetch")
+                if data is None:
+                    self.stats["failed_codes"].append(code)
+                    self._mark([code], "failed")
+                    continue
+                # 取得失敗のstaleレコードは書き込むが、失敗として数える（ジャーナルは書き込み時にfailed）
+                if data.get("data_status") == "stale":
+                    self.stats["failed_codes"].append(code)
+                else:
+                    self.stats["fetched"] += 1
+                # 市場・セクター情報を追加
+                data["market"] = self.market_map.get(code, data.get("market", ""))
+                data["sector"] = self.sector_map.get(code, data.get("sector", ""))
+                self._mark([code], "fetched")
+                await out.put(data)
+
+        await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+        await out.put(_DONE)
+
+    async def _judge_stage(self, inbound: asyncio.Queue, out: asyncio.Queue) -> None:
+        """判定ステージ（キューに溜まっている分をまとめて判定）"""
+        done = False
+        while not done:
+            batch = [await inbound.get()]
+            while len(batch) < JUDGE_BATCH_SIZE and not inbound.empty():
+                batch.append(inbound.get_nowait())
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+            if not batch:
+                continue
+
+            with timer("stage", stage="judge"):
+                if JUDGE_ENGINE == "vectorized":
+                    judged = judge_all_vectorized(batch, log_summary=False)
+                else:
+                    judged = judge_all(batch, log_summary=False)
+
+            self._mark([r["company_code"] for r in judged], "judged")
+            for record in judged:
+                self.stats[record["status"]] += 1
+                await out.put(record)
+
+        await out.put(_DONE)
+
+    async def _write_stage(self, inbound: asyncio.Queue) -> None:
+        """書き込みステージ（flush_rows件またはflush_seconds秒ごとにupsert）"""
+        buffer = []
+        first_at = 0.0
+        done = False
+        while not done:
+            timeout = None
+            if buffer:
+                timeout = max(0.0, first_at + self.flush_seconds - time.monotonic())
+            try:
+                item = await asyncio.wait_for(inbound.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _DONE:
+                done = True
+            elif item is not None:
+                if not buffer:
+                    first_at = time.monotonic()
+                buffer.append(item)
+
+            expired = buffer and time.monotonic() - first_at >= self.flush_seconds
+            if buffer and (done or expired or len(buffer) >= self.flush_rows):
+                await self._flush(buffer)
+                buffer = []
+
+    async def _flush(self, records: list[dict]) -> None:
+        """1バッチ分を書き込み（失敗しても後続のバッチは継続）"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            written = await loop.run_in_executor(self._write_executor, upsert_companies, records)
+            observe("stage", time.perf_counter() - started, stage="write")
+            self.stats["flushed"] += len(records)
+            self.stats["written"] += written
+            # 取得失敗でstaleとして書いた銘柄は --resume で再取得するためfailed扱い
+            for record in records:
+                self._mark([record["company_code"]], "failed" if record.get("data_status") == "stale" else "written")
+        except Exception as e:
+            self.stats["lost"] += len(records)
+            logger.error(f"upsert失敗（{len(records)}件）: {e}")
+
+        if self.journal is not None:
+            started = time.perf_counter()
+            await loop.run_in_executor(self._write_executor, self.journal.flush)
+            observe("stage", time.perf_counter() - started, stage="journal")
+
+    def _mark(self, codes: list[str], stage: str) -> None:
+        """ジャーナルに進捗を記録"""
+        if self.journal is not None:
+            self.journal.mark(codes, stage)
@@ -1,4 +1,17 @@
 """スクリーニング判定モジュール"""
-from .judge import judge_company, judge_all
+from .judge import judge_company, judge_all, condition_bits, all_condition_bits
+from .vectorized import judge_all_vectorized, judge_frame, compile_conditions, evaluate_numeric
+from .sweep import ThresholdSweep, sweep_thresholds
 
-__all__ = ["judge_company", "judge_all"]
+__all__ = [
+    "judge_company",
+    "judge_all",
+    "condition_bits",
+    "all_condition_bits",
+    "judge_all_vectorized",
+    "judge_frame",
+    "compile_conditions",
+    "evaluate_numeric",
+    "ThresholdSweep",
+    "sweep_thresholds",
+]
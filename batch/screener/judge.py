@@ -25,24 +25,25 @@ def judge_company(data: dict) -> dict:
     review_reasons = data.get("review_reasons", []) or []
     failed_reasons = data.get("failed_reasons", []) or []
 
-    # 既にデータ取得失敗でstaleの場合
+    # 既にデータ取得失敗でstaleの場合（全条件を欠損扱いにし、全条件通過と区別する）
     if data.get("data_status") == "stale":
         return {
             **data,
             "status": "REVIEW",
             "review_reasons": review_reasons or [{"code": "FETCH_FAILED", "message": "データ取得失敗"}],
             "failed_reasons": [],
+            "fail_mask": 0,
+            "missing_mask": all_condition_bits(),
         }
 
     # 各条件をチェック
     has_missing = len(review_reasons) > 0  # 既に欠損理由がある場合
     has_failed = False
+    # 条件ごとのビット（condition_bits の順）
+    fail_mask = 0
+    missing_mask = 0
 
-    for field, condition in SCREENING_CONDITIONS.items():
-        # 表示専用フィールドはスキップ
-        if field in DISPLAY_ONLY_FIELDS:
-            continue
-
+    for bit, (field, condition) in enumerate(_judged_conditions()):
         value = data.get(field)
         threshold = condition["value"]
         op = condition["op"]
@@ -51,6 +52,7 @@ def judge_company(data: dict) -> dict:
         # 欠損チェック
         if value is None:
             has_missing = True
+            missing_mask |= 1 << bit
             # review_reasonsに既に理由がある場合はスキップ
             if not any(r.get("field") == field for r in review_reasons):
                 review_reasons.append({
@@ -66,6 +68,7 @@ def judge_company(data: dict) -> dict:
 
         if not passed:
             has_failed = True
+            fail_mask |= 1 << bit
             # 条件未達の理由コードを生成
             reason_code = _get_fail_reason_code(field, op, threshold)
             failed_reasons.append({
@@ -90,6 +93,8 @@ def judge_company(data: dict) -> dict:
         "status": status,
         "review_reasons": review_reasons if review_reasons else [],
         "failed_reasons": failed_reasons if failed_reasons else [],
+        "fail_mask": fail_mask,
+        "missing_mask": missing_mask,
         "data_status": "fresh",
     }
 
@@ -97,6 +102,32 @@ def judge_company(data: dict) -> dict:
     return result
 
 
+def _judged_conditions() -> list[tuple[str, dict]]:
+    """判定対象の条件（表示専用を除く、SCREENING_CONDITIONSの順）"""
+    return [
+        (field, condition) for field, condition in SCREENING_CONDITIONS.items()
+        if field not in DISPLAY_ONLY_FIELDS
+    ]
+
+
+def condition_bits() -> list[dict]:
+    """
+    fail_mask / missing_mask のビット割り当て
+
+    Returns:
+        [{bit, field, name, op}, ...]（bit番目 = 1 << bit）
+    """
+    return [
+        {"bit": bit, "field": field, "name": condition.get("name", field), "op": condition["op"]}
+        for bit, (field, condition) in enumerate(_judged_conditions())
+    ]
+
+
+def all_condition_bits() -> int:
+    """全条件のビット（staleの行のmissing_mask = 判定できない）"""
+    return (1 << len(_judged_conditions())) - 1
+
+
 def _check_condition(value: Any, op: str, threshold: Any) -> bool:
     """条件を判定"""
     # 日付の比較
@@ -151,12 +182,13 @@ def _format_value(value: Any) -> str:
     return str(value)
 
 
-def judge_all(companies: list[dict]) -> list[dict]:
+def judge_all(companies: list[dict], log_summary: bool = True) -> list[dict]:
     """
     複数社の判定を一括実行
 
     Args:
         companies: 財務データのリスト
+        log_summary: 判定件数をINFOログに出すか（ストリーミング時はFalse）
 
     Returns:
         判定結果のリスト
@@ -177,7 +209,8 @@ def judge_all(companies: list[dict]) -> list[dict]:
         else:
             review_count += 1
 
-    logger.info(f"判定完了: PASS={pass_count}, FAIL={fail_count}, REVIEW={review_count}")
+    if log_summary:
+        logger.info(f"判定完了: PASS={pass_count}, FAIL={fail_count}, REVIEW={review_count}")
     return results
 
 
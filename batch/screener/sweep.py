@@ -0,0 +1,192 @@
+"""
+閾値スイープ（what-if分析）
+
+「ROA > X かつ PER(来期) < Y ならPASSは何件か」を閾値の格子全体について求める。
+条件ごとに指標値をソート済み配列として1回だけ前計算し、
+- 1条件: searchsorted による累積件数
+- 複数条件: 格子点ごとの通過ビットセットの積（AND）とpopcount
+で件数を出すため、格子点ごとに全銘柄を再判定しない。
+
+判定は指標値のみに基づく（stale・欠損はREVIEWとしてPASSに含めない）。
+"""
+import itertools
+from typing import Any
+import numpy as np
+from .vectorized import compile_conditions, evaluate_numeric
+
+# 1バイト中の立っているビット数
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# 格子点数の上限（ビットセット配列のメモリ上限の目安）
+MAX_GRID_POINTS = 200_000
+
+
+class ThresholdSweep:
+    """
+    閾値スイープ
+
+    使用例:
+        sweep = ThresholdSweep(companies)
+        sweep.count("roa", [3.0, 4.5, 6.0])                    # 1条件の累積件数
+        sweep.grid({"roa": [3.0, 4.5], "per_forward": [20, 40]})  # 複数条件の格子
+    """
+
+    def __init__(self, companies: list[dict], conditions: dict | None = None):
+        self.compiled = {c["field"]: c for c in compile_conditions(conditions)}
+        n = len(companies)
+        self.size = n
+
+        stale = np.fromiter((c.get("data_status") == "stale" for c in companies), dtype=bool, count=n)
+        self.values: dict[str, np.ndarray] = {}
+        self.missing: dict[str, np.ndarray] = {}
+        self.passed: dict[str, np.ndarray] = {}
+        for field, cond in self.compiled.items():
+            values = _to_array([c.get(field) for c in companies], cond["is_date"])
+            missing, failed = evaluate_numeric(cond, values)
+            self.values[field] = values
+            self.missing[field] = missing
+            self.passed[field] = ~missing & ~failed
+
+        # 閾値に関係なくPASSになり得ない銘柄（stale・いずれかの条件が欠損）を除く
+        self.eligible = ~stale
+        for missing in self.missing.values():
+            self.eligible &= ~missing
+
+        # 条件ごとのソート済み値（その条件以外をすべて満たす銘柄のみ）
+        self._sorted = {
+            field: np.sort(_sortable(values[self.base_mask([field])]))
+            for field, values in self.values.items()
+        }
+
+    def base_mask(self, swept: list[str]) -> np.ndarray:
+        """スイープ対象以外の条件をすべて満たす銘柄"""
+        mask = self.eligible.copy()
+        for field, passed in self.passed.items():
+            if field not in swept:
+                mask &= passed
+        return mask
+
+    def count(self, field: str, thresholds: list[Any], op: str | None = None) -> list[int]:
+        """
+        1条件の閾値ごとのPASS件数（他の条件は現行のまま）
+
+        ソート済み値に対する二分探索で各閾値の通過件数を求める。
+        """
+        op = op or self._condition(field)["op"]
+        ordered = self._sorted[field]
+        keys = _sortable(_to_array(thresholds, self._condition(field)["is_date"]))
+        n = len(ordered)
+        if op == ">":
+            counts = n - np.searchsorted(ordered, keys, side="right")
+        elif op == ">=":
+            counts = n - np.searchsorted(ordered, keys, side="left")
+        elif op == "<":
+            counts = np.searchsorted(ordered, keys, side="left")
+        elif op == "<=":
+            counts = np.searchsorted(ordered, keys, side="right")
+        elif op == "==":
+            counts = np.searchsorted(ordered, keys, side="right") - np.searchsorted(ordered, keys, side="left")
+        else:
+            raise ValueError(f"未知の演算子: {op}")
+        return [int(c) for c in counts]
+
+    def grid(self, grid: dict[str, list[Any]], ops: dict[str, str] | None = None) -> list[dict[str, Any]]:
+        """
+        複数条件の閾値格子ごとのPASS件数
+
+        Args:
+            grid: フィールド -> 閾値リスト
+            ops: フィールド -> 演算子（省略時は条件の演算子）
+
+        Returns:
+            [{フィールド: 閾値, ..., "pass": 件数}, ...]
+        """
+        ops = ops or {}
+        fields = list(grid)
+        shape = [len(grid[f]) for f in fields]
+        if int(np.prod(shape)) > MAX_GRID_POINTS:
+            raise ValueError(f"格子点が多すぎます: {int(np.prod(shape))} > {MAX_GRID_POINTS}")
+
+        base = np.packbits(self.base_mask(fields))
+        # 条件ごとに (閾値数, バイト数) の通過ビットセットを作り、ブロードキャストでANDする
+        combined = base
+        for axis, field in enumerate(fields):
+            bits = np.stack([
+                np.packbits(self._passing(field, threshold, ops.get(field)))
+                for threshold in grid[field]
+            ])
+            index = [np.newaxis] * len(fields) + [slice(None)]
+            index[axis] = slice(None)
+            combined = combined & bits[tuple(index)]
+
+        counts = _POPCOUNT[combined].sum(axis=-1, dtype=np.int64)
+        results = []
+        for position in itertools.product(*[range(s) for s in shape]):
+            point = {field: grid[field][i] for field, i in zip(fields, position)}
+            point["pass"] = int(counts[position])
+            results.append(point)
+        return results
+
+    def _passing(self, field: str, threshold: Any, op: str | None = None) -> np.ndarray:
+        """閾値を差し替えたときの通過マスク"""
+        cond = {**self._condition(field), "op": op or self._condition(field)["op"]}
+        if cond["is_date"]:
+            cond["threshold_date"] = np.datetime64(str(threshold), "D")
+        else:
+            cond["threshold"] = threshold
+        missing, failed = evaluate_numeric(cond, self.values[field])
+        return ~missing & ~failed
+
+    def _condition(self, field: str) -> dict:
+        if field not in self.compiled:
+            raise ValueError(f"スクリーニング条件にない項目です: {field}")
+        return self.compiled[field]
+
+
+def sweep_thresholds(
+    companies: list[dict],
+    grid: dict[str, list[Any]],
+    conditions: dict | None = None,
+    ops: dict[str, str] | None = None,
+) -> dict[str, Any]:
+    """
+    閾値スイープを実行（JSONにそのまま変換できる形で返す）
+
+    Args:
+        companies: screened_latest の行
+        grid: フィールド -> 閾値リスト（例: {"roa": [3, 4.5, 6], "per_forward": [20, 30, 40]}）
+        conditions: 条件dict（省略時はSCREENING_CONDITIONS）
+        ops: フィールド -> 演算子の上書き
+
+    Returns:
+        {"universe", "eligible", "current_pass", "points": [{フィールド: 閾値, ..., "pass": 件数}]}
+    """
+    sweep = ThresholdSweep(companies, conditions)
+    return {
+        "universe": sweep.size,
+        "eligible": int(sweep.eligible.sum()),
+        "current_pass": int(sweep.base_mask([]).sum()),
+        "points": sweep.grid(grid, ops),
+    }
+
+
+def _to_array(values: list[Any], is_date: bool) -> np.ndarray:
+    """指標値リストを判定用の配列に変換（欠損はNaN/NaT）"""
+    if is_date:
+        return np.array([_to_date(v) for v in values], dtype="datetime64[D]")
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+
+def _to_date(value: Any) -> np.datetime64:
+    """日付文字列をdatetime64に変換（パース不可はNaT）"""
+    try:
+        return np.datetime64(str(value)[:10], "D") if value else np.datetime64("NaT", "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+def _sortable(values: np.ndarray) -> np.ndarray:
+    """ソート・二分探索用に日付を整数（日数）に変換"""
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[D]").astype(np.int64)
+    return values
@@ -0,0 +1,328 @@
+"""
+スクリーニング判定ロジック（列指向・一括判定）
+
+judge_company と同じ判定を全銘柄まとめて行う。
+条件ごとに閾値を1回だけコンパイルし、NumPyのブール配列で
+欠損/未達を一括計算してから理由リストを組み立てる。
+出力は judge_company / judge_all と完全に一致させる。
+"""
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from loguru import logger
+import sys
+sys.path.append("..")
+from config import SCREENING_CONDITIONS, DISPLAY_ONLY_FIELDS
+from .judge import _check_condition, _get_fail_reason_code, _format_value
+
+# 数値として一括比較できる型（それ以外はjudge_companyの判定に委ねる）
+_NUMERIC_TYPES = (int, float, np.integer, np.floating)
+
+_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+
+def compile_conditions(conditions: dict | None = None) -> list[dict]:
+    """
+    スクリーニング条件をコンパイル
+
+    閾値の日付パースや理由コード生成を条件ごとに1回だけ行う。
+
+    Args:
+        conditions: 条件dict（省略時はSCREENING_CONDITIONS）
+
+    Returns:
+        コンパイル済み条件のリスト（判定順）
+    """
+    if conditions is None:
+        conditions = SCREENING_CONDITIONS
+
+    compiled = []
+    for field, condition in conditions.items():
+        if field in DISPLAY_ONLY_FIELDS:
+            continue
+
+        op = condition["op"]
+        threshold = condition["value"]
+        is_date = isinstance(threshold, str) and "-" in str(threshold)
+        threshold_date = None
+        if is_date:
+            try:
+                threshold_date = np.datetime64(datetime.strptime(threshold, "%Y-%m-%d"))
+            except ValueError:
+                threshold_date = None
+
+        compiled.append({
+            "field": field,
+            "op": op,
+            "threshold": threshold,
+            "name": condition.get("name", field),
+            "is_date": is_date,
+            "threshold_date": threshold_date,
+            "code": _get_fail_reason_code(field, op, threshold),
+            "condition": f"{op} {threshold}",
+            "bit": len(compiled),
+        })
+
+    return compiled
+
+
+def evaluate_condition(compiled: dict, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    1条件を全銘柄に対して一括判定
+
+    Args:
+        compiled: compile_conditionsの要素
+        values: 指標値の配列（dtype=object、欠損はNone）
+
+    Returns:
+        (欠損マスク, 未達マスク)
+    """
+    missing = np.equal(values, None)
+    passed = np.zeros(len(values), dtype=bool)
+    compare = _OPS.get(compiled["op"])
+
+    if compiled["is_date"]:
+        is_fast = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+        if compiled["threshold_date"] is not None and compare is not None and is_fast.any():
+            parsed = np.array([_parse_date(v) for v in values[is_fast]], dtype="datetime64[us]")
+            # パース不可（NaT）は judge_company と同様に未達扱い
+            passed[is_fast] = compare(parsed, compiled["threshold_date"]) & ~np.isnat(parsed)
+        elif compiled["threshold_date"] is None:
+            # 閾値自体がパース不可の場合は judge_company 側で全件Falseになる
+            is_fast[:] = True
+    else:
+        is_fast = np.fromiter(
+            (isinstance(v, _NUMERIC_TYPES) for v in values), dtype=bool, count=len(values)
+        )
+        if compare is not None and is_fast.any():
+            numeric = values[is_fast].astype(float)
+            with np.errstate(invalid="ignore"):
+                passed[is_fast] = compare(numeric, float(compiled["threshold"]))
+
+    # 数値/日付文字列以外（Decimal等）は1件ずつ従来ロジックで判定
+    fallback = ~(is_fast | missing)
+    if compare is None:
+        fallback = ~missing
+    for i in np.flatnonzero(fallback):
+        passed[i] = _check_condition(values[i], compiled["op"], compiled["threshold"])
+
+    failed = ~missing & ~passed
+    return missing, failed
+
+
+def evaluate_numeric(compiled: dict, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    1条件を数値配列に対して一括判定（形状は任意）
+
+    履歴など型が揃っているデータ向けの高速版。
+
+    Args:
+        compiled: compile_conditionsの要素
+        values: float配列（欠損はNaN）。日付条件はdatetime64配列（欠損はNaT）
+
+    Returns:
+        (欠損マスク, 未達マスク)
+    """
+    compare = _OPS.get(compiled["op"])
+    if compiled["is_date"]:
+        missing = np.isnat(values)
+        if compare is None or compiled["threshold_date"] is None:
+            passed = np.zeros(values.shape, dtype=bool)
+        else:
+            passed = compare(values, compiled["threshold_date"])
+    else:
+        missing = np.isnan(values)
+        if compare is None:
+            passed = np.zeros(values.shape, dtype=bool)
+        else:
+            with np.errstate(invalid="ignore"):
+                passed = compare(values, float(compiled["threshold"]))
+
+    failed = ~missing & ~passed
+    return missing, failed
+
+
+@lru_cache(maxsize=65536)
+def _parse_date(value: str) -> np.datetime64:
+    """上場日文字列をパース（同一値はキャッシュ）"""
+    try:
+        return np.datetime64(datetime.strptime(value, "%Y-%m-%d"))
+    except (ValueError, TypeError):
+        return np.datetime64("NaT")
+
+
+def _column(companies: list[dict], field: str) -> np.ndarray:
+    """レコードリストから1列をobject配列として取り出す（欠損キーはNone）"""
+    column = np.empty(len(companies), dtype=object)
+    column[:] = [c.get(field) for c in companies]
+    return column
+
+
+def _judge_columns(
+    columns: dict[str, np.ndarray],
+    review_in: list[list],
+    failed_in: list[list],
+    stale: np.ndarray,
+    compiled: list[dict],
+) -> tuple[np.ndarray, list[list], list[list], np.ndarray, np.ndarray]:
+    """列データに対して判定を実行し、(status, review_reasons, failed_reasons, fail_mask, missing_mask)を返す"""
+    n = len(stale)
+    review_reasons = [list(r) for r in review_in]
+    failed_reasons = [list(r) for r in failed_in]
+    has_missing = np.fromiter((len(r) > 0 for r in review_in), dtype=bool, count=n)
+    has_failed = np.zeros(n, dtype=bool)
+    fail_mask = np.zeros(n, dtype=np.int64)
+    missing_mask = np.zeros(n, dtype=np.int64)
+    active = ~stale
+
+    for cond in compiled:
+        field = cond["field"]
+        values = columns.get(field)
+        if values is None:
+            values = np.full(n, None, dtype=object)
+
+        missing, failed = evaluate_condition(cond, values)
+        missing &= active
+        failed &= active
+        has_missing |= missing
+        has_failed |= failed
+        missing_mask |= missing.astype(np.int64) << cond["bit"]
+        fail_mask |= failed.astype(np.int64) << cond["bit"]
+        # staleの行は全条件を欠損扱い（judge_companyと同じ）
+        missing_mask |= stale.astype(np.int64) << cond["bit"]
+
+        for i in np.flatnonzero(missing):
+            # review_reasonsに既に理由がある場合はスキップ
+            if not any(r.get("field") == field for r in review_in[i]):
+                review_reasons[i].append({
+                    "code": "DATA_MISSING",
+                    "field": field,
+                    "name": cond["name"],
+                    "message": "データ取得不可（要確認）"
+                })
+
+        for i in np.flatnonzero(failed):
+            value = values[i]
+            failed_reasons[i].append({
+                "code": cond["code"],
+                "field": field,
+                "name": cond["name"],
+                "value": round(value, 2) if isinstance(value, (int, float)) else value,
+                "condition": cond["condition"],
+                "message": f"{cond['name']}: {_format_value(value)} は条件 {cond['condition']} を満たさない"
+            })
+
+    # ステータス決定（優先順位: REVIEW > FAIL > PASS）
+    status = np.where(has_missing, "REVIEW", np.where(has_failed, "FAIL", "PASS")).astype(object)
+
+    # 既にデータ取得失敗でstaleの場合
+    for i in np.flatnonzero(stale):
+        status[i] = "REVIEW"
+        review_reasons[i] = list(review_in[i]) or [{"code": "FETCH_FAILED", "message": "データ取得失敗"}]
+        failed_reasons[i] = []
+
+    return status, review_reasons, failed_reasons, fail_mask, missing_mask
+
+
+def judge_frame(df: pd.DataFrame, conditions: dict | None = None) -> pd.DataFrame:
+    """
+    DataFrame全行のスクリーニング判定を一括で行う
+
+    Args:
+        df: 財務データ（1行1社、カラムはscreened_latestに対応）
+        conditions: 条件dict（省略時はSCREENING_CONDITIONS）
+
+    Returns:
+        status, review_reasons, failed_reasons, data_status を付与したDataFrame
+    """
+    compiled = compile_conditions(conditions)
+    n = len(df)
+    columns = {
+        c["field"]: df[c["field"]].to_numpy(dtype=object)
+        for c in compiled if c["field"] in df.columns
+    }
+    review_in = _reason_lists(df, "review_reasons", n)
+    failed_in = _reason_lists(df, "failed_reasons", n)
+    if "data_status" in df.columns:
+        stale = (df["data_status"] == "stale").to_numpy(dtype=bool)
+    else:
+        stale = np.zeros(n, dtype=bool)
+
+    status, review_reasons, failed_reasons, fail_mask, missing_mask = _judge_columns(
+        columns, review_in, failed_in, stale, compiled
+    )
+
+    result = df.copy()
+    result["status"] = status
+    result["review_reasons"] = review_reasons
+    result["failed_reasons"] = failed_reasons
+    result["fail_mask"] = fail_mask
+    result["missing_mask"] = missing_mask
+    data_status = result["data_status"].to_numpy(dtype=object) if "data_status" in result.columns else np.full(n, None, dtype=object)
+    result["data_status"] = np.where(stale, data_status, "fresh")
+    return result
+
+
+def _reason_lists(df: pd.DataFrame, column: str, n: int) -> list[list]:
+    """理由カラムをリストのリストに変換（欠損は空リスト）"""
+    if column not in df.columns:
+        return [[] for _ in range(n)]
+    return [r if isinstance(r, list) else [] for r in df[column].tolist()]
+
+
+def judge_all_vectorized(companies: list[dict], conditions: dict | None = None, log_summary: bool = True) -> list[dict]:
+    """
+    複数社の判定を列指向で一括実行（judge_allと同じ出力）
+
+    Args:
+        companies: 財務データのリスト
+        conditions: 条件dict（省略時はSCREENING_CONDITIONS）
+        log_summary: 判定件数をINFOログに出すか（ストリーミング時はFalse）
+
+    Returns:
+        判定結果のリスト
+    """
+    if not companies:
+        if log_summary:
+            logger.info("判定完了: PASS=0, FAIL=0, REVIEW=0")
+        return []
+
+    compiled = compile_conditions(conditions)
+    columns = {c["field"]: _column(companies, c["field"]) for c in compiled}
+    review_in = [c.get("review_reasons", []) or [] for c in companies]
+    failed_in = [c.get("failed_reasons", []) or [] for c in companies]
+    stale = np.fromiter(
+        (c.get("data_status") == "stale" for c in companies), dtype=bool, count=len(companies)
+    )
+
+    status, review_reasons, failed_reasons, fail_mask, missing_mask = _judge_columns(
+        columns, review_in, failed_in, stale, compiled
+    )
+
+    results = []
+    for i, company in enumerate(companies):
+        result = {
+            **company,
+            "status": status[i],
+            "review_reasons": review_reasons[i],
+            "failed_reasons": failed_reasons[i],
+            "fail_mask": int(fail_mask[i]),
+            "missing_mask": int(missing_mask[i]),
+        }
+        if not stale[i]:
+            result["data_status"] = "fresh"
+        results.append(result)
+
+    pass_count = int(np.count_nonzero(status == "PASS"))
+    fail_count = int(np.count_nonzero(status == "FAIL"))
+    review_count = len(results) - pass_count - fail_count
+    if log_summary:
+        logger.info(f"判定完了: PASS={pass_count}, FAIL={fail_count}, REVIEW={review_count}")
+    return results
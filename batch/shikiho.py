@@ -0,0 +1,278 @@
+"""
+四季報予想データ
+
+shikiho_estimates を1回のクエリでまとめて読み込み、証券コード -> 行 のdictとして提供する。
+読み込み結果はローカルに保存し、テーブルの最新imported_atが変わっていなければ再利用する。
+
+四季報CSV/Excelのインポート（--mode import-shikiho）もここで行う。
+"""
+import pickle
+import re
+import time
+import unicodedata
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+import pandas as pd
+from loguru import logger
+from config import SHIKIHO_CACHE_PATH, SHIKIHO_IMPORT_CHUNK_SIZE, SHIKIHO_DEFAULT_UNIT
+from db import get_shikiho_estimates, get_shikiho_imported_at, upsert_shikiho_estimates
+
+# インポート時のカラム名候補（正規化後の見出しと照合）
+COLUMN_ALIASES = {
+    "company_code": ["証券コード", "コード", "銘柄コード", "company_code"],
+    "shikiho_revenue": ["四季報予想売上", "四季報売上高", "売上高", "予想売上高", "shikiho_revenue"],
+    "shikiho_op": ["四季報予想営利", "四季報営業利益", "営業利益", "予想営業利益", "shikiho_op"],
+    "fiscal_period": ["決算期", "予想決算期", "fiscal_period"],
+}
+
+# 金額単位 -> 億円への換算係数
+UNIT_TO_OKU = {
+    "億円": 1.0,
+    "百万円": 0.01,
+    "千円": 0.00001,
+    "円": 0.00000001,
+}
+
+# プロセス内キャッシュ: (最新imported_at, 証券コード -> 行)
+_memory: tuple[str | None, dict[str, dict]] | None = None
+
+
+def load_shikiho_estimates() -> dict[str, dict[str, Any]]:
+    """
+    四季報予想を全件取得（imported_atが変わらない限りキャッシュを使用）
+
+    Returns:
+        証券コード -> shikiho_estimatesの行（取得失敗時は空dict）
+    """
+    global _memory
+
+    try:
+        latest = get_shikiho_imported_at()
+    except Exception as e:
+        logger.warning(f"四季報予想の更新日時取得失敗: {e}")
+        latest = None
+
+    if _memory is not None and latest is not None and _memory[0] == latest:
+        return _memory[1]
+
+    cached = _read_local()
+    if cached is not None and latest is not None and cached[0] == latest:
+        _memory = cached
+        logger.info(f"四季報予想: キャッシュ使用 {len(cached[1])}件")
+        return cached[1]
+
+    try:
+        estimates = get_shikiho_estimates()
+    except Exception as e:
+        logger.warning(f"四季報予想の一括取得失敗: {e}")
+        return cached[1] if cached is not None else {}
+
+    _memory = (latest, estimates)
+    _write_local(_memory)
+    logger.info(f"四季報予想: {len(estimates)}件読み込み")
+    return estimates
+
+
+def clear_shikiho_cache() -> None:
+    """キャッシュを破棄（インポート直後など）"""
+    global _memory
+    _memory = None
+    Path(SHIKIHO_CACHE_PATH).unlink(missing_ok=True)
+
+
+def _read_local() -> tuple[str | None, dict[str, dict]] | None:
+    """ローカルキャッシュを読み込み"""
+    path = Path(SHIKIHO_CACHE_PATH)
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"四季報予想キャッシュ読み込み失敗: {e}")
+        return None
+
+
+def _write_local(data: tuple[str | None, dict[str, dict]]) -> None:
+    """ローカルキャッシュを保存"""
+    path = Path(SHIKIHO_CACHE_PATH)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logger.warning(f"四季報予想キャッシュ保存失敗: {e}")
+
+
+def import_shikiho_files(paths: list[str], unit: str | None = None) -> list[dict[str, Any]]:
+    """
+    四季報CSV/Excelを一括インポート
+
+    ファイルをチャンク単位で読み込み、証券コード・金額単位（億円）を正規化・検証して
+    チャンクごとにまとめてupsertする。
+
+    Args:
+        paths: ファイルパス（.csv / .xlsx / .xls）
+        unit: 金額単位（省略時は見出しの「(百万円)」等から判定、なければSHIKIHO_DEFAULT_UNIT）
+
+    Returns:
+        ファイルごとの集計
+    """
+    stats = [import_shikiho_file(path, unit) for path in paths]
+    clear_shikiho_cache()
+    return stats
+
+
+def import_shikiho_file(path: str, unit: str | None = None) -> dict[str, Any]:
+    """1ファイルをインポートして集計を返す"""
+    start = time.monotonic()
+    source_file = Path(path).name
+    imported_at = datetime.now(timezone.utc).isoformat()
+    stats = {"file": source_file, "read": 0, "valid": 0, "invalid": 0, "written": 0, "errors": {}}
+
+    for chunk in _read_chunks(path):
+        stats["read"] += len(chunk)
+        rows, errors = _normalize_chunk(chunk, unit)
+        stats["valid"] += len(rows)
+        stats["invalid"] += sum(errors.values())
+        for reason, count in errors.items():
+            stats["errors"][reason] = stats["errors"].get(reason, 0) + count
+
+        for row in rows:
+            row["source_file"] = source_file
+            row["imported_at"] = imported_at
+        try:
+            stats["written"] += upsert_shikiho_estimates(rows)
+        except Exception as e:
+            logger.error(f"四季報予想の書き込み失敗（{len(rows)}件）: {e}")
+
+    stats["elapsed"] = round(time.monotonic() - start, 2)
+    logger.info(
+        f"四季報インポート {source_file}: 読込 {stats['read']}件, 有効 {stats['valid']}件, "
+        f"無効 {stats['invalid']}件, 書き込み {stats['written']}件 ({stats['elapsed']}秒)"
+    )
+    for reason, count in stats["errors"].items():
+        logger.warning(f"  無効行 {reason}: {count}件")
+    return stats
+
+
+def _read_chunks(path: str) -> Iterator[pd.DataFrame]:
+    """ファイルをチャンク単位で読み込み（CSVはストリーム、Excelは読み込み後に分割）"""
+    suffix = Path(path).suffix.lower()
+    if suffix in (".xlsx", ".xls"):
+        df = pd.read_excel(path, dtype=str)
+        for i in range(0, len(df), SHIKIHO_IMPORT_CHUNK_SIZE):
+            yield df.iloc[i:i + SHIKIHO_IMPORT_CHUNK_SIZE]
+        return
+
+    # 四季報のエクスポートはShift_JISのことが多い
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            reader = pd.read_csv(path, dtype=str, chunksize=SHIKIHO_IMPORT_CHUNK_SIZE, encoding=encoding)
+            first = next(reader, None)
+        except UnicodeDecodeError:
+            continue
+        except pd.errors.EmptyDataError:
+            return
+        if first is None:
+            return
+        yield first
+        yield from reader
+        return
+    raise ValueError(f"文字コードを判定できません: {path}")
+
+
+def _normalize_chunk(df: pd.DataFrame, unit: str | None) -> tuple[list[dict], dict[str, int]]:
+    """
+    1チャンクを正規化・検証
+
+    Returns:
+        (有効な行, 無効理由 -> 件数)
+    """
+    columns = _resolve_columns(df.columns)
+    if "company_code" not in columns:
+        return [], {"証券コード列なし": len(df)}
+
+    codes = df[columns["company_code"]].map(_normalize_code)
+    out = pd.DataFrame({"company_code": codes})
+
+    for field in ("shikiho_revenue", "shikiho_op"):
+        if field in columns:
+            header = columns[field]
+            factor = UNIT_TO_OKU[unit or _detect_unit(header) or SHIKIHO_DEFAULT_UNIT]
+            values = df[header].map(_normalize_number)
+            out[field] = pd.to_numeric(values, errors="coerce") * factor
+        else:
+            out[field] = float("nan")
+
+    if "fiscal_period" in columns:
+        out["fiscal_period"] = df[columns["fiscal_period"]].map(
+            lambda v: unicodedata.normalize("NFKC", v).strip() if isinstance(v, str) else None
+        )
+    else:
+        out["fiscal_period"] = None
+
+    errors = {}
+    invalid_code = out["company_code"].isna()
+    no_values = out["shikiho_revenue"].isna() & out["shikiho_op"].isna()
+    errors["証券コード不正"] = int(invalid_code.sum())
+    errors["予想値なし"] = int((no_values & ~invalid_code).sum())
+
+    valid = out[~invalid_code & ~no_values]
+    # 同一ファイル内の重複は後の行を優先
+    duplicated = valid["company_code"].duplicated(keep="last")
+    errors["重複"] = int(duplicated.sum())
+    valid = valid[~duplicated]
+
+    rows = [
+        {k: (None if isinstance(v, float) and v != v else (round(v, 2) if isinstance(v, float) else v))
+         for k, v in row.items()}
+        for row in valid.to_dict("records")
+    ]
+    return rows, {k: v for k, v in errors.items() if v}
+
+
+def _resolve_columns(headers: Any) -> dict[str, str]:
+    """見出しをフィールド名に対応付け（単位表記・空白を除いて照合）"""
+    resolved = {}
+    for header in headers:
+        key = re.sub(r"[\s（(].*$", "", unicodedata.normalize("NFKC", str(header)).strip())
+        for field, aliases in COLUMN_ALIASES.items():
+            if field not in resolved and key in aliases:
+                resolved[field] = header
+    return resolved
+
+
+def _detect_unit(header: str) -> str | None:
+    """見出しの「(百万円)」等から単位を判定"""
+    normalized = unicodedata.normalize("NFKC", str(header))
+    for unit in ("百万円", "千円", "億円"):
+        if unit in normalized:
+            return unit
+    if re.search(r"\(円\)", normalized):
+        return "円"
+    return None
+
+
+def _normalize_code(value: Any) -> str | None:
+    """証券コードを4桁（英字入り新コードは4文字）に正規化"""
+    if not isinstance(value, str):
+        return None
+    code = unicodedata.normalize("NFKC", value).strip().upper()
+    code = re.sub(r"\.(T|0+)$", "", code)
+    if re.fullmatch(r"\d{5}", code) and code.endswith("0"):
+        code = code[:4]  # 5桁表記（末尾0）
+    return code if re.fullmatch(r"\d[0-9A-Z]\d[0-9A-Z]", code) else None
+
+
+def _normalize_number(value: Any) -> str | None:
+    """数値文字列を正規化（全角・カンマ・▲/△のマイナス表記に対応）"""
+    if not isinstance(value, str):
+        return None
+    text = unicodedata.normalize("NFKC", value).strip().replace(",", "")
+    if text in ("", "-", "—", "N/A"):
+        return None
+    if text[0] in "▲△":
+        text = "-" + text[1:]
+    return text
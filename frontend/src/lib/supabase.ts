@@ -45,7 +45,10 @@ export type ScreenedCompany = {
   status: "PASS" | "FAIL" | "REVIEW";
   review_reasons: ReviewReason[];
   failed_reasons: FailedReason[];
+  fail_mask: number; // 未達条件のビット（screening_condition_bits参照）
+  missing_mask: number; // 欠損条件のビット
   updated_at: string;
+  verified_at: string | null; // 財務バッチで最後に取得・判定した時刻
   price_updated_at: string | null;
   data_status: "fresh" | "stale";
   data_source: string | null;
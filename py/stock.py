@@ -1,78 +1,338 @@
 """
 株式データ取得API（Python/yfinance）
 Vercel Serverless Function
+
+取得結果はウォームなインスタンス内でTTL+LRUキャッシュし、同じ銘柄への同時リクエストは
+1回の取得にまとめる。レスポンスには Cache-Control / ETag を付け、CDNでも再利用させる。
+
+複数銘柄は ?codes=7203,6758 または POST {"codes": [...]} でまとめて取得できる
+（並列取得・全体の期限あり、銘柄ごとにエラーを返す）。
+
+コールドスタートを短くするため、yfinance（pandas/numpy）は実際に取得するときまで
+読み込まない。?view=quote は株価のみをチャートAPIのJSONから直接取得する（pandas不要）。
+
+財務指標はバッチが計算済みの screened_latest を優先し、ticker.info は補完にだけ使う。
+?view=fast は ticker.info を待たずに取れた項目だけ返す（"partial": true）。
+screened_latest の株価・財務指標がどちらも新しければYahooには問い合わせずにそのまま返し、
+Yahooから取得した株価は screened_latest に書き戻す。
 """
 
 from http.server import BaseHTTPRequestHandler
+from collections import OrderedDict
+from typing import Optional
+import hashlib
 import json
-import yfinance as yf
-from urllib.parse import parse_qs, urlparse
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, quote, urlparse
+
+# プロセス内キャッシュ（ウォームスタート間で共有）
+CACHE_TTL = float(os.getenv("STOCK_CACHE_TTL", "300"))  # 取得成功の有効期間（秒）
+ERROR_CACHE_TTL = float(os.getenv("STOCK_ERROR_CACHE_TTL", "30"))  # 取得失敗の有効期間（秒）
+CACHE_MAX_ENTRIES = int(os.getenv("STOCK_CACHE_MAX_ENTRIES", "512"))
+FETCH_WAIT_TIMEOUT = float(os.getenv("STOCK_FETCH_WAIT_TIMEOUT", "20"))  # 他リクエストの取得完了を待つ上限（秒）
+
+# CDNキャッシュ（s-maxage経過後もstale-while-revalidateの間は古い応答を返しつつ再取得）
+CDN_MAX_AGE = int(os.getenv("STOCK_CDN_MAX_AGE", "60"))
+CDN_STALE_WHILE_REVALIDATE = int(os.getenv("STOCK_CDN_STALE_WHILE_REVALIDATE", "300"))
+
+# 複数銘柄の一括取得
+BATCH_MAX_CODES = int(os.getenv("STOCK_BATCH_MAX_CODES", "20"))  # 1リクエストあたりの銘柄数上限
+BATCH_DEADLINE = float(os.getenv("STOCK_BATCH_DEADLINE", "8"))  # 全銘柄の取得期限（秒）
+BATCH_WORKERS = int(os.getenv("STOCK_BATCH_WORKERS", "8"))  # 並列取得数
+
+# チャートAPI（?view=quote）
+QUOTE_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=1d&interval=1d"
+QUOTE_TIMEOUT = float(os.getenv("STOCK_QUOTE_TIMEOUT", "5"))
+QUOTE_USER_AGENT = "Mozilla/5.0 (compatible; newstock/1.0)"
 
+# screened_latest（バッチが計算済みの財務指標）
+SUPABASE_URL = (os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL") or "").rstrip("/")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY") or ""
+SUPABASE_TIMEOUT = float(os.getenv("STOCK_SUPABASE_TIMEOUT", "2"))
+FUNDAMENTALS_MAX_AGE = float(os.getenv("STOCK_FUNDAMENTALS_MAX_AGE_DAYS", "45")) * 86400  # verified_atがこれより古ければinfoで取得
+PRICE_MAX_AGE = float(os.getenv("STOCK_PRICE_MAX_AGE_MINUTES", "30")) * 60  # price_updated_atがこれより古ければYahooで取得
+# Yahooから取得した株価を書き戻す（service roleキーがある場合のみ）
+WRITE_BACK = os.getenv("STOCK_WRITE_BACK", "1") == "1" and bool(os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+WRITE_BACK_TIMEOUT = float(os.getenv("STOCK_WRITE_BACK_TIMEOUT", "0.5"))  # 書き戻しは応答前に行うため短く打ち切る
 
-def get_stock_data(code: str) -> dict:
-    """yfinanceを使って株式データを取得"""
+# screened_latest から使う財務指標
+SCREENED_FIELDS = [
+    "company_name", "sector", "per_forward", "pbr", "operating_margin",
+    "roa", "equity_ratio", "revenue_growth_1y_cy", "dividend_yield",
+]
+
+# レスポンスの項目（view=fast で取れなかった項目もNoneで返す）
+RESPONSE_FIELDS = [
+    "company_code", "company_name", "sector", "market", "market_cap", "stock_price",
+    "per_forward", "pbr", "operating_margin", "roa", "equity_ratio", "revenue_growth_1y_cy", "dividend_yield",
+]
+
+# "ビュー:証券コード" -> (有効期限, 結果)
+_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+# 取得中の "ビュー:証券コード" -> 完了通知
+_inflight: dict[str, threading.Event] = {}
+_lock = threading.Lock()
+
+
+def get_stock_data(code: str, partial: bool = False, rows: Optional[dict[str, dict]] = None) -> dict:
+    """
+    yfinanceを使って株式データを取得
+
+    screened_latest の行が株価・財務指標ともに新しければそのまま返す（Yahooに問い合わせない）。
+    それ以外は株価・時価総額を軽量な fast_info から取り、財務指標は行が新しければそれを使う。
+    なければ ticker.info（数秒かかる）で補う。既存の行の株価が古ければ、取得した株価を書き戻す。
+
+    Args:
+        code: 証券コード
+        partial: Trueなら ticker.info を呼ばず、取れた項目だけ返す（?view=fast）
+        rows: 一括取得済みの screened_latest の行（省略時はこの銘柄の行を取得）
+    """
     symbol = f"{code}.T"
 
     try:
-        ticker = yf.Ticker(symbol)
+        row = get_screened_row(code) if rows is None else rows.get(code)
+        if row is not None and _is_fresh_row(row):
+            return _row_result(row)
 
-        # fast_info から取得
+        import yfinance as yf  # pandas/numpyを含むため取得時に読み込む
+
+        ticker = yf.Ticker(symbol)
         fast_info = ticker.fast_info
-        info = ticker.info
 
+        data = dict.fromkeys(RESPONSE_FIELDS)
+        data.update(company_code=code, market="東証", **_fast_fields(fast_info))
+
+        sources = {"price": "fast_info" if data["stock_price"] is not None else None, "fundamentals": None}
+        if row is not None and _is_fresh_fundamentals(row):
+            _fill(data, _row_fields(row))
+            sources["fundamentals"] = "screened_latest"
+
+        # 財務指標が古い・ない場合、または fast_info で株価が取れなかった場合は info で補う
+        if not partial and (sources["fundamentals"] is None or sources["price"] is None):
+            _fill(data, _info_fields(ticker.info or {}))
+            sources["fundamentals"] = sources["fundamentals"] or "info"
+            if sources["price"] is None and data["stock_price"] is not None:
+                sources["price"] = "info"
+
+        data["company_name"] = data["company_name"] or f"銘柄 {code}"
+
+        # 行の株価が古い場合だけ書き戻す（応答後はプロセスが止まるため、応答前に短いタイムアウトで行う）
+        stale_price = row is not None and not _is_fresh(row.get("price_updated_at"), PRICE_MAX_AGE)
+        if stale_price and data["stock_price"] is not None:
+            write_back_price(code, data["stock_price"], data["market_cap"])
+
+        result = {"success": True, "data": data, "sources": sources}
+        if sources["fundamentals"] is None:
+            result["partial"] = True
+        return result
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+def _fast_fields(fast_info) -> dict:
+    """fast_info から取れる項目（取れないものはNone）"""
+    market_cap_raw = getattr(fast_info, 'market_cap', None)
+    dividend_yield_raw = getattr(fast_info, 'dividend_yield', None)
+    return {
         # 時価総額（億円）
-        market_cap_raw = getattr(fast_info, 'market_cap', None) or info.get('marketCap')
-        market_cap = market_cap_raw / 100000000 if market_cap_raw else None
+        "market_cap": market_cap_raw / 100000000 if market_cap_raw else None,
+        "stock_price": getattr(fast_info, 'last_price', None),
+        "per_forward": getattr(fast_info, 'pe_ratio', None),
+        "pbr": getattr(fast_info, 'price_to_book', None),
+        "dividend_yield": _yield_percent(dividend_yield_raw),
+    }
+
+
+def _row_fields(row: dict) -> dict:
+    """screened_latest の行から財務指標（バッチと同じ定義・単位）"""
+    return {field: row.get(field) for field in SCREENED_FIELDS}
+
+
+def _info_fields(info: dict) -> dict:
+    """ticker.info から財務指標を算出"""
+    market_cap_raw = info.get('marketCap')
+
+    # 営業利益率
+    operating_margin_raw = info.get('operatingMargins')
+    operating_margin = operating_margin_raw * 100 if operating_margin_raw else None
+
+    # ROA
+    roa_raw = info.get('returnOnAssets')
+    roa = roa_raw * 100 if roa_raw else None
+
+    # 自己資本比率（D/Eから逆算）
+    debt_to_equity = info.get('debtToEquity')
+    equity_ratio = None
+    if debt_to_equity is not None:
+        equity_ratio = (1 / (1 + debt_to_equity / 100)) * 100
+
+    # 売上成長率
+    revenue_growth_raw = info.get('revenueGrowth')
+    revenue_growth = revenue_growth_raw * 100 if revenue_growth_raw else None
+
+    return {
+        "company_name": info.get('longName') or info.get('shortName'),
+        "sector": info.get('industry') or info.get('sector'),
+        "market_cap": market_cap_raw / 100000000 if market_cap_raw else None,
+        "stock_price": info.get('regularMarketPrice') or info.get('currentPrice'),
+        "per_forward": info.get('trailingPE') or info.get('forwardPE'),
+        "pbr": info.get('priceToBook'),
+        "operating_margin": operating_margin,
+        "roa": roa,
+        "equity_ratio": equity_ratio,
+        "revenue_growth_1y_cy": revenue_growth,
+        "dividend_yield": _yield_percent(info.get('dividendYield')),
+    }
+
+
+def _fill(data: dict, values: dict) -> None:
+    """未取得（None）の項目だけ埋める"""
+    for field, value in values.items():
+        if data.get(field) is None:
+            data[field] = value
+
+
+def _yield_percent(value: Optional[float]) -> Optional[float]:
+    """配当利回りをパーセントに揃える（0.028 -> 2.8、既にパーセントならそのまま）"""
+    return value * 100 if value and value < 1 else value
+
 
-        # 各種指標
-        per = getattr(fast_info, 'pe_ratio', None) or info.get('trailingPE') or info.get('forwardPE')
-        pbr = getattr(fast_info, 'price_to_book', None) or info.get('priceToBook')
-        dividend_yield_raw = getattr(fast_info, 'dividend_yield', None) or info.get('dividendYield')
-        dividend_yield = dividend_yield_raw * 100 if dividend_yield_raw and dividend_yield_raw < 1 else dividend_yield_raw
+def _row_result(row: dict) -> dict:
+    """screened_latest の行だけで応答を作る"""
+    data = {field: row.get(field) for field in RESPONSE_FIELDS}
+    data["market"] = "東証"
+    return {"success": True, "data": data, "sources": {"price": "screened_latest", "fundamentals": "screened_latest"}}
 
-        # 株価
-        price = getattr(fast_info, 'last_price', None) or info.get('regularMarketPrice') or info.get('currentPrice')
 
-        # 名前
-        name = info.get('longName') or info.get('shortName') or f"銘柄 {code}"
+def _is_fresh_fundamentals(row: dict) -> bool:
+    """行の財務指標が使えるか（取得失敗でstaleになっておらず、バッチが最後に確認した時刻が新しい）"""
+    # updated_atはデータ変化時のみ更新されるため、取得のたびに更新されるverified_atを優先する
+    verified_at = row.get("verified_at") or row.get("updated_at")
+    return row.get("data_status") == "fresh" and _is_fresh(verified_at, FUNDAMENTALS_MAX_AGE)
+
+
+def _is_fresh_row(row: dict) -> bool:
+    """行だけで応答できるか（財務指標に加えて株価も新しい）"""
+    return (
+        _is_fresh_fundamentals(row)
+        and row.get("stock_price") is not None
+        and _is_fresh(row.get("price_updated_at"), PRICE_MAX_AGE)
+    )
+
+
+def get_screened_row(code: str) -> Optional[dict]:
+    """screened_latest の1行を取得（なければNone）"""
+    return get_screened_rows([code]).get(code)
+
+
+def get_screened_rows(codes: list[str]) -> dict[str, dict]:
+    """
+    screened_latest の行をPostgRESTから直接まとめて取得（supabaseクライアントは使わない）
+
+    Supabase未設定・取得失敗時は空dict（Yahooからの取得にフォールバック）
+
+    Returns:
+        証券コード -> 行
+    """
+    if not SUPABASE_URL or not SUPABASE_KEY or not codes:
+        return {}
+
+    try:
+        columns = ",".join([
+            "company_code", "stock_price", "market_cap", "updated_at", "verified_at", "price_updated_at",
+            "data_status",
+            *SCREENED_FIELDS,
+        ])
+        # codesは4桁の数字に検証済み
+        rows = _postgrest("GET", f"screened_latest?company_code=in.({','.join(codes)})&select={columns}")
+        return {row["company_code"]: row for row in rows or []}
+    except Exception:
+        return {}
+
+
+def write_back_price(code: str, price: float, market_cap: Optional[float]) -> None:
+    """Yahooから取得した株価を screened_latest の既存行に書き戻す（失敗しても応答には影響させない）"""
+    if not WRITE_BACK or not SUPABASE_URL:
+        return
+
+    values = {"stock_price": price, "price_updated_at": datetime.now(timezone.utc).isoformat()}
+    if market_cap is not None:
+        values["market_cap"] = market_cap
+    try:
+        _postgrest("PATCH", f"screened_latest?company_code=eq.{quote(code)}", values, timeout=WRITE_BACK_TIMEOUT)
+    except Exception:
+        pass
 
-        # セクター
-        sector = info.get('industry') or info.get('sector')
 
-        # 営業利益率
-        operating_margin_raw = info.get('operatingMargins')
-        operating_margin = operating_margin_raw * 100 if operating_margin_raw else None
+def _postgrest(method: str, path: str, body: Optional[dict] = None, timeout: float = SUPABASE_TIMEOUT):
+    """PostgRESTへのリクエスト（応答本文があればJSONを返す）"""
+    from urllib.request import Request, urlopen
 
-        # ROA
-        roa_raw = info.get('returnOnAssets')
-        roa = roa_raw * 100 if roa_raw else None
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Accept": "application/json",
+    }
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+        headers["Prefer"] = "return=minimal"
 
-        # 自己資本比率（D/Eから逆算）
-        debt_to_equity = info.get('debtToEquity')
-        equity_ratio = None
-        if debt_to_equity is not None:
-            equity_ratio = (1 / (1 + debt_to_equity / 100)) * 100
+    request = Request(f"{SUPABASE_URL}/rest/v1/{path}", data=data, headers=headers, method=method)
+    with urlopen(request, timeout=timeout) as response:
+        payload = response.read()
+    return json.loads(payload) if payload else None
 
-        # 売上成長率
-        revenue_growth_raw = info.get('revenueGrowth')
-        revenue_growth = revenue_growth_raw * 100 if revenue_growth_raw else None
+
+def _is_fresh(timestamp: Optional[str], max_age: float) -> bool:
+    """ISO8601の時刻が max_age 秒以内か"""
+    if not timestamp:
+        return False
+    # Python 3.9のfromisoformatは小数秒が3桁・6桁以外だと解析できないため6桁に揃える
+    normalized = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), timestamp.replace("Z", "+00:00"))
+    try:
+        value = datetime.fromisoformat(normalized)
+    except ValueError:
+        return False
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - value).total_seconds() <= max_age
+
+
+def get_quote(code: str) -> dict:
+    """チャートAPIのJSONから株価を取得（yfinance/pandasを使わない軽量版）"""
+    symbol = f"{code}.T"
+
+    try:
+        from urllib.request import Request, urlopen  # ssl/http.clientを含むため取得時に読み込む
+
+        request = Request(QUOTE_URL.format(symbol=quote(symbol)), headers={"User-Agent": QUOTE_USER_AGENT})
+        with urlopen(request, timeout=QUOTE_TIMEOUT) as response:
+            chart = json.load(response)["chart"]
+
+        if chart.get("error") or not chart.get("result"):
+            raise ValueError((chart.get("error") or {}).get("description") or f"no data for {symbol}")
+        meta = chart["result"][0]["meta"]
 
         return {
             "success": True,
             "data": {
                 "company_code": code,
-                "company_name": name,
-                "sector": sector,
+                "company_name": meta.get("longName") or meta.get("shortName") or f"銘柄 {code}",
                 "market": "東証",
-                "market_cap": market_cap,
-                "stock_price": price,
-                "per_forward": per,
-                "pbr": pbr,
-                "operating_margin": operating_margin,
-                "roa": roa,
-                "equity_ratio": equity_ratio,
-                "revenue_growth_1y_cy": revenue_growth,
-                "dividend_yield": dividend_yield,
+                "stock_price": meta.get("regularMarketPrice"),
+                "previous_close": meta.get("chartPreviousClose") or meta.get("previousClose"),
+                "currency": meta.get("currency"),
+                "price_time": meta.get("regularMarketTime"),
             }
         }
 
@@ -83,33 +343,234 @@ def get_stock_data(code: str) -> dict:
         }
 
 
+# ?view= -> 取得関数
+VIEWS = {
+    "full": get_stock_data,
+    "fast": lambda code, rows=None: get_stock_data(code, partial=True, rows=rows),
+    "quote": lambda code, rows=None: get_quote(code),
+}
+
+
+def get_stock_data_cached(code: str, view: str = "full", rows: Optional[dict[str, dict]] = None) -> tuple[dict, bool]:
+    """
+    キャッシュ経由で株式データを取得
+
+    同じ銘柄を取得中のリクエストがあれば、その完了を待って結果を共有する。
+    rowsには一括取得済みの screened_latest の行を渡せる（取得時に読み直さない）。
+
+    Returns:
+        (結果, キャッシュヒットか)
+    """
+    fetch = VIEWS[view]
+    key = f"{view}:{code}"
+    with _lock:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached, True
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+
+    if not leader:
+        event.wait(FETCH_WAIT_TIMEOUT)
+        with _lock:
+            cached = _cache_get(key)
+        if cached is not None:
+            return cached, True
+        # 先行リクエストがタイムアウトした場合は自分で取得
+        return fetch(code, rows=rows), False
+
+    try:
+        result = fetch(code, rows=rows)
+        with _lock:
+            _cache_put(key, result)
+        return result, False
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        event.set()
+
+
+def get_stock_data_batch(codes: list[str], view: str = "full") -> dict:
+    """
+    複数銘柄の株式データを並列取得
+
+    BATCH_DEADLINE までに取得できた銘柄だけを返し、
+    不正なコード・取得失敗・期限切れは銘柄ごとのエラーとして返す。
+
+    Returns:
+        {"success": 1件以上取得できたか, "data": {コード: データ}, "errors": {コード: エラー}}
+    """
+    data = {}
+    errors = {}
+    valid = []
+    for code in dict.fromkeys(codes):
+        if _is_valid_code(code):
+            valid.append(code)
+        else:
+            errors[code] = "code must be 4 digits"
+
+    # screened_latest をまとめて読み、行だけで応答できる銘柄はYahooに問い合わせない
+    # 残りの銘柄にも読んだ行を渡し、銘柄ごとに読み直さない
+    rows = None
+    if view in ("full", "fast"):
+        rows = get_screened_rows(valid)
+        pending = []
+        for code in valid:
+            row = rows.get(code)
+            if row is not None and _is_fresh_row(row):
+                data[code] = _row_result(row)["data"]
+            else:
+                pending.append(code)
+        valid = pending
+
+    if valid:
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        executor = ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(valid)))
+        futures = {executor.submit(get_stock_data_cached, code, view, rows): code for code in valid}
+        done, _ = wait(futures, timeout=BATCH_DEADLINE)
+        # 期限切れの取得は待たずに応答する（完了分はキャッシュに残る）
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for future, code in futures.items():
+            if future not in done:
+                errors[code] = f"timeout after {BATCH_DEADLINE:g}s"
+                continue
+            result, _ = future.result()
+            if result.get("success"):
+                data[code] = result["data"]
+            else:
+                errors[code] = result.get("error", "unknown error")
+
+    return {"success": bool(data), "data": data, "errors": errors}
+
+
+def _is_valid_code(code: Optional[str]) -> bool:
+    """4桁の証券コードか"""
+    return bool(code) and code.isdigit() and len(code) == 4
+
+
+def _split_codes(values: list[str]) -> list[str]:
+    """?codes=7203,6758 / ?codes=7203&codes=6758 の両方を受け付ける"""
+    return [c.strip() for value in values for c in value.split(",") if c.strip()]
+
+
+def _cache_get(key: str) -> Optional[dict]:
+    """有効期限内のキャッシュを返す（_lock保持中に呼ぶ）"""
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    expires_at, result = entry
+    if expires_at < time.monotonic():
+        del _cache[key]
+        return None
+    _cache.move_to_end(key)
+    return result
+
+
+def _cache_put(key: str, result: dict) -> None:
+    """キャッシュに保存し、上限を超えたら最も古く使われたものから捨てる（_lock保持中に呼ぶ）"""
+    ttl = CACHE_TTL if _is_complete(result) else ERROR_CACHE_TTL
+    _cache[key] = (time.monotonic() + ttl, result)
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+def _is_complete(result: dict) -> bool:
+    """
+    長く保持してよい結果か（取得に成功し、株価が取れている）
+
+    view=fast で fast_info から株価が取れなかった結果は、すぐに取り直せるよう
+    エラーと同じ短い期間だけキャッシュし、CDNにも載せない
+    """
+    return bool(result.get("success")) and (result.get("data") or {}).get("stock_price") is not None
+
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # URLパラメータ取得
         parsed = urlparse(self.path)
         params = parse_qs(parsed.query)
+        view = params.get('view', ['full'])[0]
+        if view not in VIEWS:
+            self._send_json(400, {"error": f"view must be one of: {', '.join(VIEWS)}"})
+            return
+        if 'codes' in params:
+            self._send_batch(_split_codes(params['codes']), view, cacheable=True)
+            return
         code = params.get('code', [None])[0]
 
         if not code:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "code parameter required"}).encode())
+            self._send_json(400, {"error": "code parameter required"})
             return
 
         # 4桁チェック
-        if not code.isdigit() or len(code) != 4:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "code must be 4 digits"}).encode())
+        if not _is_valid_code(code):
+            self._send_json(400, {"error": "code must be 4 digits"})
             return
 
         # データ取得
-        result = get_stock_data(code)
+        result, hit = get_stock_data_cached(code, view)
+        self._send_json(200, result, cacheable=_is_complete(result), cache_status="HIT" if hit else "MISS")
+
+    def do_POST(self):
+        # 本文: {"codes": ["7203", "6758"], "view": "full"}
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            codes = body.get("codes")
+            view = body.get("view", "full")
+        except (ValueError, AttributeError):
+            codes, view = None, "full"
 
-        self.send_response(200)
+        if not isinstance(codes, list) or not all(isinstance(c, str) for c in codes):
+            self._send_json(400, {"error": "codes must be a list of strings"})
+            return
+        if view not in VIEWS:
+            self._send_json(400, {"error": f"view must be one of: {', '.join(VIEWS)}"})
+            return
+        self._send_batch(codes, view, cacheable=False)
+
+    def _send_batch(self, codes: list[str], view: str, cacheable: bool):
+        """複数銘柄の一括取得結果を返す"""
+        if not codes:
+            self._send_json(400, {"error": "codes parameter required"})
+            return
+        if len(codes) > BATCH_MAX_CODES:
+            self._send_json(400, {"error": f"too many codes (max {BATCH_MAX_CODES})"})
+            return
+
+        result = get_stock_data_batch(codes, view)
+        # 一部でも失敗・株価なしがあればCDNには載せない
+        complete = all(_is_complete({"success": True, "data": data}) for data in result["data"].values())
+        self._send_json(200, result, cacheable=cacheable and complete and not result["errors"])
+
+    def _send_json(self, status: int, body: dict, cacheable: bool = False, cache_status: Optional[str] = None):
+        """JSONを返す（キャッシュ可能な応答にはETagを付け、If-None-Matchが一致すれば304）"""
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        etag = '"' + hashlib.sha1(payload).hexdigest()[:16] + '"'
+
+        if cacheable and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self._send_cache_headers(etag, cacheable, cache_status)
+            self.end_headers()
+            return
+
+        self.send_response(status)
         self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
+        self._send_cache_headers(etag, cacheable, cache_status)
         self.end_headers()
-        self.wfile.write(json.dumps(result, ensure_ascii=False).encode())
+        self.wfile.write(payload)
+
+    def _send_cache_headers(self, etag: str, cacheable: bool, cache_status: Optional[str]):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if cacheable:
+            self.send_header('Cache-Control', f'public, max-age=0, s-maxage={CDN_MAX_AGE}, stale-while-revalidate={CDN_STALE_WHILE_REVALIDATE}')
+            self.send_header('ETag', etag)
+        else:
+            self.send_header('Cache-Control', 'no-store')
+        if cache_status:
+            self.send_header('X-Cache', cache_status)
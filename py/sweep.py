@@ -0,0 +1,226 @@
+"""
+閾値スイープAPI（what-if分析）
+Vercel Serverless Function
+
+?grid=roa=3:8:0.5&grid=per_forward=20,30,40 のように閾値の格子を指定すると、
+格子点ごとに「その閾値ならPASSは何件か」を返す（batch/main.py --mode sweep と同じ指定）。
+
+スイープしない条件はバッチが判定済みの fail_mask / missing_mask をそのまま使い、
+スイープする条件だけを screened_latest の指標値で判定し直す。
+閾値ごとの通過銘柄をビットセット（int）にして格子点ごとにANDするため、
+格子点ごとに全銘柄を判定し直さない。
+
+判定は指標値のみに基づく（stale・欠損はREVIEWとしてPASSに含めない）。
+"""
+
+from http.server import BaseHTTPRequestHandler
+from typing import Any
+import hashlib
+import itertools
+import json
+import operator
+import os
+from urllib.parse import parse_qs, urlparse
+
+# screened_latest（バッチが判定済みの行）
+SUPABASE_URL = (os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL") or "").rstrip("/")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY") or ""
+SUPABASE_TIMEOUT = float(os.getenv("SWEEP_SUPABASE_TIMEOUT", "5"))
+PAGE_SIZE = 1000  # PostgRESTのmax-rows以下
+
+# 格子点数の上限（応答サイズ・計算時間の目安）
+MAX_GRID_POINTS = int(os.getenv("SWEEP_MAX_GRID_POINTS", "10000"))
+
+# CDNキャッシュ（screened_latestはバッチ実行時にしか変わらない）
+CDN_MAX_AGE = int(os.getenv("SWEEP_CDN_MAX_AGE", "300"))
+CDN_STALE_WHILE_REVALIDATE = int(os.getenv("SWEEP_CDN_STALE_WHILE_REVALIDATE", "3600"))
+
+_OPS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+}
+
+
+def sweep(grid: dict[str, list[Any]]) -> dict:
+    """
+    閾値スイープを実行
+
+    Args:
+        grid: フィールド -> 閾値リスト
+
+    Returns:
+        {"universe", "eligible", "current_pass", "points": [{フィールド: 閾値, ..., "pass": 件数}]}
+    """
+    bits = {b["field"]: b for b in _postgrest("screening_condition_bits?select=bit,field,op")}
+    unknown = [field for field in grid if field not in bits or bits[field].get("op") not in _OPS]
+    if unknown:
+        raise ValueError(f"unknown condition: {', '.join(unknown)}")
+
+    points = 1
+    for thresholds in grid.values():
+        points *= len(thresholds)
+    if points > MAX_GRID_POINTS:
+        raise ValueError(f"too many grid points: {points} > {MAX_GRID_POINTS}")
+
+    columns = ["company_code", "data_status", "fail_mask", "missing_mask", *grid]
+    rows = _select_all("screened_latest", columns)
+
+    # 閾値に関係なくPASSになり得ない銘柄（stale・いずれかの条件が欠損）を除く
+    eligible = [r for r in rows if r.get("data_status") != "stale" and not r.get("missing_mask")]
+    # スイープ対象以外の条件をすべて満たす銘柄
+    swept_mask = sum(1 << bits[field]["bit"] for field in grid)
+    base = [r for r in eligible if not ((r.get("fail_mask") or 0) & ~swept_mask)]
+
+    # 条件ごとに 閾値 -> 通過銘柄のビットセット（baseの並び順）
+    passing = [
+        [_bitset(base, field, bits[field]["op"], threshold) for threshold in thresholds]
+        for field, thresholds in grid.items()
+    ]
+    everyone = (1 << len(base)) - 1
+    results = []
+    for position in itertools.product(*[range(len(t)) for t in grid.values()]):
+        combined = everyone
+        for sets, i in zip(passing, position):
+            combined &= sets[i]
+        point = {field: grid[field][i] for field, i in zip(grid, position)}
+        point["pass"] = bin(combined).count("1")
+        results.append(point)
+
+    return {
+        "universe": len(rows),
+        "eligible": len(eligible),
+        "current_pass": sum(1 for r in eligible if not r.get("fail_mask")),
+        "points": results,
+    }
+
+
+def _bitset(rows: list[dict], field: str, op: str, threshold: Any) -> int:
+    """閾値を差し替えたときに通過する行のビットセット（i番目のビット = rows[i]）"""
+    compare = _OPS[op]
+    bits = 0
+    for i, row in enumerate(rows):
+        value = row.get(field)
+        if value is None:
+            continue
+        try:
+            # 日付（YYYY-MM-DD）は文字列のまま比較する
+            passed = compare(value, threshold) if isinstance(threshold, str) else compare(float(value), threshold)
+        except (TypeError, ValueError):
+            passed = False
+        if passed:
+            bits |= 1 << i
+    return bits
+
+
+def parse_grid(specs: list[str]) -> dict[str, list[Any]]:
+    """
+    ?grid= の指定を解釈
+
+    例: "roa=3:8:0.5" -> {"roa": [3.0, 3.5, ..., 8.0]}
+        "per_forward=20,30,40" -> {"per_forward": [20.0, 30.0, 40.0]}
+        "listing_date=2010-01-01,2015-01-01" -> 日付はそのまま
+    """
+    grid = {}
+    for spec in specs:
+        field, _, values = spec.partition("=")
+        if not field or not values:
+            raise ValueError(f"invalid grid: {spec}")
+
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            if step <= 0 or stop < start:
+                raise ValueError(f"invalid range: {spec}")
+            count = int(round((stop - start) / step)) + 1
+            if count > MAX_GRID_POINTS:
+                raise ValueError(f"too many grid points: {spec}")
+            grid[field] = [round(start + step * i, 6) for i in range(count)]
+            continue
+
+        items = [v.strip() for v in values.split(",") if v.strip()]
+        if field == "listing_date":
+            grid[field] = items
+        else:
+            grid[field] = [float(v) for v in items]
+    return grid
+
+
+def _select_all(table: str, columns: list[str]) -> list[dict]:
+    """テーブルを全件取得（ページング）"""
+    rows = []
+    offset = 0
+    while True:
+        page = _postgrest(f"{table}?select={','.join(columns)}&order=company_code&limit={PAGE_SIZE}&offset={offset}")
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+
+def _postgrest(path: str) -> list[dict]:
+    """PostgRESTへのGET"""
+    from urllib.request import Request, urlopen  # ssl/http.clientを含むため取得時に読み込む
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("SUPABASE_URL is not configured")
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Accept": "application/json",
+    }
+    request = Request(f"{SUPABASE_URL}/rest/v1/{path}", headers=headers)
+    with urlopen(request, timeout=SUPABASE_TIMEOUT) as response:
+        return json.loads(response.read() or b"[]")
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        specs = params.get('grid', [])
+        if not specs:
+            self._send_json(400, {"error": "grid parameter required (e.g. grid=roa=3:8:0.5)"})
+            return
+
+        try:
+            grid = parse_grid(specs)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            result = sweep(grid)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"success": False, "error": str(e)})
+            return
+
+        self._send_json(200, {"success": True, **result}, cacheable=True)
+
+    def _send_json(self, status: int, body: dict, cacheable: bool = False):
+        """JSONを返す（成功時はETagを付け、If-None-Matchが一致すれば304）"""
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        etag = '"' + hashlib.sha1(payload).hexdigest()[:16] + '"'
+
+        if cacheable and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self._send_cache_headers(etag, cacheable)
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self._send_cache_headers(etag, cacheable)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_cache_headers(self, etag: str, cacheable: bool):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if cacheable:
+            self.send_header('Cache-Control', f'public, max-age=0, s-maxage={CDN_MAX_AGE}, stale-while-revalidate={CDN_STALE_WHILE_REVALIDATE}')
+            self.send_header('ETag', etag)
+        else:
+            self.send_header('Cache-Control', 'no-store')
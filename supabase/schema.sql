@@ -31,6 +31,7 @@ CREATE TABLE IF NOT EXISTS screened_latest (
   -- 時価総額・株価
   market_cap        DECIMAL(15,2),
   stock_price       DECIMAL(15,2),
+  shares_outstanding BIGINT,  -- 発行済株式数（財務バッチで更新、株価バッチの時価総額算出用）
 
   -- 売上高（生値：億円）
   revenue_2y        DECIMAL(15,2),
@@ -72,30 +73,155 @@ CREATE TABLE IF NOT EXISTS screened_latest (
   status            VARCHAR(10) NOT NULL DEFAULT 'REVIEW',
   review_reasons    JSONB DEFAULT '[]'::jsonb,
   failed_reasons    JSONB DEFAULT '[]'::jsonb,
+  fail_mask         INTEGER DEFAULT 0,  -- 未達条件のビット（screening_condition_bits参照）
+  missing_mask      INTEGER DEFAULT 0,  -- 欠損条件のビット
+
+  -- 決算日（増分更新の対象判定用）
+  earnings_date     TIMESTAMP WITH TIME ZONE,
 
   -- 更新管理
   updated_at        TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  verified_at       TIMESTAMP WITH TIME ZONE,  -- 財務バッチで最後に取得・判定した時刻（データが変化しなくても更新）
   price_updated_at  TIMESTAMP WITH TIME ZONE,
   data_status       VARCHAR(20) DEFAULT 'fresh',
   data_source       VARCHAR(50) DEFAULT 'yfinance',
+  row_hash          VARCHAR(64),  -- 業務カラムのSHA-256（変化のない行のupsertを省略）
 
   -- 制約
   CONSTRAINT chk_status CHECK (status IN ('PASS', 'FAIL', 'REVIEW')),
   CONSTRAINT chk_data_status CHECK (data_status IN ('fresh', 'stale'))
 );
 
+-- 既存環境向けマイグレーション
+ALTER TABLE screened_latest ADD COLUMN IF NOT EXISTS shares_outstanding BIGINT;
+ALTER TABLE screened_latest ADD COLUMN IF NOT EXISTS earnings_date TIMESTAMP WITH TIME ZONE;
+ALTER TABLE screened_latest ADD COLUMN IF NOT EXISTS row_hash VARCHAR(64);
+ALTER TABLE screened_latest ADD COLUMN IF NOT EXISTS fail_mask INTEGER DEFAULT 0;
+ALTER TABLE screened_latest ADD COLUMN IF NOT EXISTS missing_mask INTEGER DEFAULT 0;
+ALTER TABLE screened_latest ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP WITH TIME ZONE;
+
 -- インデックス
 CREATE INDEX IF NOT EXISTS idx_screened_status ON screened_latest(status);
 CREATE INDEX IF NOT EXISTS idx_screened_sector ON screened_latest(sector);
 CREATE INDEX IF NOT EXISTS idx_screened_market_cap ON screened_latest(market_cap);
 CREATE INDEX IF NOT EXISTS idx_screened_updated ON screened_latest(updated_at);
 CREATE INDEX IF NOT EXISTS idx_screened_roa ON screened_latest(roa);
+-- 条件ビット（例: ROAのみ未達 → fail_mask = 1 << bit AND missing_mask = 0）
+CREATE INDEX IF NOT EXISTS idx_screened_fail_mask ON screened_latest(fail_mask) WHERE missing_mask = 0;
+CREATE INDEX IF NOT EXISTS idx_screened_missing_mask ON screened_latest(missing_mask) WHERE missing_mask <> 0;
+-- 1条件だけ未達（あと一歩の銘柄）
+CREATE INDEX IF NOT EXISTS idx_screened_single_fail ON screened_latest(fail_mask)
+  WHERE missing_mask = 0 AND fail_mask <> 0 AND (fail_mask & (fail_mask - 1)) = 0;
 
 -- RLS設定
 ALTER TABLE screened_latest ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Public read access" ON screened_latest FOR SELECT USING (true);
 CREATE POLICY "Service role write access" ON screened_latest FOR ALL USING (true);
 
+-- =============================================
+-- 条件ビット割り当て（fail_mask / missing_mask の読み方）
+-- =============================================
+-- 財務バッチ実行時に config.SCREENING_CONDITIONS の順で更新する
+CREATE TABLE IF NOT EXISTS screening_condition_bits (
+  bit               SMALLINT PRIMARY KEY,
+  field             VARCHAR(50) NOT NULL,
+  name              VARCHAR(100),
+  op                VARCHAR(2),  -- 比較演算子（閾値スイープAPIで使用）
+  updated_at        TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- 既存環境向けマイグレーション
+ALTER TABLE screening_condition_bits ADD COLUMN IF NOT EXISTS op VARCHAR(2);
+
+-- RLS設定
+ALTER TABLE screening_condition_bits ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Public read access" ON screening_condition_bits FOR SELECT USING (true);
+
+-- 一括stale設定（データ取得失敗銘柄）
+-- review_reasonsに理由を重複なく追加し、実際に変更された行数を返す
+-- row_hashはクリアし、次回の財務バッチで必ず書き直されるようにする
+-- missing_maskは全条件のビット（判定できない。0だとPASSと区別できない）
+CREATE OR REPLACE FUNCTION mark_stale_bulk(p_codes TEXT[], p_reason TEXT)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  changed INTEGER;
+  all_bits INTEGER;
+BEGIN
+  -- 条件ビット未登録ならNULL（不明）
+  SELECT NULLIF((1 << COUNT(*)::INTEGER) - 1, 0) INTO all_bits FROM screening_condition_bits;
+
+  UPDATE screened_latest
+  SET
+    data_status = 'stale',
+    status = 'REVIEW',
+    row_hash = NULL,
+    fail_mask = 0,
+    missing_mask = all_bits,
+    review_reasons = CASE
+      WHEN COALESCE(review_reasons, '[]'::jsonb) @> jsonb_build_array(jsonb_build_object('code', p_reason))
+        THEN review_reasons
+      ELSE COALESCE(review_reasons, '[]'::jsonb)
+        || jsonb_build_array(jsonb_build_object('code', p_reason, 'message', p_reason))
+    END
+  WHERE company_code = ANY(p_codes)
+    AND (
+      data_status IS DISTINCT FROM 'stale'
+      OR status IS DISTINCT FROM 'REVIEW'
+      OR fail_mask IS DISTINCT FROM 0
+      OR missing_mask IS DISTINCT FROM all_bits
+      OR NOT COALESCE(review_reasons, '[]'::jsonb) @> jsonb_build_array(jsonb_build_object('code', p_reason))
+    );
+
+  GET DIAGNOSTICS changed = ROW_COUNT;
+  RETURN changed;
+END;
+$$;
+
+-- 財務データの確認時刻を一括更新（row_hashが同じで送信を省略した行も含む）
+-- 更新された行数を返す
+CREATE OR REPLACE FUNCTION touch_verified_bulk(p_codes TEXT[])
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  touched INTEGER;
+BEGIN
+  UPDATE screened_latest
+  SET verified_at = NOW()
+  WHERE company_code = ANY(p_codes);
+
+  GET DIAGNOSTICS touched = ROW_COUNT;
+  RETURN touched;
+END;
+$$;
+
+-- 株価・時価総額の一括更新
+-- p_rows: [{company_code, stock_price, market_cap, price_updated_at, data_status}, ...]
+-- market_capがnullの行は既存値を維持する
+-- 更新できた銘柄コードを返す
+CREATE OR REPLACE FUNCTION update_prices_bulk(p_rows JSONB)
+RETURNS TABLE(company_code VARCHAR)
+LANGUAGE sql
+AS $$
+  UPDATE screened_latest AS s
+  SET
+    stock_price = r.stock_price,
+    market_cap = COALESCE(r.market_cap, s.market_cap),
+    price_updated_at = COALESCE(r.price_updated_at, NOW()),
+    data_status = COALESCE(r.data_status, 'fresh')
+  FROM jsonb_to_recordset(p_rows) AS r(
+    company_code VARCHAR,
+    stock_price DECIMAL(15,2),
+    market_cap DECIMAL(15,2),
+    price_updated_at TIMESTAMP WITH TIME ZONE,
+    data_status VARCHAR
+  )
+  WHERE s.company_code = r.company_code
+  RETURNING s.company_code;
+$$;
+
 -- =============================================
 -- 四季報CSVインポート用テーブル（将来対応）
 -- =============================================
@@ -111,3 +237,206 @@ CREATE TABLE IF NOT EXISTS shikiho_estimates (
 -- RLS設定
 ALTER TABLE shikiho_estimates ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Public read access" ON shikiho_estimates FOR SELECT USING (true);
+
+-- =============================================
+-- バッチ実行ジャーナル（中断したバッチの再開用）
+-- =============================================
+CREATE TABLE IF NOT EXISTS batch_runs (
+  run_id            VARCHAR(40) PRIMARY KEY,
+  mode              VARCHAR(40) NOT NULL,
+  status            VARCHAR(20) NOT NULL DEFAULT 'running',
+  total_codes       INTEGER NOT NULL DEFAULT 0,
+  started_at        TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  finished_at       TIMESTAMP WITH TIME ZONE,
+
+  -- partial: 取得・書き込みに失敗した銘柄あり（--resume で再実行できる）
+  CONSTRAINT chk_run_status CHECK (status IN ('running', 'completed', 'partial', 'failed'))
+);
+
+-- 既存環境向けマイグレーション
+ALTER TABLE batch_runs DROP CONSTRAINT IF EXISTS chk_run_status;
+ALTER TABLE batch_runs ADD CONSTRAINT chk_run_status CHECK (status IN ('running', 'completed', 'partial', 'failed'));
+
+-- 銘柄ごとの進捗（pending → fetched → judged → written / failed）
+CREATE TABLE IF NOT EXISTS batch_run_items (
+  run_id            VARCHAR(40) NOT NULL REFERENCES batch_runs(run_id) ON DELETE CASCADE,
+  company_code      VARCHAR(10) NOT NULL,
+  stage             VARCHAR(10) NOT NULL DEFAULT 'pending',
+  updated_at        TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+  PRIMARY KEY (run_id, company_code),
+  CONSTRAINT chk_run_item_stage CHECK (stage IN ('pending', 'fetched', 'judged', 'written', 'failed'))
+);
+
+-- インデックス
+CREATE INDEX IF NOT EXISTS idx_run_items_stage ON batch_run_items(run_id, stage);
+
+-- RLS設定（サービスロールのみ）
+ALTER TABLE batch_runs ENABLE ROW LEVEL SECURITY;
+ALTER TABLE batch_run_items ENABLE ROW LEVEL SECURITY;
+
+-- =============================================
+-- スクリーニング履歴（追記専用・月次パーティション）
+-- =============================================
+-- 1銘柄1日1行。判定に使う指標と判定結果のみを固定長カラムで保持する
+-- （理由JSONBや売上・利益の生値は持たない）
+CREATE TABLE IF NOT EXISTS screened_history (
+  company_code          VARCHAR(10) NOT NULL,
+  snapshot_date         DATE NOT NULL,
+  status                VARCHAR(10) NOT NULL,
+  data_status           VARCHAR(20),
+
+  market_cap            DOUBLE PRECISION,
+  stock_price           DOUBLE PRECISION,
+  listing_date          DATE,
+
+  tk_deviation_revenue  DOUBLE PRECISION,
+  tk_deviation_op       DOUBLE PRECISION,
+  equity_ratio          DOUBLE PRECISION,
+  revenue_growth_2y_1y  DOUBLE PRECISION,
+  revenue_growth_1y_cy  DOUBLE PRECISION,
+  revenue_growth_cy_ny  DOUBLE PRECISION,
+  operating_margin      DOUBLE PRECISION,
+  op_growth_2y_1y       DOUBLE PRECISION,
+  op_growth_1y_cy       DOUBLE PRECISION,
+  op_growth_cy_ny       DOUBLE PRECISION,
+  operating_cf          DOUBLE PRECISION,
+  free_cf               DOUBLE PRECISION,
+  roa                   DOUBLE PRECISION,
+  per_forward           DOUBLE PRECISION,
+  pbr                   DOUBLE PRECISION,
+  dividend_yield        DOUBLE PRECISION,
+
+  recorded_at           TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+  PRIMARY KEY (company_code, snapshot_date)
+) PARTITION BY RANGE (snapshot_date);
+
+-- インデックス（各パーティションに作成される）
+CREATE INDEX IF NOT EXISTS idx_history_date_status ON screened_history(snapshot_date, status);
+
+-- RLS設定
+ALTER TABLE screened_history ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Public read access" ON screened_history FOR SELECT USING (true);
+
+-- 指定日を含む月のパーティションを作成
+-- DDLはテーブル所有者の権限が必要なためSECURITY DEFINERで実行し、バッチ（service_role）以外からは呼べなくする
+CREATE OR REPLACE FUNCTION ensure_history_partition(p_date DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  month_start DATE := date_trunc('month', p_date)::DATE;
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS %I PARTITION OF screened_history FOR VALUES FROM (%L) TO (%L)',
+    'screened_history_' || to_char(month_start, 'YYYYMM'),
+    month_start,
+    (month_start + INTERVAL '1 month')::DATE
+  );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION ensure_history_partition(DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ensure_history_partition(DATE) TO service_role;
+
+-- screened_latestの現在値を履歴に記録（同じ日に複数回実行した場合は最新で上書き）
+-- データはDB内でコピーするため、バッチからは銘柄コードのみ送る
+CREATE OR REPLACE FUNCTION append_screened_history(p_codes TEXT[], p_date DATE DEFAULT CURRENT_DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  written INTEGER;
+BEGIN
+  PERFORM ensure_history_partition(p_date);
+
+  INSERT INTO screened_history (
+    company_code, snapshot_date, status, data_status,
+    market_cap, stock_price, listing_date,
+    tk_deviation_revenue, tk_deviation_op, equity_ratio,
+    revenue_growth_2y_1y, revenue_growth_1y_cy, revenue_growth_cy_ny,
+    operating_margin, op_growth_2y_1y, op_growth_1y_cy, op_growth_cy_ny,
+    operating_cf, free_cf, roa, per_forward, pbr, dividend_yield
+  )
+  SELECT
+    company_code, p_date, status, data_status,
+    market_cap, stock_price, listing_date,
+    tk_deviation_revenue, tk_deviation_op, equity_ratio,
+    revenue_growth_2y_1y, revenue_growth_1y_cy, revenue_growth_cy_ny,
+    operating_margin, op_growth_2y_1y, op_growth_1y_cy, op_growth_cy_ny,
+    operating_cf, free_cf, roa, per_forward, pbr, dividend_yield
+  FROM screened_latest
+  WHERE company_code = ANY(p_codes)
+  ON CONFLICT (company_code, snapshot_date) DO UPDATE SET
+    status = EXCLUDED.status,
+    data_status = EXCLUDED.data_status,
+    market_cap = EXCLUDED.market_cap,
+    stock_price = EXCLUDED.stock_price,
+    listing_date = EXCLUDED.listing_date,
+    tk_deviation_revenue = EXCLUDED.tk_deviation_revenue,
+    tk_deviation_op = EXCLUDED.tk_deviation_op,
+    equity_ratio = EXCLUDED.equity_ratio,
+    revenue_growth_2y_1y = EXCLUDED.revenue_growth_2y_1y,
+    revenue_growth_1y_cy = EXCLUDED.revenue_growth_1y_cy,
+    revenue_growth_cy_ny = EXCLUDED.revenue_growth_cy_ny,
+    operating_margin = EXCLUDED.operating_margin,
+    op_growth_2y_1y = EXCLUDED.op_growth_2y_1y,
+    op_growth_1y_cy = EXCLUDED.op_growth_1y_cy,
+    op_growth_cy_ny = EXCLUDED.op_growth_cy_ny,
+    operating_cf = EXCLUDED.operating_cf,
+    free_cf = EXCLUDED.free_cf,
+    roa = EXCLUDED.roa,
+    per_forward = EXCLUDED.per_forward,
+    pbr = EXCLUDED.pbr,
+    dividend_yield = EXCLUDED.dividend_yield,
+    recorded_at = NOW();
+
+  GET DIAGNOSTICS written = ROW_COUNT;
+  RETURN written;
+END;
+$$;
+
+-- 指定日以降の判定変化（例: FAIL → PASS）
+-- p_to_status を指定するとその判定に変わったものだけ返す
+-- p_since以降のパーティションだけを走査し、各銘柄の最初の記録はp_since前の直近1件（主キーで引く）と比べる
+CREATE OR REPLACE FUNCTION status_transitions(p_since DATE, p_to_status TEXT DEFAULT NULL)
+RETURNS TABLE(company_code VARCHAR, changed_on DATE, from_status VARCHAR, to_status VARCHAR)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH ordered AS (
+    SELECT
+      h.company_code,
+      h.snapshot_date,
+      h.status,
+      LAG(h.status) OVER (PARTITION BY h.company_code ORDER BY h.snapshot_date) AS prev_status
+    FROM screened_history AS h
+    WHERE h.snapshot_date >= p_since
+  ),
+  changes AS (
+    SELECT
+      o.company_code,
+      o.snapshot_date,
+      COALESCE(o.prev_status, earlier.status) AS prev_status,
+      o.status
+    FROM ordered AS o
+    LEFT JOIN LATERAL (
+      SELECT b.status
+      FROM screened_history AS b
+      WHERE b.company_code = o.company_code
+        AND b.snapshot_date < p_since
+        AND o.prev_status IS NULL
+      ORDER BY b.snapshot_date DESC
+      LIMIT 1
+    ) AS earlier ON TRUE
+  )
+  SELECT c.company_code, c.snapshot_date, c.prev_status, c.status
+  FROM changes AS c
+  WHERE c.prev_status IS NOT NULL
+    AND c.prev_status <> c.status
+    AND (p_to_status IS NULL OR c.status = p_to_status)
+  ORDER BY c.snapshot_date, c.company_code;
+$$;